@@ -39,8 +39,9 @@ def assert_no_uncommitted_changes():
         raise SystemExit(1)
 
 def is_isolated_python_exists():
-    return path.exists(path.join("parts", "python", "bin",
-                                 "python{}".format('.exe' if is_windows() else '')))
+    from infi.projector.helper.utils import get_project_path
+    return path.exists(get_project_path("parts", "python", "bin",
+                                        "python{}".format('.exe' if is_windows() else '')))
 
 def assert_isolated_python_exists():
     if not is_isolated_python_exists():
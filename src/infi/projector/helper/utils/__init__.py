@@ -1,15 +1,27 @@
 from contextlib import contextmanager
 from logging import getLogger
+from threading import RLock
 import sys
 import re
 try:
     import configparser
 except ImportError:     # Python 2
     import ConfigParser as configparser
+try:
+    from contextvars import ContextVar
+except ImportError:     # Python < 3.7
+    ContextVar = None
 
 logger = getLogger(__name__)
 
+TEMPORARY_PREFIX = '.tmp-'
+# deprecated: plugins that append to this list still pass the parameters to every buildout, use
+# buildout_parameters_context() instead
 BUILDOUT_PARAMETERS = []
+INTERPRETERS = {}
+_IN_PROCESS_BUILDOUT_LOCK = RLock()
+INTERPRETERS_CACHE_FILENAME = 'interpreters.json'
+OUTPUT_TAIL_SIZE = 64 * 1024
 
 class PrettyExecutionError(Exception):
     # infi.execute.ExecutionError does print stdout and stderr well, and this is a must when running buildout
@@ -17,15 +29,84 @@ class PrettyExecutionError(Exception):
         encoding = getattr(sys.stdout, 'encoding', None) or 'utf-8'
         stdout = result.get_stdout()
         if stdout is not None:
-            stdout = stdout.decode(encoding)
+            stdout = stdout.decode(encoding, 'replace')
         stderr = result.get_stderr()
         if stderr is not None:
-            stderr = stderr.decode(encoding)
+            stderr = stderr.decode(encoding, 'replace')
         msg = "Execution of %r failed!\nresult=%s\nstdout=%s\nstderr=%s"
         msg = msg % (result._command, result.get_returncode(), stdout, stderr)
         super(PrettyExecutionError, self).__init__(msg)
         self.result = result
 
+class ExecutionContext(object):
+    # what commands run against: the project root (None is the current directory), the buildout parameters, extra
+    # environment variables and the build stage. contexts are immutable, execution_context() activates a changed copy
+    def __init__(self, project_root=None, buildout_parameters=(), env=None, stage=None):
+        super(ExecutionContext, self).__init__()
+        self.project_root = project_root
+        self.buildout_parameters = tuple(buildout_parameters)
+        self.env = dict(env or {})
+        self.stage = stage
+
+    def replace(self, **changes):
+        kwargs = dict(project_root=self.project_root, buildout_parameters=self.buildout_parameters,
+                      env=self.env, stage=self.stage)
+        kwargs.update(changes)
+        return ExecutionContext(**kwargs)
+
+    def get_path(self, *names):
+        from os import path
+        return path.join(self.project_root, *names) if self.project_root else path.join(*names)
+
+class _ThreadLocalVariable(object):
+    # the subset of contextvars.ContextVar we use, for Python versions that do not have it
+    def __init__(self, name, default):
+        from threading import local
+        super(_ThreadLocalVariable, self).__init__()
+        self.name = name
+        self._default = default
+        self._local = local()
+
+    def get(self):
+        return getattr(self._local, 'value', self._default)
+
+    def set(self, value):
+        token = self.get()
+        self._local.value = value
+        return token
+
+    def reset(self, token):
+        self._local.value = token
+
+_EXECUTION_CONTEXT = (ContextVar or _ThreadLocalVariable)('projector_execution_context', default=ExecutionContext())
+
+def get_execution_context():
+    return _EXECUTION_CONTEXT.get()
+
+@contextmanager
+def execution_context(**changes):
+    token = _EXECUTION_CONTEXT.set(get_execution_context().replace(**changes))
+    try:
+        yield get_execution_context()
+    finally:
+        _EXECUTION_CONTEXT.reset(token)
+
+@contextmanager
+def project_context(project_root):
+    from os.path import abspath
+    with execution_context(project_root=abspath(project_root)) as context:
+        yield context
+
+def get_project_path(*names):
+    return get_execution_context().get_path(*names)
+
+def get_environ(env=None):
+    from os import environ
+    result = environ.copy()
+    result.update(get_execution_context().env)
+    result.update(env or {})
+    return result
+
 def _chdir_and_log(path):
     from os import chdir
     chdir(path)
@@ -45,6 +126,7 @@ def chdir(path):
 
 @contextmanager
 def open_buildout_configfile(filepath="buildout.cfg", write_on_exit=False):
+    filepath = get_project_path(filepath)
     parser = configparser.ConfigParser()
     parser.optionxform = str    # make options case-sensitive
     parser.read(filepath)
@@ -56,6 +138,115 @@ def open_buildout_configfile(filepath="buildout.cfg", write_on_exit=False):
         with open(filepath, 'w') as fd:
             parser.write(fd)
 
+def get_cache_directory(*names):
+    from os import environ, path
+    root = environ.get("PROJECTOR_CACHE_DIR") or \
+        path.join(environ.get("XDG_CACHE_HOME") or path.expanduser(path.join("~", ".cache")), "projector")
+    dirpath = path.join(root, *names)
+    makedirs_if_necessary(dirpath)
+    return dirpath
+
+def makedirs_if_necessary(dirpath):
+    from os import makedirs, path
+    try:
+        makedirs(dirpath)
+    except OSError:
+        if not path.isdir(dirpath):
+            raise
+
+def link_or_copy_file(src, dst):
+    from os import link
+    from shutil import copy2
+    try:
+        link(src, dst)
+    except OSError:  # different filesystem, or links are not supported
+        copy2(src, dst)
+
+def _link_or_copy_symlink(src, dst):
+    # symbolic links are re-created as they are, e.g. lib64 -> lib, so they keep pointing into the tree
+    from os import readlink, symlink, path
+    try:
+        symlink(readlink(src), dst)
+    except (OSError, NotImplementedError, AttributeError):  # links are not supported, e.g. on Windows
+        if path.isdir(src):
+            link_tree(path.realpath(src), dst)
+        elif path.exists(src):
+            link_or_copy_file(path.realpath(src), dst)
+
+def link_tree(src, dst, should_copy=None):
+    """re-creates the tree with hard links to the files of src, so it costs metadata operations only. files for
+    which should_copy(relative path) is True are copied instead, e.g. files that are modified in place later"""
+    from os import path, walk
+    from shutil import copy2
+    if not path.isdir(src):
+        link_or_copy_file(src, dst)
+        return
+    for dirpath, dirnames, filenames in walk(src):
+        target_dirpath = path.join(dst, path.relpath(dirpath, src))
+        makedirs_if_necessary(target_dirpath)
+        for dirname in [dirname for dirname in dirnames if path.islink(path.join(dirpath, dirname))]:
+            _link_or_copy_symlink(path.join(dirpath, dirname), path.join(target_dirpath, dirname))
+        for filename in filenames:
+            source = path.join(dirpath, filename)
+            if path.islink(source):
+                _link_or_copy_symlink(source, path.join(target_dirpath, filename))
+            elif should_copy is not None and should_copy(path.relpath(source, src)):
+                copy2(source, path.join(target_dirpath, filename))
+            else:
+                link_or_copy_file(source, path.join(target_dirpath, filename))
+
+def link_tree_atomically(src, dst, replace=False, should_copy=None):
+    # link into a temporary sibling first, so a concurrent reader never sees a half-populated tree
+    from os import path, rename
+    from tempfile import mkdtemp
+    tempdir = mkdtemp(prefix=TEMPORARY_PREFIX, dir=path.dirname(path.abspath(dst)))
+    temp_dst = path.join(tempdir, path.basename(dst))
+    try:
+        link_tree(src, temp_dst, should_copy)
+        if replace and path.lexists(dst):
+            rename(dst, path.join(tempdir, TEMPORARY_PREFIX + path.basename(dst)))
+        try:
+            rename(temp_dst, dst)
+        except OSError:
+            if not path.exists(dst):
+                raise
+            logger.debug("{} was created by someone else".format(dst))
+    finally:
+        remove_tree_or_file(tempdir)
+
+def remove_tree_or_file(filepath):
+    from os import path, remove
+    from shutil import rmtree
+    if path.isdir(filepath) and not path.islink(filepath):
+        rmtree(filepath)
+    elif path.lexists(filepath):
+        remove(filepath)
+
+@contextmanager
+def file_lock(filepath):
+    # an exclusive advisory lock, held by at most one process on the host at a time
+    from os import name
+    with open(filepath, 'a') as fd:
+        if name == 'nt':
+            import msvcrt
+            fd.seek(0)
+            msvcrt.locking(fd.fileno(), msvcrt.LK_LOCK, 1)
+        else:
+            import fcntl
+            try:
+                fcntl.flock(fd.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except (IOError, OSError):
+                logger.info("Waiting for {}".format(filepath))
+                fcntl.flock(fd.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if name == 'nt':
+                fd.seek(0)
+                msvcrt.locking(fd.fileno(), msvcrt.LK_UNLCK, 1)
+            else:
+                fcntl.flock(fd.fileno(), fcntl.LOCK_UN)
+
 def is_running_inside_virtualenv():
     import sys
     from six import string_types
@@ -64,13 +255,109 @@ def is_running_inside_virtualenv():
 def parse_args(commandline_or_args):
     return commandline_or_args if isinstance(commandline_or_args, list) else commandline_or_args.split()
 
-def execute_assert_success(args, env=None):
-    from infi import execute
+@contextmanager
+def stage_context(name):
+    with execution_context(stage=name):
+        log_path = get_stage_log_path()
+        if log_path is not None:
+            # the log of a stage holds its last run only, so it does not grow and its tail is of this run
+            open(log_path, 'wb').close()
+        yield
+
+def get_stage_log_path():
+    # only the stages of devenv build are logged, other commands are not expected to write into the project
+    from os import path
+    context = get_execution_context()
+    if context.stage is None or not path.exists(context.get_path("buildout.cfg")):
+        return None
+    dirpath = context.get_path("parts", "projector", "logs")
+    makedirs_if_necessary(dirpath)
+    return path.join(dirpath, "{}.log".format(context.stage))
+
+def _write_to_console(stream, data):
+    stream = getattr(stream, 'buffer', stream)
+    try:
+        stream.write(data)
+    except TypeError:   # a text stream without a binary buffer, e.g. StringIO
+        stream.write(data.decode(getattr(stream, 'encoding', None) or 'utf-8', 'replace'))
+    stream.flush()
+
+class OutputTail(object):
+    # keeps only the last bytes written to it, so the memory used does not grow with the output
+    def __init__(self, size=None):
+        from collections import deque
+        super(OutputTail, self).__init__()
+        self.size = size or OUTPUT_TAIL_SIZE
+        self.chunks = deque()
+        self.length = 0
+
+    def write(self, data):
+        self.chunks.append(data)
+        self.length += len(data)
+        while self.length - len(self.chunks[0]) >= self.size:
+            self.length -= len(self.chunks.popleft())
+
+    def getvalue(self):
+        return b''.join(self.chunks)[-self.size:]
+
+class OutputRecorder(object):
+    # streams the output of a command to the console and to the log of the current stage, and keeps its tail
+    def __init__(self, command, consoles=None):
+        from threading import Lock
+        super(OutputRecorder, self).__init__()
+        self.consoles = consoles or dict(stdout=sys.stdout, stderr=sys.stderr)
+        self.tails = dict(stdout=OutputTail(), stderr=OutputTail())
+        self.lock = Lock()
+        log_path = get_stage_log_path()
+        self.log = open(log_path, 'ab') if log_path else None
+        if self.log is not None:
+            self.log.write('$ {}\n'.format(' '.join(command)).encode('utf-8'))
+
+    def write(self, name, data):
+        with self.lock:
+            self.tails[name].write(data)
+            _write_to_console(self.consoles[name], data)
+            if self.log is not None:
+                self.log.write(data)
+
+    def _read(self, name, fd):
+        from os import read
+        for data in iter(lambda: read(fd, 64 * 1024), b''):
+            self.write(name, data)
+
+    def start_reading(self, name, fd):
+        from threading import Thread
+        thread = Thread(target=self._read, args=(name, fd))
+        thread.daemon = True
+        thread.start()
+        return thread
+
+    def get_result(self, command, returncode):
+        return ExecutionResult(command, returncode, self.tails['stdout'].getvalue(), self.tails['stderr'].getvalue())
+
+    def close(self):
+        if self.log is not None:
+            self.log.close()
+
+def execute_assert_success(args, env=None, cwd=None):
+    from subprocess import Popen, PIPE
     logger.info("Executing {}".format(' '.join(args)))
-    result = execute.execute(args, env=env)
+    recorder = OutputRecorder(args)
+    try:
+        process = Popen(args, env=env if env is not None else get_environ(),
+                        cwd=cwd or get_execution_context().project_root, stdout=PIPE, stderr=PIPE)
+        threads = [recorder.start_reading('stdout', process.stdout.fileno()),
+                   recorder.start_reading('stderr', process.stderr.fileno())]
+        [thread.join() for thread in threads]
+        process.stdout.close()
+        process.stderr.close()
+        result = recorder.get_result(args, process.wait())
+    finally:
+        recorder.close()
     if result.get_returncode() is not None and result.get_returncode() != 0:
-        logger.error(result.get_stderr().decode())
+        logger.error(result.get_stderr().decode('utf-8', 'replace'))
         raise PrettyExecutionError(result)
+    return result
 
 def _get_executable_from_shebang_line():  # pragma: no cover
     # The executable wrapper in distribute dynamically loads Python's DLL, which causes sys.executable to be the wrapper
@@ -87,7 +374,74 @@ def _get_executable_from_shebang_line():  # pragma: no cover
     return (executable_path + '.exe') if not executable_path.endswith('.exe') else executable_path
 
 
-def get_python_interpreter():
+def _get_interpreters_cache_path():
+    from os import path
+    return path.join(get_cache_directory(), INTERPRETERS_CACHE_FILENAME)
+
+
+def _load_interpreters_cache():
+    import json
+    try:
+        with open(_get_interpreters_cache_path()) as fd:
+            return json.load(fd)
+    except (IOError, OSError, ValueError):
+        return dict()
+
+
+def _save_interpreters_cache(data):
+    import json
+    import os
+    filepath = _get_interpreters_cache_path()
+    temporary_path = '{}.{}{}'.format(filepath, TEMPORARY_PREFIX, os.getpid())
+    with open(temporary_path, 'w') as fd:
+        json.dump(data, fd, indent=4, sort_keys=True)
+    if os.name == 'nt' and os.path.exists(filepath):
+        os.remove(filepath)
+    os.rename(temporary_path, filepath)
+
+
+def _get_mtimes(paths):
+    import os
+    mtimes = []
+    for path in paths:
+        try:
+            mtimes.append(os.stat(path).st_mtime)
+        except OSError:
+            mtimes.append(None)
+    return mtimes
+
+
+def get_interpreter_fact(interpreter, name, compute, paths=()):
+    """returns a fact about an interpreter, e.g. whether it works with -S, computing it only when the interpreter
+    changes. the facts are kept in the host cache directory, keyed by the interpreter's path and mtime. a fact that
+    depends on other paths, e.g. the site-packages directories, is also computed again when their mtimes change"""
+    import os
+    key = os.path.abspath(interpreter)
+    try:
+        mtime = os.stat(key).st_mtime
+    except OSError:
+        return compute()
+    entry = INTERPRETERS.get(key)
+    if entry is None or entry.get('mtime') != mtime:
+        entry = _load_interpreters_cache().get(key)
+    if entry is None or entry.get('mtime') != mtime:
+        entry = dict(mtime=mtime)
+    INTERPRETERS[key] = entry
+    mtimes = _get_mtimes(paths)
+    if name not in entry or entry.get('{}:mtimes'.format(name), []) != mtimes:
+        entry[name] = compute()
+        if paths:
+            entry['{}:mtimes'.format(name)] = mtimes
+        data = _load_interpreters_cache()
+        data[key] = entry
+        try:
+            _save_interpreters_cache(data)
+        except (IOError, OSError) as error:
+            logger.debug("Failed to save {}: {}".format(_get_interpreters_cache_path(), error))
+    return entry[name]
+
+
+def _resolve_python_interpreter():
     import os
     import sys
     from ..assertions import is_windows
@@ -97,6 +451,47 @@ def get_python_interpreter():
         return os.path.join(sys.real_prefix, 'bin', 'python') if is_running_inside_virtualenv() else sys.executable
 
 
+def get_python_interpreter():
+    return get_interpreter_fact(sys.executable, 'interpreter', _resolve_python_interpreter)
+
+
+def get_site_packages(interpreter):
+    from subprocess import check_output
+    import json
+
+    def compute():
+        script = 'import json, site; print(json.dumps(getattr(site, "getsitepackages", lambda: [])()))'
+        return json.loads(check_output([interpreter, '-c', script]).decode())
+    return get_interpreter_fact(interpreter, 'site_packages', compute)
+
+
+def is_no_site_supported(interpreter):
+    """returns True if the interpreter can run `setup.py develop` with -S (without site-packages), i.e. it can import
+    setuptools, pkg_resources and the commands develop runs. the answer changes when packages are installed to or
+    removed from site-packages"""
+    from os import devnull
+    from subprocess import call, CalledProcessError
+    script = 'import setuptools, pkg_resources, setuptools.command.develop, setuptools.command.easy_install'
+
+    def probe():
+        with open(devnull, 'w') as null:
+            return call([interpreter, '-S', '-c', script], stdout=null, stderr=null) == 0
+    try:
+        site_packages = get_site_packages(interpreter)
+    except (CalledProcessError, OSError, ValueError):
+        site_packages = []
+    return get_interpreter_fact(interpreter, 'no_site_develop', probe, site_packages)
+
+
+def find_executable(filename, path=None):
+    import os
+    for dirpath in (path or os.environ.get('PATH', '')).split(os.pathsep):
+        filepath = os.path.join(dirpath, filename)
+        if os.path.isfile(filepath) and os.access(filepath, os.X_OK):
+            return filepath
+    return None
+
+
 def get_executable(filename):
     import os
     dirpath, basename = os.path.split(get_python_interpreter())
@@ -119,24 +514,16 @@ def execute_with_python(commandline_or_args):
     from ..assertions import is_windows
     args = parse_args(commandline_or_args)
     executable = [get_python_interpreter()]
-    if not is_running_inside_virtualenv():
+    if not is_running_inside_virtualenv() and is_no_site_supported(executable[0]):
         executable.append('-S')
-    try:
-        execute_assert_success(executable + args)
-    except PrettyExecutionError:
-        if '-S' not in executable:
-            raise
-        logger.warning("Command failed with -S, trying without")
-        executable.remove('-S')
-        execute_assert_success(executable + args)
+    execute_assert_success(executable + args)
 
 
 def get_isolated_executable(filename):
-    import os
     from ..assertions import is_windows
-    return os.path.join('parts', 'python',
-                        'Scripts' if is_windows() and 'python' not in filename else 'bin',
-                        '{}{}'.format(filename, '.exe' if is_windows() else ''))
+    return get_project_path('parts', 'python',
+                            'Scripts' if is_windows() and 'python' not in filename else 'bin',
+                            '{}{}'.format(filename, '.exe' if is_windows() else ''))
 
 
 def execute_with_isolated_python(commandline_or_args):
@@ -149,27 +536,184 @@ def execute_with_isolated_python(commandline_or_args):
             [executable] = os.path.abspath(executable[0])
     execute_assert_success(executable + args)
 
-def execute_with_buildout(commandline_or_args, env=None, stripped=True):
-    from os import name, path, environ
-    _env = environ.copy()
-    if env:
-        _env.update(env)
-    args = parse_args(commandline_or_args)
-    python = path.join('bin', 'python{}'.format('.exe' if name == 'nt' else ''))
-    buildout = path.join('bin', 'buildout{}'.format('.exe' if name == 'nt' else ''))
-    buildout_script = path.join('bin', 'buildout{}'.format('-script.py' if name == 'nt' else ''))
-    if path.exists(python) and not stripped:
-        execute_assert_success([python, buildout_script] + BUILDOUT_PARAMETERS + args, env=_env)
-    else:
-        execute_assert_success([buildout] + BUILDOUT_PARAMETERS + args, env=_env)
+class ExecutionResult(object):
+    # the subset of infi.execute's result that PrettyExecutionError uses, for commands that run in-process
+    def __init__(self, command, returncode, stdout, stderr):
+        super(ExecutionResult, self).__init__()
+        self._command = command
+        self._returncode = returncode
+        self._stdout = stdout
+        self._stderr = stderr
+
+    def get_returncode(self):
+        return self._returncode
+
+    def get_stdout(self):
+        return self._stdout
+
+    def get_stderr(self):
+        return self._stderr
+
+def is_running_on_isolated_python():
+    from os import path
+    isolated_python = path.realpath(get_project_path('parts', 'python'))
+    return path.realpath(sys.executable).startswith(isolated_python + path.sep)
 
 @contextmanager
-def buildout_parameters_context(parameters):
+def environ_context(env):
+    from os import environ
+    before = environ.copy()
+    environ.update(env or {})
     try:
-        [BUILDOUT_PARAMETERS.append(param) for param in parameters if param not in BUILDOUT_PARAMETERS]
         yield
     finally:
-        [BUILDOUT_PARAMETERS.remove(param) for param in parameters if param in BUILDOUT_PARAMETERS]
+        environ.clear()
+        environ.update(before)
+
+@contextmanager
+def captured_output_context(command):
+    """redirects stdout and stderr, of this process and its children, through an OutputRecorder, and yields it"""
+    from os import dup, dup2, close, pipe
+    from io import open as io_open
+    saved, threads = [], []
+    consoles = dict()
+    for name, stream in [('stdout', sys.stdout), ('stderr', sys.stderr)]:
+        stream.flush()
+        fd = dup(stream.fileno())
+        saved.append((stream, fd))
+        consoles[name] = io_open(fd, 'wb', buffering=0, closefd=False)
+    recorder = OutputRecorder(command, consoles)
+    try:
+        for name, stream in [('stdout', sys.stdout), ('stderr', sys.stderr)]:
+            read_fd, write_fd = pipe()
+            dup2(write_fd, stream.fileno())
+            close(write_fd)
+            threads.append((recorder.start_reading(name, read_fd), read_fd))
+        yield recorder
+    finally:
+        for stream, fd in saved:
+            stream.flush()
+            dup2(fd, stream.fileno())   # closes the write end of the pipe, so the reader gets EOF
+        for thread, read_fd in threads:
+            thread.join()
+            close(read_fd)
+        for stream, fd in saved:
+            close(fd)
+        recorder.close()
+
+def can_execute_buildout_in_process(args):
+    from os import environ, path, curdir
+    if environ.get('PROJECTOR_BUILDOUT_SUBPROCESS') or not is_running_on_isolated_python():
+        return False
+    if '-n' in args or args[-1:] == ['bootstrap']:
+        # upgrading buildout itself requires restarting bin/buildout
+        return False
+    project_root = get_execution_context().project_root
+    if project_root and path.realpath(project_root) != path.realpath(curdir):
+        return False    # recipes resolve relative paths against the current directory
+    try:
+        sys.stdout.fileno(), sys.stderr.fileno()
+    except (AttributeError, ValueError, IOError, OSError):
+        return False  # the output cannot be captured, e.g. it is already redirected in-process
+    try:
+        import zc.buildout.buildout
+    except ImportError:
+        return False
+    return True
+
+@contextmanager
+def buildout_module_state_context():
+    """buildout keeps the state of a run in modules: the versions it picked (which update-versions-file gets), the
+    package indexes, the recipe modules it imported and the working set. each in-process run starts without the
+    state of the previous ones, and the state of projector is restored when it is done"""
+    import logging
+    import pkg_resources
+    easy_install = sys.modules.get('zc.buildout.easy_install')
+    installer = getattr(easy_install, 'Installer', None)
+    saved_installer = {name: getattr(installer, name) for name in ('_picked_versions', '_required_by')
+                       if hasattr(installer, name)}
+    saved_indexes = getattr(easy_install, '_indexes', None)
+    saved_modules = set(sys.modules)
+    working_set = pkg_resources.working_set
+    saved_working_set = {name: (value.copy() if isinstance(value, (dict, list)) else value)
+                         for name, value in vars(working_set).items()}
+    shutdown = logging.shutdown
+    for name in saved_installer:
+        setattr(installer, name, {})
+    if saved_indexes is not None:
+        easy_install._indexes = {}
+    # main() shuts logging down when it is done, which would close the handlers of projector
+    logging.shutdown = lambda *args, **kwargs: None
+    try:
+        yield
+    finally:
+        logging.shutdown = shutdown
+        for name, value in saved_installer.items():
+            setattr(installer, name, value)
+        if saved_indexes is not None:
+            easy_install._indexes = saved_indexes
+        for name in set(sys.modules) - saved_modules:
+            del sys.modules[name]
+        vars(working_set).clear()
+        vars(working_set).update(saved_working_set)
+        pkg_resources.working_set = working_set
+
+def execute_buildout_in_process(args, env=None):
+    import logging
+    import zc.buildout.buildout
+    logger.info("Executing buildout {} in-process".format(' '.join(args)))
+    root_logger, buildout_logger = logging.getLogger(), logging.getLogger('zc.buildout')
+    saved_logging = [(item, item.handlers[:], item.level, item.propagate) for item in (root_logger, buildout_logger)]
+    saved_path = sys.path[:]
+    returncode = 0
+    # buildout changes process-wide state (environ, sys.path, logging, file descriptors), so one runs at a time
+    with _IN_PROCESS_BUILDOUT_LOCK:
+        try:
+            with environ_context(dict(get_execution_context().env, **(env or {}))), buildout_module_state_context(), \
+                    captured_output_context(['buildout'] + list(args)) as recorder:
+                try:
+                    zc.buildout.buildout.main(list(args))
+                except SystemExit as error:
+                    returncode = error.code if isinstance(error.code, int) else 1
+        finally:
+            sys.path[:] = saved_path
+            for item, handlers, level, propagate in saved_logging:
+                item.handlers[:] = handlers
+                item.setLevel(level)
+                item.propagate = propagate
+    result = recorder.get_result(['buildout'] + list(args), returncode)
+    if returncode != 0:
+        logger.error(result.get_stderr().decode('utf-8', 'replace'))
+        raise PrettyExecutionError(result)
+    return result
+
+def execute_with_buildout(commandline_or_args, env=None, stripped=True, in_process=True):
+    from os import name, path
+    _env = get_environ(env)
+    args = get_buildout_parameters() + parse_args(commandline_or_args)
+    python = get_project_path('bin', 'python{}'.format('.exe' if name == 'nt' else ''))
+    buildout = get_project_path('bin', 'buildout{}'.format('.exe' if name == 'nt' else ''))
+    buildout_script = get_project_path('bin', 'buildout{}'.format('-script.py' if name == 'nt' else ''))
+    if in_process and stripped and path.exists(buildout) and can_execute_buildout_in_process(args):
+        execute_buildout_in_process(args, env)
+    elif path.exists(python) and not stripped:
+        execute_assert_success([python, buildout_script] + args, env=_env)
+    else:
+        execute_assert_success([buildout] + args, env=_env)
+
+def get_buildout_parameters():
+    parameters = list(get_execution_context().buildout_parameters)
+    if BUILDOUT_PARAMETERS:
+        import warnings
+        warnings.warn("BUILDOUT_PARAMETERS is deprecated, use buildout_parameters_context()", DeprecationWarning)
+        parameters = [item for item in BUILDOUT_PARAMETERS if item not in parameters] + parameters
+    return parameters
+
+@contextmanager
+def buildout_parameters_context(parameters):
+    current = get_execution_context().buildout_parameters
+    with execution_context(buildout_parameters=current + tuple(param for param in parameters if param not in current)):
+        yield
 
 def _release_version_in_git(version_tag):
     from infi.execute import execute_assert_success
@@ -191,10 +735,11 @@ def git_checkout(branch_name_or_tag):
 
 def commit_changes_to_buildout(message):
     import os
+    from subprocess import call
     from infi.gitpy import LocalRepository
-    repository = LocalRepository(os.curdir)
+    repository = LocalRepository(get_project_path(os.curdir))
     # workaround https://github.com/msysgit/git/issues/79
-    os.system("git status")
+    call(["git", "status"], cwd=get_project_path(os.curdir))
     if "buildout.cfg" not in [modified_file.filename for modified_file in repository.getChangedFiles()]:
         return
     repository.add("buildout.cfg")
@@ -203,7 +748,7 @@ def commit_changes_to_buildout(message):
 def commit_changes_to_manifest_in(message):
     from os import curdir
     from infi.gitpy import LocalRepository
-    repository = LocalRepository(curdir)
+    repository = LocalRepository(get_project_path(curdir))
     repository.add("MANIFEST.in")
     repository.commit("MANIFEST.in: " + message)
 
@@ -253,8 +798,11 @@ def freeze_versions(versions_file, change_install_requires):
     dependencies = dict()
     with open_buildout_configfile(write_on_exit=True) as buildout_cfg:
         with open_buildout_configfile(versions_file) as versions_cfg:
-            if buildout_cfg.has_section("versions"):
-                buildout_cfg.remove_section("versions")
+            # the sections of an earlier freeze --matrix take precedence over [versions], so they must go too
+            for section in get_versions_sections(buildout_cfg):
+                if section != "versions":
+                    logger.info("Removing [{}], frozen by an earlier freeze --matrix".format(section))
+                buildout_cfg.remove_section(section)
             buildout_cfg.add_section("versions")
             for option in sorted(versions_cfg.options("versions"), key=lambda s: s.lower()):
                 dependencies[option] = versions_cfg.get("versions", option)
@@ -264,6 +812,54 @@ def freeze_versions(versions_file, change_install_requires):
         if change_install_requires:
                 set_freezed_versions_in_install_requires(buildout_cfg, versions_cfg)
 
+MATRIX_VERSIONS_SECTION_PREFIX = "versions-"
+
+def get_matrix_versions_section(key):
+    return MATRIX_VERSIONS_SECTION_PREFIX + key
+
+def get_versions_sections(buildout_cfg):
+    """returns the names of the sections with frozen versions: [versions] and the sections of freeze --matrix"""
+    return [section for section in buildout_cfg.sections()
+            if section == "versions" or section.startswith(MATRIX_VERSIONS_SECTION_PREFIX)]
+
+def _get_lowest_versions(versions_cfgs):
+    from pkg_resources import parse_version
+    lowest = {}
+    for versions_cfg in versions_cfgs:
+        for option in versions_cfg.options("versions"):
+            version = versions_cfg.get("versions", option)
+            if normalize(option) not in lowest or parse_version(version) < parse_version(lowest[normalize(option)][1]):
+                lowest[normalize(option)] = (option, version)
+    result = configparser.ConfigParser()
+    result.optionxform = str
+    result.add_section("versions")
+    for option, version in lowest.values():
+        result.set("versions", option, version)
+    return result
+
+def freeze_versions_matrix(versions_files, change_install_requires):
+    """versions_files is a dict {target key: versions file}. each target gets its own [versions-<key>] section,
+    [versions] is left as it is"""
+    with open_buildout_configfile(write_on_exit=True) as buildout_cfg:
+        for section in get_versions_sections(buildout_cfg):
+            if section != "versions":
+                buildout_cfg.remove_section(section)
+        specific_versions = get_dependencies_with_specific_versions(buildout_cfg)
+        versions_cfgs = []
+        for key, versions_file in sorted(versions_files.items()):
+            section = get_matrix_versions_section(key)
+            buildout_cfg.add_section(section)
+            with open_buildout_configfile(versions_file) as versions_cfg:
+                dependencies = {option: versions_cfg.get("versions", option)
+                                for option in versions_cfg.options("versions")}
+                versions_cfgs.append(versions_cfg)
+            dependencies.update(**specific_versions)
+            for option in sorted(dependencies, key=lambda s: s.lower()):
+                buildout_cfg.set(section, option, dependencies[option])
+        if change_install_requires:
+            # install_requires has to hold on all the targets
+            set_freezed_versions_in_install_requires(buildout_cfg, _get_lowest_versions(versions_cfgs))
+
 def unset_freezed_versions_in_install_requires(buildout_cfg):
     from .package_sets import InstallRequiresPackageSet, to_dict, from_dict
     install_requires = InstallRequiresPackageSet.from_value(buildout_cfg.get("project", "install_requires"))
@@ -296,7 +892,8 @@ def get_dependencies_with_specific_versions(buildout_cfg):
 
 def unfreeze_versions(change_install_requires):
     with open_buildout_configfile(write_on_exit=True) as buildout_cfg:
-        buildout_cfg.remove_section("versions")
+        for section in get_versions_sections(buildout_cfg):
+            buildout_cfg.remove_section(section)
 
         dependencies_that_need_to_remain_frozen = get_dependencies_with_specific_versions(buildout_cfg)
         if dependencies_that_need_to_remain_frozen:
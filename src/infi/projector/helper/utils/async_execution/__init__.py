@@ -0,0 +1,124 @@
+"""runs commands concurrently on asyncio, under one concurrency limit shared by the whole process (Python 3 only)"""
+from infi.projector.helper.utils import OutputRecorder, PrettyExecutionError, parse_args
+from infi.projector.helper.utils import get_environ, get_execution_context
+from logging import getLogger
+from threading import BoundedSemaphore, Lock
+import asyncio
+import os
+
+logger = getLogger(__name__)
+
+TIMEOUT_RETURNCODE = -9
+CHUNK_SIZE = 64 * 1024
+SLOT_POLL_INTERVAL = 0.05
+
+
+def get_default_limit():
+    jobs = os.environ.get('PROJECTOR_JOBS', '0')
+    if not jobs.isdigit():
+        logger.warning("PROJECTOR_JOBS expects a number of jobs, got {!r}, using the number of CPUs".format(jobs))
+        jobs = '0'
+    return int(jobs) or os.cpu_count() or 1
+
+
+class Scheduler(object):
+    def __init__(self, limit=None):
+        super(Scheduler, self).__init__()
+        self.limit = limit or get_default_limit()
+        # a threading semaphore, so the limit holds for the event loops of all the threads
+        self._slots = BoundedSemaphore(self.limit)
+
+    async def _acquire_slot(self):
+        # polling keeps the loop running the commands it already started, and holds nothing if cancelled
+        while not self._slots.acquire(False):
+            await asyncio.sleep(SLOT_POLL_INTERVAL)
+
+    async def execute(self, commandline_or_args, env=None, timeout=None, cwd=None):
+        args = parse_args(commandline_or_args)
+        await self._acquire_slot()
+        try:
+            logger.info("Executing {}".format(' '.join(args)))
+            process = await asyncio.create_subprocess_exec(*args, env=env if env is not None else get_environ(),
+                                                           cwd=cwd or get_execution_context().project_root,
+                                                           stdin=asyncio.subprocess.DEVNULL,
+                                                           stdout=asyncio.subprocess.PIPE,
+                                                           stderr=asyncio.subprocess.PIPE)
+            recorder = None
+            try:
+                recorder = OutputRecorder(args)
+                await asyncio.wait_for(asyncio.gather(self._read(recorder, 'stdout', process.stdout),
+                                                      self._read(recorder, 'stderr', process.stderr),
+                                                      process.wait()), timeout)
+                result = recorder.get_result(args, process.returncode)
+            except asyncio.TimeoutError:
+                recorder.write('stderr', 'Timed out after {} seconds\n'.format(timeout).encode())
+                result = recorder.get_result(args, TIMEOUT_RETURNCODE)
+            finally:
+                if process.returncode is None:  # timed out or cancelled
+                    process.kill()
+                    await process.wait()
+                if recorder is not None:
+                    recorder.close()
+        finally:
+            self._slots.release()
+        if result.get_returncode() != 0:
+            logger.error(result.get_stderr().decode('utf-8', 'replace'))
+            raise PrettyExecutionError(result)
+        return result
+
+    async def _read(self, recorder, name, stream):
+        while True:
+            data = await stream.read(CHUNK_SIZE)
+            if not data:
+                return
+            recorder.write(name, data)
+
+    async def gather(self, *awaitables):
+        """like asyncio.gather, but the first failure cancels the siblings that are still running"""
+        tasks = [asyncio.ensure_future(awaitable) for awaitable in awaitables]
+        if not tasks:
+            return []
+        try:
+            await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+            await asyncio.wait(tasks)
+        for task in tasks:
+            if not task.cancelled() and task.exception() is not None:
+                raise task.exception()
+        return [task.result() for task in tasks]
+
+    def run(self, coroutine):
+        loop = asyncio.new_event_loop()
+        try:
+            return loop.run_until_complete(coroutine)
+        finally:
+            loop.close()
+
+
+_SCHEDULER = None
+_SCHEDULER_LOCK = Lock()
+
+
+def get_scheduler():
+    """returns the Scheduler of the process, created on first use"""
+    global _SCHEDULER
+    with _SCHEDULER_LOCK:
+        if _SCHEDULER is None:
+            _SCHEDULER = Scheduler()
+        return _SCHEDULER
+
+
+async def execute_assert_success_async(commandline_or_args, env=None, timeout=None, cwd=None):
+    return await get_scheduler().execute(commandline_or_args, env=env, timeout=timeout, cwd=cwd)
+
+
+def run_parallel(commands, env=None, timeout=None):
+    """executes the commands concurrently, and returns their results in order. the first failure stops the rest"""
+    scheduler = get_scheduler()
+
+    async def _run():
+        return await scheduler.gather(*[scheduler.execute(command, env=env, timeout=timeout) for command in commands])
+    return scheduler.run(_run())
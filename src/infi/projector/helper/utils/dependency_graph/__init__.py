@@ -0,0 +1,171 @@
+"""the dependency graph of the project, built from the metadata in the installed distributions index"""
+from infi.projector.helper.utils import open_buildout_configfile
+from collections import deque
+import json
+
+MISSING = '(not installed)'
+
+
+def _get_marker_class():
+    try:
+        from packaging.markers import Marker
+    except ImportError:
+        from pkg_resources.extern.packaging.markers import Marker
+    return Marker
+
+
+class MarkerEvaluator(object):
+    """evaluates environment markers against this interpreter; each (marker, extra) is evaluated once"""
+    def __init__(self, environment=None):
+        super(MarkerEvaluator, self).__init__()
+        self.marker_class = _get_marker_class()
+        self.environment = environment or {}
+        self._markers = {}
+        self._results = {}
+
+    def evaluate(self, marker, extra=''):
+        if not marker:
+            return True
+        key = (marker, extra)
+        if key not in self._results:
+            if marker not in self._markers:
+                self._markers[marker] = self.marker_class(marker)
+            self._results[key] = self._markers[marker].evaluate(dict(self.environment, extra=extra))
+        return self._results[key]
+
+    def applies(self, requires, extras):
+        """True if requires (from the installed index) is a requirement when the given extras are requested"""
+        if requires.extra and requires.extra not in extras:
+            return False
+        return any(self.evaluate(requires.marker, extra) for extra in ('', ) + tuple(extras))
+
+
+class Node(object):
+    def __init__(self, key, name, version=None, location=None, id=None, missing=False):
+        super(Node, self).__init__()
+        self.id = id            # in the installed index
+        self.missing = missing
+        self.key = key
+        self.name = name
+        self.version = version
+        self.location = location
+        self.children = []      # 2-tuples (requirement text, key)
+        self.parents = []       # 2-tuples (requirement text, key)
+
+    def __str__(self):
+        if self.missing:
+            return '{} {}'.format(self.name, MISSING)
+        return '{}=={}'.format(self.name, self.version) if self.version else self.name
+
+
+class DependencyGraph(object):
+    def __init__(self, project_name):
+        super(DependencyGraph, self).__init__()
+        self.root = Node(project_name.lower(), project_name)
+        self.nodes = {self.root.key: self.root}
+
+    def add_edge(self, parent, requirement, child):
+        if (requirement, child.key) not in parent.children:
+            parent.children.append((requirement, child.key))
+            child.parents.append((requirement, parent.key))
+
+    def find(self, name):
+        from pkg_resources import safe_name
+        return self.nodes.get(safe_name(name).lower())
+
+    def _format(self, node, edges, lines, prefix, requirement, seen):
+        label = str(node) if requirement is None else '{} [requires: {}]'.format(node, requirement)
+        lines.append(prefix + label + (' (*)' if node.key in seen and getattr(node, edges) else ''))
+        if node.key in seen:
+            return
+        seen.add(node.key)
+        for requirement, key in getattr(node, edges):
+            self._format(self.nodes[key], edges, lines, prefix + '    ', requirement, seen)
+
+    def format_tree(self):
+        """the dependency tree; a subtree is printed once, later occurrences are marked with (*)"""
+        lines = []
+        self._format(self.root, 'children', lines, '', None, set())
+        return '\n'.join(lines)
+
+    def format_reverse_tree(self, name):
+        """the paths from the project to name, upwards"""
+        node = self.find(name)
+        if node is None:
+            return None
+        lines = []
+        self._format(node, 'parents', lines, '', None, set())
+        return '\n'.join(lines)
+
+    def to_json(self):
+        nodes = [dict(name=node.name, version=node.version, location=node.location, missing=node.missing)
+                 for key, node in sorted(self.nodes.items())]
+        edges = [{'from': node.name, 'to': self.nodes[key].name, 'requirement': requirement}
+                 for _, node in sorted(self.nodes.items()) for requirement, key in node.children]
+        return json.dumps(dict(root=self.root.name, nodes=nodes, edges=edges), indent=4)
+
+    def to_dot(self):
+        lines = ['digraph dependencies {']
+        for key, node in sorted(self.nodes.items()):
+            lines.append('    "{}" [label="{}"{}];'.format(key, node, ', style=dashed' if node.missing else ''))
+        for _, node in sorted(self.nodes.items()):
+            for requirement, key in node.children:
+                lines.append('    "{}" -> "{}" [label="{}"];'.format(node.key, key, requirement.replace('"', '\\"')))
+        lines.append('}')
+        return '\n'.join(lines)
+
+
+def _pick(candidates, requirement, pinned):
+    matching = [dist for dist in candidates if requirement is None or dist.version in requirement]
+    matching = [dist for dist in matching if dist.version == pinned] or matching
+    return max(matching or candidates, key=lambda dist: _parse_version(dist.version))
+
+
+def _parse_version(version):
+    from pkg_resources import parse_version
+    return parse_version(version)
+
+
+def build_dependency_graph(index, evaluator=None):
+    """returns the DependencyGraph of the project's install_requires and development eggs"""
+    from infi.projector.helper.utils.resolver import read_root_requirements, parse_root_requirements
+    from pkg_resources import Requirement, safe_name
+    evaluator = evaluator or MarkerEvaluator()
+    with open_buildout_configfile() as buildout:
+        root_requirements = read_root_requirements(buildout, with_recipes=False)
+        pinned = {safe_name(key).lower(): value for key, value in buildout.items("versions")} \
+            if buildout.has_section("versions") else {}
+    roots = parse_root_requirements(*root_requirements)
+    graph = DependencyGraph(root_requirements[0])
+    distributions = {}
+    for dist in index.get_distributions():
+        distributions.setdefault(dist.key, []).append(dist)
+    all_requires = index.get_all_requires()
+    requirements = {}
+
+    def parse(text):
+        if text not in requirements:
+            requirements[text] = Requirement.parse(text)
+        return requirements[text]
+    queue = deque((graph.root, str(requirement), requirement) for requirement, _ in roots)
+    expanded = set()
+    while queue:
+        parent, text, requirement = queue.popleft()
+        node = graph.nodes.get(requirement.key)
+        if node is None:
+            candidates = distributions.get(requirement.key)
+            if candidates:
+                dist = _pick(candidates, requirement, pinned.get(requirement.key))
+                node = Node(dist.key, dist.name, dist.version, dist.location, dist.id)
+            else:
+                node = Node(requirement.key, requirement.project_name, missing=True)
+            graph.nodes[node.key] = node
+        graph.add_edge(parent, text, node)
+        extras = tuple(sorted(requirement.extras))
+        if not node.version or (node.key, extras) in expanded:
+            continue
+        expanded.add((node.key, extras))
+        for requires in all_requires.get(node.id, []):
+            if evaluator.applies(requires, extras):
+                queue.append((node, requires.requirement, parse(requires.requirement)))
+    return graph
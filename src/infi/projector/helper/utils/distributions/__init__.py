@@ -0,0 +1,201 @@
+from infi.projector.helper.utils import normalize
+import os
+import re
+
+SDIST_EXTENSIONS = ['.tar.gz', '.tar.bz2', '.tgz', '.zip']
+
+
+def parse_filename(basename):
+    """returns a 2-tuple (project_name, version) of a distribution file name, or None if it is not one"""
+    if basename.endswith('.whl'):
+        parts = basename[:-len('.whl')].split('-')
+        if len(parts) not in (5, 6):
+            return None
+        return parts[0], parts[1]
+    if basename.endswith('.egg'):
+        parts = basename[:-len('.egg')].split('-')
+        if len(parts) < 2:
+            return None
+        return parts[0], parts[1]
+    for extension in SDIST_EXTENSIONS:
+        if basename.endswith(extension):
+            parts = basename[:-len(extension)].split('-')
+            for index, part in enumerate(parts[1:], 1):
+                if part[:1].isdigit():
+                    return '-'.join(parts[:index]), '-'.join(parts[index:])
+            return None
+    return None
+
+
+def iter_distribution_files(dirpath):
+    """yields 3-tuples (filepath, project_name, version) of the distribution files in a directory"""
+    if not os.path.isdir(dirpath):
+        return
+    for basename in sorted(os.listdir(dirpath)):
+        parsed = parse_filename(basename)
+        if parsed is not None:
+            yield os.path.join(dirpath, basename), parsed[0], parsed[1]
+
+
+def get_available_versions(dirpath):
+    return set((normalize(project_name), version) for _, project_name, version in iter_distribution_files(dirpath))
+
+
+class MetadataError(Exception):
+    pass
+
+
+class ArchiveMetadata(object):
+    """a pkg_resources metadata provider of metadata files that were read out of an archive"""
+    def __init__(self, files):
+        super(ArchiveMetadata, self).__init__()
+        self.files = files
+
+    def has_metadata(self, name):
+        return name in self.files
+
+    def get_metadata(self, name):
+        return self.files[name]
+
+    def get_metadata_lines(self, name):
+        from pkg_resources import yield_lines
+        return yield_lines(self.get_metadata(name))
+
+    def metadata_isdir(self, name):
+        return False
+
+    def metadata_listdir(self, name):
+        return []
+
+
+def _read_archive_members(filepath, predicate):
+    """returns a dict of {member name: text} of the archive members that match predicate"""
+    import tarfile
+    import zipfile
+    members = {}
+    if zipfile.is_zipfile(filepath):
+        with zipfile.ZipFile(filepath) as archive:
+            for name in archive.namelist():
+                if predicate(name):
+                    members[name] = archive.read(name).decode('utf-8', 'replace')
+        return members
+    with tarfile.open(filepath) as archive:
+        for member in archive:
+            if member.isfile() and predicate(member.name):
+                members[member.name] = archive.extractfile(member).read().decode('utf-8', 'replace')
+    return members
+
+
+def _get_wheel_distribution(filepath, project_name, version):
+    from pkg_resources import DistInfoDistribution, BINARY_DIST
+    members = _read_archive_members(filepath, lambda name: name.count('/') == 1 and
+                                    name.split('/')[0].endswith('.dist-info'))
+    files = {name.split('/')[1]: content for name, content in members.items()}
+    if 'METADATA' not in files:
+        raise MetadataError("{} has no METADATA".format(filepath))
+    return DistInfoDistribution(filepath, project_name=project_name, version=version,
+                                metadata=ArchiveMetadata(files), precedence=BINARY_DIST)
+
+
+def _get_zipped_egg_distribution(filepath, project_name, version):
+    from pkg_resources import Distribution, EGG_DIST
+    prefix = 'EGG-INFO/'
+    files = {name[len(prefix):]: content for name, content in
+             _read_archive_members(filepath, lambda name: name.startswith(prefix)).items()}
+    return Distribution(filepath, project_name=project_name, version=version,
+                        metadata=ArchiveMetadata(files), precedence=EGG_DIST)
+
+
+def _get_sdist_distribution(filepath, project_name, version):
+    # setuptools puts the egg-info directory in the sdist. without it, only metadata 2.2 declares static requirements
+    from pkg_resources import Distribution, DistInfoDistribution, SOURCE_DIST
+
+    def is_metadata(name):
+        parts = name.split('/')
+        return (len(parts) == 2 and parts[1] == 'PKG-INFO') or \
+            (len(parts) in (3, 4) and parts[-2].endswith('.egg-info'))
+    members = _read_archive_members(filepath, is_metadata)
+    egg_info = {name.split('/')[-1]: content for name, content in members.items() if '.egg-info/' in name}
+    if egg_info:
+        return Distribution(filepath, project_name=project_name, version=version,
+                            metadata=ArchiveMetadata(egg_info), precedence=SOURCE_DIST)
+    pkg_info = next((content for name, content in members.items() if name.count('/') == 1), '')
+    metadata_version = re.search(r'^Metadata-Version:\s*(\d+)\.(\d+)', pkg_info, re.MULTILINE)
+    if metadata_version is None or tuple(int(item) for item in metadata_version.groups()) < (2, 2) or \
+            re.search(r'^Dynamic:\s*Requires-Dist', pkg_info, re.MULTILINE | re.IGNORECASE):
+        raise MetadataError("{} does not declare its requirements statically".format(filepath))
+    return DistInfoDistribution(filepath, project_name=project_name, version=version,
+                                metadata=ArchiveMetadata({'METADATA': pkg_info}), precedence=SOURCE_DIST)
+
+
+def _get_develop_distribution(filepath):
+    from pkg_resources import Distribution, PathMetadata, DEVELOP_DIST
+    with open(filepath) as fd:
+        lines = fd.read().splitlines()
+    location = os.path.join(os.path.dirname(filepath), lines[0].strip()) if lines else ''
+    egg_infos = [basename for basename in sorted(os.listdir(location)) if basename.endswith('.egg-info')] \
+        if os.path.isdir(location) else []
+    if not egg_infos:
+        raise MetadataError("{} points to {}, which has no egg-info".format(filepath, location))
+    egg_info = os.path.join(location, egg_infos[0])
+    return Distribution.from_location(location, egg_infos[0], PathMetadata(location, egg_info),
+                                      precedence=DEVELOP_DIST)
+
+
+def get_distribution(filepath):
+    """returns a pkg_resources Distribution with the metadata of a distribution file, an installed egg,
+    a dist-info/egg-info directory or a develop egg-link, without installing or importing it"""
+    from pkg_resources import Distribution, PathMetadata
+    basename = os.path.basename(filepath)
+    try:
+        if basename.endswith('.egg-link'):
+            return _get_develop_distribution(filepath)
+        if basename.endswith(('.dist-info', '.egg-info')):
+            dirname = os.path.dirname(filepath)
+            if os.path.isdir(filepath):
+                metadata = PathMetadata(dirname, filepath)
+            else:
+                with open(filepath) as fd:
+                    metadata = ArchiveMetadata({'PKG-INFO': fd.read()})
+            dist = Distribution.from_location(dirname, basename, metadata)
+            # the version of an installed distribution is read lazily, so a missing or broken one fails here
+            dist.version
+            return dist
+        parsed = parse_filename(basename)
+        if parsed is None:
+            raise MetadataError("{} is not a distribution".format(filepath))
+        if basename.endswith('.whl'):
+            return _get_wheel_distribution(filepath, *parsed)
+        if basename.endswith('.egg') and os.path.isdir(filepath):
+            return Distribution.from_filename(filepath, metadata=PathMetadata(filepath,
+                                                                            os.path.join(filepath, 'EGG-INFO')))
+        if basename.endswith('.egg'):
+            return _get_zipped_egg_distribution(filepath, *parsed)
+        return _get_sdist_distribution(filepath, *parsed)
+    except MetadataError:
+        raise
+    except Exception as error:
+        raise MetadataError("Failed to read the metadata of {}: {}".format(filepath, error))
+
+
+def iter_requires(dist):
+    """yields 4-tuples (requirement, key, marker, extra) of the requirements of dist, with their markers unevaluated.
+    requirement has no marker, extra is the name of the extra feature (empty for the base requirements)"""
+    from pkg_resources import Requirement, split_sections
+    from email.parser import Parser
+    if dist.has_metadata('METADATA'):
+        sections = [(None, Parser().parsestr(dist.get_metadata('METADATA')).get_all('Requires-Dist') or [])]
+    elif dist.has_metadata('requires.txt'):
+        sections = split_sections(dist.get_metadata_lines('requires.txt'))
+    else:
+        sections = []
+    for section, lines in sections:
+        extra, _, section_marker = (section or '').partition(':')
+        section_marker = Requirement.parse('marker; ' + section_marker).marker if section_marker else None
+        for line in lines:
+            requirement = Requirement.parse(line)
+            markers = [str(marker) for marker in (requirement.marker, section_marker) if marker]
+            marker = ' and '.join('({})'.format(item) for item in markers) if len(markers) > 1 else ''.join(markers)
+            text = requirement.project_name + ('[{}]'.format(','.join(sorted(requirement.extras)))
+                                               if requirement.extras else '') + str(requirement.specifier)
+            yield text, requirement.key, marker, extra
@@ -0,0 +1,222 @@
+from six.moves.urllib.parse import urlparse, unquote
+from six.moves.urllib.request import urlopen, Request
+from functools import partial
+from logging import getLogger
+import hashlib
+import os
+
+logger = getLogger(__name__)
+
+CHUNK_SIZE = 1024 * 1024
+PARTIAL_SUFFIX = '.part'
+
+
+class DownloadError(Exception):
+    pass
+
+
+def _open_ftp(url, offset):
+    from ftplib import FTP
+    parsed = urlparse(url)
+    ftp = FTP()
+    ftp.connect(parsed.hostname, parsed.port or 21)
+    ftp.login(unquote(parsed.username or 'anonymous'), unquote(parsed.password or ''))
+    ftp.voidcmd('TYPE I')
+    connection = ftp.transfercmd('RETR {}'.format(unquote(parsed.path)), rest=offset or None)
+    fileobj = connection.makefile('rb')
+
+    def close():
+        fileobj.close()
+        connection.close()
+        try:
+            ftp.quit()
+        except Exception:  # the server may complain that the transfer was aborted
+            ftp.close()
+    return fileobj, offset, close
+
+
+def _open_http(url, offset):
+    from six.moves.urllib.error import HTTPError
+    from io import BytesIO
+    request = Request(url)
+    if offset:
+        request.add_header('Range', 'bytes={}-'.format(offset))
+    try:
+        response = urlopen(request)
+    except HTTPError as error:
+        if error.code != 416 or not offset:
+            raise
+        # the partial file is complete, or it is not a prefix of this file: the digest tells
+        error.close()
+        logger.debug("{} has nothing after byte {}".format(url, offset))
+        return BytesIO(), offset, lambda: None
+    if offset and response.getcode() != 206:
+        logger.debug("{} does not support resuming downloads, starting over".format(url))
+        offset = 0
+    return response, offset, response.close
+
+
+def _open_file(url, offset):
+    fileobj = open(unquote(urlparse(url).path), 'rb')
+    fileobj.seek(offset)
+    return fileobj, offset, fileobj.close
+
+
+def open_url(url, offset=0):
+    """returns a 3-tuple (fileobj, offset, close) for reading url starting at offset, as close as the server allows"""
+    scheme = urlparse(url).scheme
+    if scheme == 'ftp':
+        return _open_ftp(url, offset)
+    if scheme in ('http', 'https'):
+        return _open_http(url, offset)
+    if scheme in ('file', ''):
+        return _open_file(url, offset)
+    raise DownloadError("Unsupported URL {}".format(url))
+
+
+class HashingReader(object):
+    """a file-like object that hashes everything that is read through it"""
+    def __init__(self, fileobj, algorithm='sha256'):
+        super(HashingReader, self).__init__()
+        self.fileobj = fileobj
+        self.hash = hashlib.new(algorithm)
+        self.size = 0
+
+    def _read(self, size):
+        return self.fileobj.read(size)
+
+    def read(self, size=-1):
+        data = self._read(CHUNK_SIZE if size is None or size < 0 else size)
+        self.hash.update(data)
+        self.size += len(data)
+        return data
+
+    def read_to_end(self):
+        while self.read(CHUNK_SIZE):
+            pass
+
+    def hexdigest(self):
+        return self.hash.hexdigest()
+
+    def close(self):
+        self.fileobj.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args, **kwargs):
+        self.close()
+
+
+class ResumableDownload(HashingReader):
+    """a file-like object that reads url and saves it to a partial file, resuming where a previous attempt stopped"""
+    def __init__(self, url, partial_path, algorithm='sha256'):
+        offset = os.path.getsize(partial_path) if os.path.exists(partial_path) else 0
+        super(ResumableDownload, self).__init__(open(partial_path, 'a+b'), algorithm)
+        self.url = url
+        self.partial_path = partial_path
+        self._remote, remote_offset, self._close_remote = open_url(url, offset)
+        self.offset = remote_offset
+        if remote_offset != offset:
+            self.fileobj.truncate(remote_offset)
+        elif offset:
+            logger.debug("Resuming download of {} from byte {}".format(url, offset))
+        self.fileobj.seek(0)
+        self._reading_partial = remote_offset > 0
+
+    def _read(self, size):
+        data = b''
+        if self._reading_partial:
+            data = self.fileobj.read(size)
+            if not data:
+                self._reading_partial = False
+                self.fileobj.seek(0, os.SEEK_END)
+        if not data:
+            data = self._remote.read(size)
+            self.fileobj.write(data)
+        return data
+
+    def close(self):
+        self._close_remote()
+        super(ResumableDownload, self).close()
+
+
+def get_file_hexdigest(filepath, algorithm='sha256'):
+    digest = hashlib.new(algorithm)
+    with open(filepath, 'rb') as fd:
+        for chunk in iter(lambda: fd.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def fetch_expected_hexdigest(url, algorithm='sha256'):
+    """returns the digest published next to url (e.g. url.sha256), or None if there isn't one"""
+    try:
+        fileobj, _, close = open_url('{}.{}'.format(url, algorithm))
+    except Exception as error:
+        logger.debug("No {} digest found for {}: {}".format(algorithm, url, error))
+        return None
+    try:
+        content = fileobj.read().decode('ascii', 'replace').split()
+    finally:
+        close()
+    return content[0].lower() if content else None
+
+
+HASHES_CACHE_FILENAME = 'hashes.json'
+
+
+def _get_hashes_cache_path(algorithm):
+    from infi.projector.helper.utils import get_cache_directory
+    return os.path.join(get_cache_directory(), '{}-{}'.format(algorithm, HASHES_CACHE_FILENAME))
+
+
+def _load_hashes_cache(algorithm):
+    import json
+    try:
+        with open(_get_hashes_cache_path(algorithm)) as fd:
+            return json.load(fd)
+    except (IOError, OSError, ValueError):
+        return {}
+
+
+def _save_hashes_cache(algorithm, data):
+    from infi.projector.helper.utils import TEMPORARY_PREFIX
+    import json
+    filepath = _get_hashes_cache_path(algorithm)
+    temporary_path = '{}.{}{}'.format(filepath, TEMPORARY_PREFIX, os.getpid())
+    with open(temporary_path, 'w') as fd:
+        json.dump(data, fd, indent=4, sort_keys=True)
+    if os.name == 'nt' and os.path.exists(filepath):
+        os.remove(filepath)
+    os.rename(temporary_path, filepath)
+
+
+def get_file_hexdigests(filepaths, algorithm='sha256', processes=None):
+    """returns a dict {filepath: digest}. digests are cached by (path, size, mtime), the rest are computed in a
+    process pool"""
+    cache = _load_hashes_cache(algorithm)
+    keys = {}
+    for filepath in filepaths:
+        stat = os.stat(filepath)
+        keys[filepath] = '{}:{}:{}'.format(os.path.abspath(filepath), stat.st_size, stat.st_mtime)
+    missing = sorted(filepath for filepath, key in keys.items() if key not in cache)
+    compute = partial(get_file_hexdigest, algorithm=algorithm)
+    if len(missing) > 1:
+        from multiprocessing import Pool, cpu_count
+        pool = Pool(min(processes or cpu_count(), len(missing)))
+        try:
+            digests = pool.map(compute, missing)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        digests = [compute(filepath) for filepath in missing]
+    if missing:
+        # forget the digests of files that were replaced or removed
+        replaced = set(os.path.abspath(filepath) for filepath in missing)
+        cache = {key: value for key, value in cache.items()
+                 if key.rsplit(':', 2)[0] not in replaced and os.path.exists(key.rsplit(':', 2)[0])}
+        cache.update((keys[filepath], digest) for filepath, digest in zip(missing, digests))
+        _save_hashes_cache(algorithm, cache)
+    return {filepath: cache[key] for filepath, key in keys.items()}
@@ -0,0 +1,202 @@
+"""an SQLite index of the distributions installed in the project: eggs, develop eggs and the isolated python"""
+from infi.projector.helper.utils import open_buildout_configfile, configparser, get_project_path
+from infi.projector.helper.utils import makedirs_if_necessary
+from infi.projector.helper.utils.distributions import get_distribution, iter_requires, MetadataError
+from contextlib import contextmanager
+from collections import namedtuple
+from logging import getLogger
+import os
+
+logger = getLogger(__name__)
+
+INDEX_FILENAME = 'installed.sqlite'
+SCHEMA_VERSION = 1
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS directories (path TEXT PRIMARY KEY, kind TEXT, mtime REAL);
+CREATE TABLE IF NOT EXISTS distributions (id INTEGER PRIMARY KEY, directory TEXT, basename TEXT, mtime REAL,
+                                          name TEXT, key TEXT, version TEXT, location TEXT, kind TEXT);
+CREATE INDEX IF NOT EXISTS distributions_by_key ON distributions (key);
+CREATE INDEX IF NOT EXISTS distributions_by_directory ON distributions (directory);
+CREATE TABLE IF NOT EXISTS requires (distribution INTEGER, requirement TEXT, key TEXT, marker TEXT, extra TEXT);
+CREATE INDEX IF NOT EXISTS requires_by_distribution ON requires (distribution);
+CREATE INDEX IF NOT EXISTS requires_by_key ON requires (key);
+CREATE TABLE IF NOT EXISTS entry_points (distribution INTEGER, "group" TEXT, name TEXT, value TEXT);
+CREATE INDEX IF NOT EXISTS entry_points_by_distribution ON entry_points (distribution);
+"""
+
+InstalledDistribution = namedtuple('InstalledDistribution', ['id', 'name', 'key', 'version', 'location', 'kind'])
+Requires = namedtuple('Requires', ['requirement', 'key', 'marker', 'extra'])
+EntryPoint = namedtuple('EntryPoint', ['distribution', 'group', 'name', 'value'])
+
+
+def _get_option(buildout, name, default):
+    try:
+        return buildout.get("buildout", name)
+    except (configparser.NoSectionError, configparser.NoOptionError):
+        return default
+
+
+def get_installed_directories():
+    """returns 2-tuples (directory, kind) of the directories distributions are installed into"""
+    from infi.projector.helper.utils.resolver import get_isolated_python_site_packages
+    with open_buildout_configfile() as buildout:
+        eggs_directory = _get_option(buildout, "eggs-directory", "eggs")
+        develop_eggs_directory = _get_option(buildout, "develop-eggs-directory", "develop-eggs")
+    return [(get_project_path(eggs_directory), 'egg'), (get_project_path(develop_eggs_directory), 'develop')] + \
+        [(site_packages, 'site-packages') for site_packages in get_isolated_python_site_packages()]
+
+
+def _is_distribution(basename, kind):
+    if kind == 'egg':
+        return basename.endswith('.egg')
+    if kind == 'develop':
+        return basename.endswith('.egg-link')
+    return basename.endswith(('.dist-info', '.egg-info'))
+
+
+def _get_mtime(path, kind):
+    # develop eggs point to an egg-info directory that `setup.py develop` rewrites in place
+    mtime = os.path.getmtime(path)
+    if kind == 'develop':
+        with open(path) as fd:
+            target = os.path.join(os.path.dirname(path), fd.readline().strip())
+        if os.path.isdir(target):
+            mtime = max([mtime] + [os.path.getmtime(os.path.join(target, basename))
+                                   for basename in os.listdir(target) if basename.endswith('.egg-info')])
+    return mtime
+
+
+class InstalledIndex(object):
+    def __init__(self, filepath=None):
+        super(InstalledIndex, self).__init__()
+        import sqlite3
+        self.filepath = filepath or get_project_path('parts', 'projector', INDEX_FILENAME)
+        makedirs_if_necessary(os.path.dirname(os.path.abspath(self.filepath)))
+        self.connection = sqlite3.connect(self.filepath)
+        if self.connection.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+            self.connection.executescript("DROP TABLE IF EXISTS directories; DROP TABLE IF EXISTS distributions;"
+                                          "DROP TABLE IF EXISTS requires; DROP TABLE IF EXISTS entry_points;")
+            self.connection.execute("PRAGMA user_version = {}".format(SCHEMA_VERSION))
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def _add_distribution(self, directory, basename, mtime, kind):
+        path = os.path.join(directory, basename)
+        try:
+            dist = get_distribution(path)
+            requires = list(iter_requires(dist))
+            entry_points = [(group, name, str(entry_point).split('=', 1)[1].strip())
+                            for group, entry_map in dist.get_entry_map().items()
+                            for name, entry_point in entry_map.items()]
+        except (MetadataError, ValueError) as error:
+            logger.debug("Not indexing {}: {}".format(path, error))
+            return
+        cursor = self.connection.execute("INSERT INTO distributions (directory, basename, mtime, name, key, version, "
+                                         "location, kind) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                                         (directory, basename, mtime, dist.project_name, dist.key, dist.version,
+                                          dist.location if kind == 'develop' else path, kind))
+        self.connection.executemany("INSERT INTO requires VALUES (?, ?, ?, ?, ?)",
+                                    [(cursor.lastrowid, ) + item for item in requires])
+        self.connection.executemany("INSERT INTO entry_points VALUES (?, ?, ?, ?)",
+                                    [(cursor.lastrowid, ) + item for item in entry_points])
+
+    def _remove_distributions(self, ids):
+        for table, column in [('requires', 'distribution'), ('entry_points', 'distribution'), ('distributions', 'id')]:
+            self.connection.executemany("DELETE FROM {} WHERE {} = ?".format(table, column), [(id, ) for id in ids])
+
+    def _update_directory(self, directory, kind):
+        indexed = {basename: (id, mtime) for id, basename, mtime in
+                   self.connection.execute("SELECT id, basename, mtime FROM distributions WHERE directory = ?",
+                                           (directory, ))}
+        basenames = [basename for basename in sorted(os.listdir(directory)) if _is_distribution(basename, kind)]
+        removed = [id for basename, (id, _) in indexed.items() if basename not in basenames]
+        changes = len(removed)
+        for basename in basenames:
+            mtime = _get_mtime(os.path.join(directory, basename), kind)
+            if basename in indexed and indexed[basename][1] == mtime:
+                continue
+            if basename in indexed:
+                removed.append(indexed[basename][0])
+            self._add_distribution(directory, basename, mtime, kind)
+            changes += 1
+        self._remove_distributions(removed)
+        return changes
+
+    def _forget_directory(self, directory):
+        ids = [id for id, in self.connection.execute("SELECT id FROM distributions WHERE directory = ?", (directory, ))]
+        self._remove_distributions(ids)
+        self.connection.execute("DELETE FROM directories WHERE path = ?", (directory, ))
+        return len(ids)
+
+    def update(self, directories=None):
+        """indexes the directories that changed since the last update, and returns the number of changes.
+        a directory is rescanned when its mtime changes, develop eggs are always checked"""
+        directories = get_installed_directories() if directories is None else directories
+        directories = [(os.path.abspath(directory), kind) for directory, kind in directories]
+        stored = {path: mtime for path, mtime in self.connection.execute("SELECT path, mtime FROM directories")}
+        changes = 0
+        with self.connection:
+            for directory, kind in directories:
+                if not os.path.isdir(directory):
+                    changes += self._forget_directory(directory)
+                    continue
+                mtime = os.path.getmtime(directory)
+                if mtime == stored.get(directory) and kind != 'develop':
+                    continue
+                changes += self._update_directory(directory, kind)
+                self.connection.execute("INSERT OR REPLACE INTO directories VALUES (?, ?, ?)", (directory, kind, mtime))
+            for directory in set(stored) - set(directory for directory, _ in directories):
+                changes += self._forget_directory(directory)
+        return changes
+
+    def get_distributions(self, name=None):
+        from pkg_resources import safe_name
+        query = "SELECT id, name, key, version, location, kind FROM distributions"
+        rows = self.connection.execute(query + " WHERE key = ? ORDER BY id", (safe_name(name).lower(), )) \
+            if name else self.connection.execute(query + " ORDER BY key, id")
+        return [InstalledDistribution(*row) for row in rows]
+
+    def get_versions(self, name):
+        return sorted(set(dist.version for dist in self.get_distributions(name)))
+
+    def get_requires(self, distribution):
+        """returns the Requires of an InstalledDistribution, with their markers unevaluated"""
+        return [Requires(*row) for row in
+                self.connection.execute("SELECT requirement, key, marker, extra FROM requires WHERE distribution = ?",
+                                        (distribution.id, ))]
+
+    def get_all_requires(self):
+        """returns a dict {distribution id: [Requires]} of all the installed distributions"""
+        result = {}
+        for row in self.connection.execute("SELECT distribution, requirement, key, marker, extra FROM requires"):
+            result.setdefault(row[0], []).append(Requires(*row[1:]))
+        return result
+
+    def get_required_by(self, name):
+        """returns 2-tuples (InstalledDistribution, Requires) of the distributions that require name"""
+        from pkg_resources import safe_name
+        query = "SELECT d.id, d.name, d.key, d.version, d.location, d.kind, r.requirement, r.key, r.marker, r.extra " \
+                "FROM requires r JOIN distributions d ON d.id = r.distribution WHERE r.key = ? ORDER BY d.key, d.id"
+        return [(InstalledDistribution(*row[:6]), Requires(*row[6:]))
+                for row in self.connection.execute(query, (safe_name(name).lower(), ))]
+
+    def get_entry_points(self, group=None):
+        query = "SELECT d.name, e.\"group\", e.name, e.value FROM entry_points e " \
+                "JOIN distributions d ON d.id = e.distribution"
+        rows = self.connection.execute(query + " WHERE e.\"group\" = ? ORDER BY e.name", (group, )) if group \
+            else self.connection.execute(query + " ORDER BY e.\"group\", e.name")
+        return [EntryPoint(*row) for row in rows]
+
+
+@contextmanager
+def open_installed_index(update=True):
+    """yields the InstalledIndex of the project, updated unless update is False"""
+    index = InstalledIndex()
+    try:
+        if update:
+            index.update()
+        yield index
+    finally:
+        index.close()
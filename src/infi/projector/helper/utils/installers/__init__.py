@@ -0,0 +1,145 @@
+"""installs the frozen versions without resolving them, so buildout only has to generate the scripts.
+each installer backend puts distributions where a consumer expects them; they are registered in INSTALLERS"""
+from infi.projector.helper.utils import get_interpreter_fact, normalize, PrettyExecutionError
+from infi.projector.helper.utils.distributions import iter_distribution_files
+from abc import ABCMeta, abstractmethod
+from logging import getLogger
+import six
+import sys
+import os
+
+logger = getLogger(__name__)
+
+# bootstrap installs these into the interpreter, buildout does not look for them in the eggs directory
+BOOTSTRAP_PACKAGES = ['setuptools', 'zc.buildout', 'pip', 'wheel']
+
+
+class InstallError(Exception):
+    pass
+
+
+def get_interpreter_version(python):
+    from subprocess import check_output
+
+    def compute():
+        output = check_output([python, '-c', 'import sys; print("%d.%d" % sys.version_info[:2])'])
+        return output.decode().strip()
+    return get_interpreter_fact(python, 'version', compute)
+
+
+def run_commands(commands):
+    """executes the commands concurrently, and raises PrettyExecutionError if one of them fails"""
+    if sys.version_info[0] >= 3:
+        from infi.projector.helper.utils.async_execution import run_parallel
+        run_parallel(commands)
+        return
+    # asyncio is not available, a thread per command waits for its process instead
+    from infi.projector.helper.utils import execute_assert_success
+    from multiprocessing import cpu_count
+    from multiprocessing.pool import ThreadPool
+    pool = ThreadPool(min(len(commands), cpu_count()) or 1)
+    try:
+        pool.map(execute_assert_success, commands)
+    finally:
+        pool.close()
+        pool.join()
+
+
+@six.add_metaclass(ABCMeta)
+class Installer(object):
+    """installs pinned distributions from local directories, without installing their dependencies"""
+    def __init__(self, python, sources, lock=None):
+        super(Installer, self).__init__()
+        from infi.projector.helper.utils.resolver import get_host_target
+        self.python = python
+        self.sources = [source for source in sources if source and os.path.isdir(source)]
+        self.lock = lock
+        self.target = get_host_target(get_interpreter_version(python))
+
+    @abstractmethod
+    def get_installed(self):
+        """returns a set of (normalized name, version) that are already installed"""
+
+    @abstractmethod
+    def install(self, filepaths):
+        """installs the files, and raises InstallError if one of them fails"""
+
+    def _get_file_preference(self, filepath):
+        from pkg_resources import Distribution
+        if filepath.endswith('.whl'):
+            return 3 if self.target.is_wheel_compatible(os.path.basename(filepath)) else None
+        if filepath.endswith('.egg'):
+            return 2 if Distribution.from_filename(filepath).py_version == self.target.python_version else None
+        return 1
+
+    def get_files(self):
+        """returns a dict {(normalized name, version): the file to install it from}"""
+        files = {}
+        for source in self.sources:
+            for filepath, project_name, version in iter_distribution_files(source):
+                preference = self._get_file_preference(filepath)
+                key = (normalize(project_name), version)
+                if preference is not None and preference > files.get(key, (0, None))[0]:
+                    files[key] = (preference, filepath)
+        return {key: filepath for key, (_, filepath) in files.items()}
+
+    def verify(self, filepath):
+        from infi.projector.helper.utils.lockfile import verify_file
+        if self.lock is not None and verify_file(self.lock, filepath) is False:
+            raise InstallError("{} does not match its digest in the lock".format(filepath))
+
+    def install_pinned(self, pins):
+        """installs the (name, version) pins that are not installed yet, and returns the files that were installed"""
+        installed = self.get_installed()
+        missing = [(name, version) for name, version in pins
+                   if (normalize(name), version) not in installed and
+                   normalize(name) not in [normalize(item) for item in BOOTSTRAP_PACKAGES]]
+        if not missing:
+            return []
+        files = self.get_files()
+        not_found = ['{}=={}'.format(name, version) for name, version in missing
+                     if (normalize(name), version) not in files]
+        if not_found:
+            raise InstallError("These frozen versions are not in {}: {}".format(', '.join(self.sources) or
+                                                                               'the download cache',
+                                                                               ', '.join(not_found)))
+        filepaths = [files[(normalize(name), version)] for name, version in missing]
+        for filepath in filepaths:
+            self.verify(filepath)
+        self.install(filepaths)
+        return filepaths
+
+
+class EggsInstaller(Installer):
+    """installs unzipped eggs into the eggs directory, where buildout and the console-scripts recipe look for them.
+    each distribution is installed by a separate process of the target interpreter, in parallel"""
+    def __init__(self, python, sources, eggs_directory, lock=None):
+        super(EggsInstaller, self).__init__(python, sources, lock)
+        self.eggs_directory = eggs_directory
+
+    def get_installed(self):
+        from infi.projector.helper.utils.shared_eggs import iter_eggs
+        return set((normalize(project_name), version) for _, project_name, version in iter_eggs(self.eggs_directory))
+
+    def install(self, filepaths):
+        from infi.projector.helper.utils import makedirs_if_necessary
+        from pkg_resources import resource_filename
+        script = resource_filename(__name__, 'install_egg.py')
+        makedirs_if_necessary(self.eggs_directory)
+        eggs_directory = os.path.abspath(self.eggs_directory)
+        try:
+            run_commands([[self.python, script, os.path.abspath(filepath), eggs_directory] for filepath in filepaths])
+        except PrettyExecutionError as error:
+            command = error.result._command
+            filepath = command[2] if isinstance(command, list) and len(command) > 2 else 'a distribution'
+            raise InstallError("Failed to install {}:\n{}".format(
+                filepath, error.result.get_stderr().decode('utf-8', 'replace').strip()))
+
+
+INSTALLERS = dict(eggs=EggsInstaller)
+
+
+def get_installer(name, *args, **kwargs):
+    if name not in INSTALLERS:
+        raise InstallError("There is no installer named {!r}, choose one of {}".format(name, ', '.join(INSTALLERS)))
+    return INSTALLERS[name](*args, **kwargs)
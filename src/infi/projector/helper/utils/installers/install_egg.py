@@ -0,0 +1,76 @@
+"""installs a distribution file as an unzipped egg, the way buildout does, without installing its dependencies.
+
+this script runs in the interpreter the console scripts use, which does not necessarily have projector installed,
+so it only imports the standard library and setuptools.
+
+usage: python install_egg.py <distribution file> <eggs directory>
+"""
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import zipfile
+
+TEMPORARY_PREFIX = '.tmp-'
+SDIST_EXTENSIONS = ('.tar.gz', '.tar.bz2', '.tgz', '.zip')
+
+
+def _move_into_place(temporary_path, egg_path):
+    if os.path.exists(egg_path):
+        # another build installed the same egg meanwhile
+        shutil.rmtree(temporary_path)
+        return
+    os.rename(temporary_path, egg_path)
+
+
+def install_wheel(filepath, eggs_directory):
+    from setuptools.wheel import Wheel
+    wheel = Wheel(filepath)
+    egg_path = os.path.join(eggs_directory, wheel.egg_name())
+    if os.path.exists(egg_path):
+        return egg_path
+    temporary_path = os.path.join(eggs_directory, '{}{}.{}'.format(TEMPORARY_PREFIX, wheel.egg_name(), os.getpid()))
+    wheel.install_as_egg(temporary_path)
+    _move_into_place(temporary_path, egg_path)
+    return egg_path
+
+
+def install_egg(filepath, eggs_directory):
+    egg_path = os.path.join(eggs_directory, os.path.basename(filepath))
+    if os.path.exists(egg_path):
+        return egg_path
+    temporary_path = os.path.join(eggs_directory, '{}{}.{}'.format(TEMPORARY_PREFIX, os.path.basename(filepath),
+                                                                   os.getpid()))
+    with zipfile.ZipFile(filepath) as archive:
+        archive.extractall(temporary_path)
+    _move_into_place(temporary_path, egg_path)
+    return egg_path
+
+
+def install_sdist(filepath, eggs_directory):
+    # the build uses the setuptools of this interpreter and never the network, like buildout with newest=false
+    wheel_directory = tempfile.mkdtemp()
+    try:
+        subprocess.check_call([sys.executable, '-m', 'pip', 'wheel', '--no-deps', '--no-index', '--no-build-isolation',
+                               '--disable-pip-version-check', '--wheel-dir', wheel_directory, filepath])
+        wheel, = [basename for basename in os.listdir(wheel_directory) if basename.endswith('.whl')]
+        return install_wheel(os.path.join(wheel_directory, wheel), eggs_directory)
+    finally:
+        shutil.rmtree(wheel_directory, ignore_errors=True)
+
+
+def main(filepath, eggs_directory):
+    if filepath.endswith('.whl'):
+        egg_path = install_wheel(filepath, eggs_directory)
+    elif filepath.endswith('.egg'):
+        egg_path = install_egg(filepath, eggs_directory)
+    elif filepath.endswith(SDIST_EXTENSIONS):
+        egg_path = install_sdist(filepath, eggs_directory)
+    else:
+        raise SystemExit("Don't know how to install {}".format(filepath))
+    print(egg_path)
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
@@ -0,0 +1,74 @@
+"""the lock `requirements freeze --hashes` writes next to buildout.cfg: the frozen versions, and the digests of their
+distribution files in the download cache"""
+from infi.projector.helper.utils import open_buildout_configfile, get_project_path, normalize, configparser
+from infi.projector.helper.utils import get_versions_sections
+from infi.projector.helper.utils.distributions import iter_distribution_files
+from infi.projector.helper.utils.downloads import get_file_hexdigests, get_file_hexdigest
+from logging import getLogger
+import json
+import os
+
+logger = getLogger(__name__)
+
+LOCKFILE_NAME = 'buildout.lock.json'
+LOCKFILE_VERSION = 1
+HASH_ALGORITHM = 'sha256'
+
+
+def get_lockfile_path():
+    return get_project_path(LOCKFILE_NAME)
+
+
+def get_download_cache_dist():
+    with open_buildout_configfile() as buildout:
+        try:
+            return get_project_path(buildout.get("buildout", "download-cache"), "dist")
+        except (configparser.NoSectionError, configparser.NoOptionError):
+            return None
+
+
+def build_lock():
+    """returns the lock of the frozen versions in buildout.cfg, of all the targets of freeze --matrix"""
+    with open_buildout_configfile() as buildout:
+        versions = [item for section in get_versions_sections(buildout) for item in buildout.items(section)]
+    packages = {(normalize(name), version): dict(name=name, version=version, files=[]) for name, version in versions}
+    dist_directory = get_download_cache_dist()
+    files = [(filepath, (normalize(name), version))
+             for filepath, name, version in iter_distribution_files(dist_directory or '')
+             if (normalize(name), version) in packages]
+    digests = get_file_hexdigests([filepath for filepath, _ in files], HASH_ALGORITHM)
+    for filepath, key in files:
+        packages[key]['files'].append({'filename': os.path.basename(filepath), 'size': os.path.getsize(filepath),
+                                       HASH_ALGORITHM: digests[filepath]})
+    for key, package in packages.items():
+        if not package['files']:
+            logger.debug("{} {} is not in the download cache, locking it without digests".format(package['name'],
+                                                                                                package['version']))
+    return dict(version=LOCKFILE_VERSION, packages=[packages[key] for key in sorted(packages)])
+
+
+def write_lock(lock):
+    with open(get_lockfile_path(), 'w') as fd:
+        json.dump(lock, fd, indent=4, sort_keys=True)
+        fd.write('\n')
+
+
+def read_lock():
+    """returns the lock, or None if there isn't one"""
+    if not os.path.exists(get_lockfile_path()):
+        return None
+    with open(get_lockfile_path()) as fd:
+        return json.load(fd)
+
+
+def get_locked_digests(lock):
+    """returns a dict {filename: digest} of the files in the lock"""
+    return {item['filename']: item[HASH_ALGORITHM] for package in lock['packages'] for item in package['files']}
+
+
+def verify_file(lock, filepath):
+    """returns True if the digest of filepath matches the lock, False if it does not, and None if it is not locked"""
+    expected = get_locked_digests(lock).get(os.path.basename(filepath))
+    if expected is None:
+        return None
+    return get_file_hexdigest(filepath, HASH_ALGORITHM) == expected
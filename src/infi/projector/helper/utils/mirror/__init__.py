@@ -0,0 +1,122 @@
+"""a PEP 503 simple index of the download cache, next to it in <download-cache>/simple. the pages link to the files in
+<download-cache>/dist with relative URLs, so the same tree works as a file:// index and over HTTP"""
+from infi.projector.helper.utils import open_buildout_configfile, get_project_path, normalize, configparser
+from infi.projector.helper.utils import makedirs_if_necessary, TEMPORARY_PREFIX
+from infi.projector.helper.utils.distributions import iter_distribution_files
+from infi.projector.helper.utils.downloads import get_file_hexdigests
+from six.moves.urllib.parse import quote
+from logging import getLogger
+import os
+
+logger = getLogger(__name__)
+
+MIRROR_DIRNAME = 'simple'
+DIST_DIRNAME = 'dist'
+HASH_ALGORITHM = 'sha256'
+DEFAULT_PORT = 3141
+PAGE = """<!DOCTYPE html>
+<html>
+  <head><meta name="pypi:repository-version" content="1.0"><title>{title}</title></head>
+  <body>
+{links}
+  </body>
+</html>
+"""
+
+
+def get_download_cache():
+    with open_buildout_configfile() as buildout:
+        try:
+            return get_project_path(buildout.get("buildout", "download-cache"))
+        except (configparser.NoSectionError, configparser.NoOptionError):
+            return get_project_path(".cache")
+
+
+def get_mirror_directory(download_cache=None):
+    return os.path.join(download_cache or get_download_cache(), MIRROR_DIRNAME)
+
+
+def get_mirror_url(download_cache=None):
+    from six.moves.urllib.request import pathname2url
+    return 'file:' + pathname2url(os.path.abspath(get_mirror_directory(download_cache))) + '/'
+
+
+def _format_page(title, links):
+    return PAGE.format(title=title, links='\n'.join('    <a href="{}">{}</a><br/>'.format(href, text)
+                                                     for href, text in links))
+
+
+def _write_if_changed(filepath, content):
+    """writes filepath atomically, unless it already has this content. returns True if it was written"""
+    if os.path.exists(filepath):
+        with open(filepath) as fd:
+            if fd.read() == content:
+                return False
+    makedirs_if_necessary(os.path.dirname(filepath))
+    temporary_path = '{}.{}{}'.format(filepath, TEMPORARY_PREFIX, os.getpid())
+    with open(temporary_path, 'w') as fd:
+        fd.write(content)
+    if os.name == 'nt' and os.path.exists(filepath):
+        os.remove(filepath)
+    os.rename(temporary_path, filepath)
+    return True
+
+
+def build_mirror(download_cache=None):
+    """updates the simple index of the download cache, and returns the number of project pages that changed.
+    a page is rewritten only when its files change; the digests of files that did not change are cached"""
+    from shutil import rmtree
+    download_cache = download_cache or get_download_cache()
+    mirror_directory = get_mirror_directory(download_cache)
+    files = list(iter_distribution_files(os.path.join(download_cache, DIST_DIRNAME)))
+    digests = get_file_hexdigests([filepath for filepath, _, _ in files], HASH_ALGORITHM)
+    projects = {}
+    for filepath, project_name, _ in files:
+        projects.setdefault(normalize(project_name), []).append(filepath)
+    changes = 0
+    for project, filepaths in sorted(projects.items()):
+        links = [('../../{}/{}#{}={}'.format(DIST_DIRNAME, quote(os.path.basename(filepath)), HASH_ALGORITHM,
+                                             digests[filepath]), os.path.basename(filepath))
+                 for filepath in sorted(filepaths)]
+        if _write_if_changed(os.path.join(mirror_directory, project, 'index.html'),
+                             _format_page('Links for {}'.format(project), links)):
+            logger.debug("Updated the page of {}".format(project))
+            changes += 1
+    for basename in os.listdir(mirror_directory) if os.path.isdir(mirror_directory) else []:
+        if os.path.isdir(os.path.join(mirror_directory, basename)) and basename not in projects:
+            logger.debug("Removing the page of {}".format(basename))
+            rmtree(os.path.join(mirror_directory, basename))
+            changes += 1
+    _write_if_changed(os.path.join(mirror_directory, 'index.html'),
+                      _format_page('Simple index', [('{}/'.format(project), project) for project in sorted(projects)]))
+    return changes
+
+
+def create_mirror_server(download_cache=None, host='127.0.0.1', port=DEFAULT_PORT):
+    """returns an HTTP server of the download cache, with the simple index at /simple/. call serve_forever()"""
+    from six.moves.BaseHTTPServer import HTTPServer
+    from six.moves.SimpleHTTPServer import SimpleHTTPRequestHandler
+    from six.moves.socketserver import ThreadingMixIn
+    from six.moves.urllib.parse import urlparse, unquote
+    root = os.path.abspath(download_cache or get_download_cache())
+
+    class Handler(SimpleHTTPRequestHandler):
+        # keep-alive, like the index clients expect
+        protocol_version = "HTTP/1.1"
+
+        def translate_path(self, path):
+            parts = [part for part in unquote(urlparse(path).path).split('/') if part and part not in (os.curdir,
+                                                                                                        os.pardir)]
+            if not parts or parts[0] not in (MIRROR_DIRNAME, DIST_DIRNAME):
+                return os.path.join(root, MIRROR_DIRNAME, 'does-not-exist')
+            return os.path.join(root, *parts)
+
+        def list_directory(self, path):
+            self.send_error(404)
+
+        def log_message(self, format, *args):
+            logger.debug("%s %s", self.address_string(), format % args)
+
+    class Server(ThreadingMixIn, HTTPServer):
+        daemon_threads = True
+    return Server((host, port), Handler)
@@ -0,0 +1,133 @@
+"""fills the download cache before building: the frozen versions, or what install_requires needs when nothing is
+frozen, downloaded concurrently from the package index"""
+from infi.projector.helper.utils import normalize
+from infi.projector.helper.utils.distributions import iter_distribution_files, parse_filename, SDIST_EXTENSIONS
+from infi.projector.helper.utils.distributions import get_distribution, iter_requires, MetadataError
+from infi.projector.helper.utils.simple_index import map_concurrently, CONCURRENT_REQUESTS
+from logging import getLogger
+import os
+
+logger = getLogger(__name__)
+
+
+class PrefetchError(Exception):
+    pass
+
+
+class Prefetcher(object):
+    """downloads the distribution files a Target needs into the download cache, with a connection to the index per
+    thread. files the lock has a digest for are verified against it, the others against the index's digest"""
+    def __init__(self, client, dist_directory, target, lock=None, concurrency=CONCURRENT_REQUESTS):
+        super(Prefetcher, self).__init__()
+        from infi.projector.helper.utils.dependency_graph import MarkerEvaluator
+        from infi.projector.helper.utils.lockfile import get_locked_digests, HASH_ALGORITHM
+        self.client = client
+        self.dist_directory = dist_directory
+        self.target = target
+        self.concurrency = concurrency
+        self.locked_digests = get_locked_digests(lock) if lock else {}
+        self.hash_algorithm = HASH_ALGORITHM
+        self.evaluator = MarkerEvaluator(target.get_marker_environment())
+
+    def is_usable(self, filename):
+        from pkg_resources import Distribution
+        if filename.endswith('.whl'):
+            return self.target.is_wheel_compatible(filename)
+        if filename.endswith('.egg'):
+            return Distribution.from_filename(filename).py_version == self.target.python_version
+        return filename.endswith(tuple(SDIST_EXTENSIONS))
+
+    def _get_preference(self, filename, version):
+        from pkg_resources import parse_version
+        # final releases, then the newest, then wheels over eggs over sdists, like buildout's precedence
+        parsed = parse_version(version)
+        return not parsed.is_prerelease, parsed, filename.endswith('.whl'), filename.endswith('.egg')
+
+    def get_cached(self):
+        """returns a dict {(normalized name, version): path} of the usable files in the download cache"""
+        return {(normalize(project_name), version): filepath
+                for filepath, project_name, version in iter_distribution_files(self.dist_directory)
+                if self.is_usable(os.path.basename(filepath))}
+
+    def choose(self, candidates, name, requirement=None, version=None):
+        """returns the best of the (filename, version, item) candidates for a pinned version, or for the newest
+        version that satisfies requirement. returns None if none of them is usable"""
+        from pkg_resources import parse_version
+        usable = [(filename, candidate_version, item) for filename, candidate_version, item in candidates
+                  if self.is_usable(filename) and
+                  (version is None or parse_version(candidate_version) == parse_version(version)) and
+                  (requirement is None or candidate_version in requirement)]
+        if not usable:
+            return None
+        return max(usable, key=lambda candidate: self._get_preference(candidate[0], candidate[1]))[2]
+
+    def _download(self, name, requirement=None, version=None):
+        links = []
+        for link in self.client.get_project_links(name):
+            parsed = parse_filename(link.filename)
+            if parsed is not None and normalize(parsed[0]) == normalize(name):
+                links.append((link.filename, parsed[1], link))
+        link = self.choose(links, name, requirement, version)
+        if link is None:
+            raise PrefetchError("There is no distribution of {} for {} in {}".format(
+                requirement or '{}=={}'.format(name, version), self.target.get_key(), self.client.index_url))
+        expected = self.locked_digests.get(link.filename)
+        logger.debug("Downloading {}".format(link.url))
+        return self.client.download(link, self.dist_directory, self.hash_algorithm if expected else None, expected)
+
+    def _raise_errors(self, results):
+        errors = ["{}: {}".format(key, error) for key, error in sorted(results.items(), key=lambda item: str(item[0]))
+                  if isinstance(error, Exception)]
+        if errors:
+            raise PrefetchError("Failed to download:\n" + "\n".join(errors))
+
+    def prefetch_pinned(self, pins):
+        """downloads a file of each (name, version) pin that the download cache does not have yet. returns their
+        paths"""
+        cached = self.get_cached()
+        missing = [(name, version) for name, version in pins if (normalize(name), version) not in cached]
+        results = map_concurrently(lambda pin: self._download(pin[0], version=pin[1]), missing, self.concurrency)
+        self._raise_errors(results)
+        return [results[pin] for pin in missing]
+
+    def get_requires(self, filepath, extras=()):
+        from infi.projector.helper.utils.installed_index import Requires
+        from pkg_resources import Requirement
+        try:
+            requires = [Requires(*item) for item in iter_requires(get_distribution(filepath))]
+        except (MetadataError, ValueError) as error:
+            logger.warning("Not prefetching the dependencies of {}: {}".format(os.path.basename(filepath), error))
+            return []
+        return [Requirement.parse(item.requirement) for item in requires
+                if self.evaluator.applies(item, tuple(sorted(extras)))]
+
+    def _get_file(self, requirement, cached):
+        """returns a 2-tuple (path, downloaded) of the file for requirement"""
+        candidates = [(os.path.basename(filepath), version, filepath) for (key, version), filepath in cached.items()
+                      if key == normalize(requirement.project_name)]
+        filepath = self.choose(candidates, requirement.project_name, requirement)
+        if filepath is not None:
+            return filepath, False
+        return self._download(requirement.project_name, requirement), True
+
+    def prefetch_requirements(self, requirements):
+        """downloads the newest files that satisfy the requirements and their dependencies, a level of the
+        dependency tree at a time. a requirement the download cache already satisfies is not downloaded again.
+        this does not resolve conflicts, the first requirement of each project wins. returns the downloaded paths"""
+        cached = self.get_cached()
+        seen = set()
+        downloaded = []
+        level = list(requirements)
+        while level:
+            unseen = []
+            for requirement in level:
+                if requirement.key not in seen:
+                    seen.add(requirement.key)
+                    unseen.append(requirement)
+            results = map_concurrently(lambda requirement: self._get_file(requirement, cached), unseen,
+                                       self.concurrency)
+            self._raise_errors(results)
+            downloaded.extend(results[requirement][0] for requirement in unseen if results[requirement][1])
+            level = [dependency for requirement in unseen
+                     for dependency in self.get_requires(results[requirement][0], requirement.extras)]
+        return downloaded
@@ -0,0 +1,369 @@
+"""picks the versions buildout would pick, from the distributions that are already on this host, without installing"""
+from infi.projector.helper.utils import open_buildout_configfile, configparser, get_project_path
+from infi.projector.helper.utils.distributions import get_distribution, iter_distribution_files, iter_requires
+from infi.projector.helper.utils.distributions import MetadataError
+from collections import deque
+from logging import getLogger
+from glob import glob
+import os
+import re
+
+logger = getLogger(__name__)
+
+# the recipes of the sections `projector devenv build` installs
+BUILD_RECIPES = ["infi.recipe.python", "zerokspot.recipe.git", "gitrecipe", "git-recipe", "infi.git-recipe",
+                 "infi.recipe.template.version", "infi.recipe.console_scripts", "infi.recipe.js_requirements"]
+CONSOLE_SCRIPTS_RECIPE = "infi.recipe.console_scripts"
+MAX_ROUNDS = 20
+
+
+class ResolutionError(Exception):
+    pass
+
+
+class Target(object):
+    """a (python version, platform tag) combination to resolve for, e.g. ('3.8', 'linux_x86_64')"""
+    def __init__(self, python_version, platform_tag):
+        super(Target, self).__init__()
+        self.python_version = '.'.join(python_version.lstrip('v').split('.')[:2])
+        self.platform_tag = platform_tag.replace('-', '_').replace('.', '_')
+
+    def get_key(self):
+        return 'py{}-{}'.format(self.python_version.replace('.', ''), self.platform_tag)
+
+    def get_marker_environment(self):
+        """the values of the environment markers on the target, as far as the platform tag tells"""
+        platform = self.platform_tag
+        if platform.startswith('win'):
+            os_name, sys_platform, platform_system = 'nt', 'win32', 'Windows'
+            machine = 'AMD64' if platform.endswith('amd64') else 'x86'
+        elif platform.startswith('macosx'):
+            os_name, sys_platform, platform_system = 'posix', 'darwin', 'Darwin'
+            machine = platform.split('_', 3)[-1]
+        else:
+            # linux_x86_64, manylinux2014_x86_64, manylinux_2_17_aarch64
+            os_name, sys_platform, platform_system = 'posix', 'linux', 'Linux'
+            machine = re.sub(r'^(many)?linux(1|2010|2014|_\d+_\d+)?_', '', platform)
+        return dict(os_name=os_name, sys_platform=sys_platform, platform_system=platform_system,
+                    platform_machine=machine, python_version=self.python_version,
+                    python_full_version=self.python_version + '.0', implementation_name='cpython',
+                    platform_python_implementation='CPython')
+
+    def _is_platform_compatible(self, tag):
+        if tag == 'any' or tag == self.platform_tag:
+            return True
+        linux = re.match(r'^linux_(.+)$', self.platform_tag)
+        return bool(linux and re.match(r'^manylinux(1|2010|2014|_\d+_\d+)_{}$'.format(re.escape(linux.group(1))), tag))
+
+    def is_wheel_compatible(self, basename):
+        parts = basename[:-len('.whl')].split('-')
+        python_tags, abi_tags, platform_tags = [item.split('.') for item in parts[-3:]]
+        major, minor = self.python_version.split('.')
+        pythons = ['py' + major, 'py' + major + minor, 'cp' + major + minor]
+        abis = ['none', 'abi3', 'cp' + major + minor, 'cp' + major + minor + 'm', 'cp' + major + minor + 'mu']
+        return any(tag in pythons or (tag.startswith('cp' + major) and 'abi3' in abi_tags and
+                                      int(tag[len('cp' + major):] or 0) <= int(minor))
+                   for tag in python_tags) and \
+            any(tag in abis for tag in abi_tags) and any(self._is_platform_compatible(tag) for tag in platform_tags)
+
+
+def parse_targets(value):
+    """parses the lines of [freeze-matrix] targets, "<python version> <platform tag>" each"""
+    return [Target(*line.split()) for line in value.splitlines() if len(line.split()) == 2]
+
+
+def get_host_target(python_version=None):
+    from sysconfig import get_platform
+    from sys import version_info
+    return Target(python_version or '{}.{}'.format(*version_info[:2]), get_platform())
+
+
+def _is_compatible(filepath, target=None):
+    if not filepath.endswith('.whl'):
+        return True
+    if target is not None:
+        return target.is_wheel_compatible(os.path.basename(filepath))
+    try:
+        from setuptools.wheel import Wheel
+    except ImportError:
+        return True
+    return Wheel(os.path.basename(filepath)).is_compatible()
+
+
+def _identify(dist):
+    # the distributions in site-packages share a location
+    return dist.location, dist.key, dist.version
+
+
+def _get_placeholder(filepath, project_name, version):
+    """a distribution with just the name and version from the file name; the metadata is read when it is needed"""
+    from pkg_resources import Distribution, BINARY_DIST, EGG_DIST, SOURCE_DIST
+    precedence = BINARY_DIST if filepath.endswith('.whl') else EGG_DIST if filepath.endswith('.egg') else SOURCE_DIST
+    return Distribution(filepath, project_name=project_name, version=version, precedence=precedence)
+
+
+class Resolution(object):
+    def __init__(self, picked, constraints, required_by, dependencies):
+        super(Resolution, self).__init__()
+        self.picked = picked                # key -> distribution
+        self.constraints = constraints      # key -> list of requirements
+        self.required_by = required_by      # key -> set of distributions (or names of the roots)
+        self.dependencies = dependencies    # key -> list of keys
+
+    def get_picked_versions(self):
+        """returns the (project_name, version) pairs buildout would write to its update-versions-file"""
+        from pkg_resources import DEVELOP_DIST
+        return sorted((dist.project_name, dist.version) for key, dist in self.picked.items()
+                      if dist.precedence != DEVELOP_DIST and
+                      not any(len(requirement.specs) == 1 and requirement.specs[0][0] == '=='
+                              for requirement in self.constraints[key]))
+
+    def format_picked_versions(self, with_header=True):
+        """the same format as buildout's update-versions-file. buildout omits the header when the file exists"""
+        output = ['[versions]'] if with_header else []
+        required_output = []
+        for project_name, version in self.get_picked_versions():
+            required_by = sorted(str(item.as_requirement()) for item in
+                                 self.required_by.get(project_name.lower(), ()) if hasattr(item, 'as_requirement'))
+            if required_by:
+                required_output.extend(['', '# Required by:'] + ['# ' + item for item in required_by])
+                required_output.append("%s = %s" % (project_name, version))
+            else:
+                output.append("%s = %s" % (project_name, version))
+        return '\n'.join(output + required_output + [''])
+
+
+class Resolver(object):
+    def __init__(self, available=(), installed=(), develop=(), prefer_final=False, newest=False, environment=None):
+        super(Resolver, self).__init__()
+        from infi.projector.helper.utils.dependency_graph import MarkerEvaluator
+        self.candidates = {}
+        for dist in list(available) + list(installed) + list(develop):
+            self.candidates.setdefault(dist.key, []).append(dist)
+        self.installed = set(_identify(dist) for dist in installed)
+        self.develop = {dist.key: dist for dist in develop}
+        self.prefer_final = prefer_final
+        self.newest = newest
+        self._metadata = {}
+        self._requires = {}
+        self.evaluator = MarkerEvaluator(environment)
+
+    def _get_preference(self, dist):
+        # like buildout: installed eggs win unless --newest, then final releases if prefer-final, then the newest
+        return (not self.newest and _identify(dist) in self.installed,
+                not self.prefer_final or not dist.parsed_version.is_prerelease,
+                dist.parsed_version, dist.precedence)
+
+    def _pick(self, key, requirements, required_by):
+        candidates = [self.develop[key]] if key in self.develop else self.candidates.get(key, [])
+        matching = [dist for dist in candidates if all(dist in requirement for requirement in requirements)]
+        if not matching:
+            message = "No distribution on this host satisfies {} (required by {})"
+            requirers = sorted(str(getattr(item, 'project_name', item)) for item in required_by.get(key, ()))
+            raise ResolutionError(message.format(', '.join(sorted(set(str(item) for item in requirements))),
+                                                 ', '.join(requirers) or 'buildout.cfg'))
+        return max(matching, key=self._get_preference)
+
+    def _get_metadata(self, dist):
+        """returns dist with its metadata, read from another file of the same version if dist does not declare it"""
+        if _identify(dist) not in self._metadata:
+            same_version = [item for item in self.candidates.get(dist.key, [])
+                            if item.version == dist.version and item is not dist]
+            errors = []
+            for item in [dist] + sorted(same_version, key=self._get_preference, reverse=True):
+                if item.has_metadata('PKG-INFO') or item.has_metadata('METADATA'):
+                    self._metadata[_identify(dist)] = item
+                    break
+                try:
+                    self._metadata[_identify(dist)] = get_distribution(item.location)
+                    break
+                except MetadataError as error:
+                    errors.append(str(error))
+            else:
+                raise ResolutionError("Cannot tell the requirements of {}: {}".format(dist, '; '.join(errors)))
+        return self._metadata[_identify(dist)]
+
+    def get_requires(self, dist, extras=()):
+        """returns the requirements of dist with extras, evaluating their markers for the environment"""
+        from pkg_resources import Requirement
+        from infi.projector.helper.utils.installed_index import Requires
+        key = (_identify(dist), tuple(sorted(extras)))
+        if key not in self._requires:
+            try:
+                requires = [Requires(*item) for item in iter_requires(self._get_metadata(dist))]
+            except ValueError as error:
+                raise ResolutionError("Invalid requirement in {}: {}".format(dist, error))
+            self._requires[key] = [Requirement.parse(item.requirement) for item in requires
+                                   if self.evaluator.applies(item, key[1])]
+        return self._requires[key]
+
+    def _walk(self, requirements, previous):
+        picked, constraints, required_by, dependencies, expanded = {}, {}, {}, {}, {}
+        repicked = False
+        queue = deque(requirements)
+        while queue:
+            requirement, requirer = queue.popleft()
+            key = requirement.key
+            constraints.setdefault(key, []).append(requirement)
+            if requirer is not None:
+                required_by.setdefault(key, set()).add(requirer)
+            dist = picked.get(key) or previous.get(key)
+            if dist is None or not all(dist in item for item in constraints[key]):
+                try:
+                    dist = self._pick(key, constraints[key], required_by)
+                except ResolutionError:
+                    if repicked:    # the conflict may come from the dependencies of a previous pick
+                        break
+                    raise
+            picked[key] = dist
+            extras = tuple(sorted(requirement.extras))
+            if key in expanded and expanded[key][0] is not dist:
+                repicked = True    # the dependencies of the previous pick are already in the queue
+            elif extras in expanded.get(key, (None, set()))[1]:
+                continue
+            expanded.setdefault(key, [dist, set()])[0] = dist
+            expanded[key][1].add(extras)
+            for dependency in self.get_requires(dist, requirement.extras):
+                dependencies.setdefault(key, [])
+                if dependency.key not in dependencies[key]:
+                    dependencies[key].append(dependency.key)
+                queue.append((dependency, dist))
+        return Resolution(picked, constraints, required_by, dependencies), repicked
+
+    def resolve(self, requirements):
+        """requirements is a list of 2-tuples (requirement, requirer). returns a Resolution"""
+        resolution = Resolution({}, {}, {}, {})
+        for _ in range(MAX_ROUNDS):
+            resolution, repicked = self._walk(requirements, resolution.picked)
+            if not repicked:
+                return resolution
+        raise ResolutionError("The requirements did not settle after {} rounds".format(MAX_ROUNDS))
+
+
+def _get_option(buildout, name, default=None):
+    try:
+        return buildout.get("buildout", name)
+    except (configparser.NoSectionError, configparser.NoOptionError):
+        return default
+
+
+def read_root_requirements(buildout, with_recipes=True):
+    """returns a 3-tuple (project name, install_requires, names) of the unparsed requirements of the project and of
+    the parts `devenv build` installs. open_buildout_configfile swallows the exceptions raised in its block, so read
+    them in it and pass them to parse_root_requirements after it"""
+    def get(section, option, default=None):
+        return buildout.get(section, option) if buildout.has_option(section, option) else default
+    names = (_get_option(buildout, "extensions") or '').split() if with_recipes else []
+    for section in buildout.sections():
+        recipe = buildout.get(section, "recipe").split(':')[0] if buildout.has_option(section, "recipe") else None
+        if recipe not in BUILD_RECIPES:
+            continue
+        if with_recipes:
+            names.append(recipe)
+        if recipe == CONSOLE_SCRIPTS_RECIPE and buildout.has_option(section, "eggs"):
+            # ${project:name} is the develop egg, and its requirements are install_requires
+            names.extend(item.strip() for item in buildout.get(section, "eggs").splitlines() if '${' not in item)
+    return get("project", "name"), get("project", "install_requires", "[]"), [name for name in names if name]
+
+
+def parse_root_requirements(project_name, install_requires, names):
+    """returns the requirements of read_root_requirements as (requirement, requirer). raises ResolutionError if one of
+    them is invalid"""
+    from pkg_resources import Requirement, RequirementParseError
+    from infi.projector.helper.utils.package_sets import InstallRequiresPackageSet
+    try:
+        requirements = [(Requirement.parse(item), project_name)
+                        for item in sorted(InstallRequiresPackageSet.from_value(install_requires))]
+        requirements.extend((Requirement.parse(name), None) for name in names)
+    except (RequirementParseError, ValueError, SyntaxError) as error:
+        raise ResolutionError("Invalid requirement in buildout.cfg: {}".format(error))
+    return requirements
+
+
+def get_isolated_python_site_packages():
+    return glob(get_project_path('parts', 'python', 'lib*', 'python*', 'site-packages')) + \
+        glob(get_project_path('parts', 'python', 'Lib', 'site-packages'))
+
+
+def get_local_distributions(buildout, target=None):
+    """returns a 3-tuple (available, installed, develop) of the distributions buildout can use without downloading.
+    the installed distributions are only used when resolving for this host"""
+    from pkg_resources import Distribution
+    dist_directories = []
+    if _get_option(buildout, "download-cache"):
+        dist_directories.append(get_project_path(_get_option(buildout, "download-cache"), "dist"))
+    dist_directories.extend(get_project_path(item) for item in (_get_option(buildout, "find-links") or '').split()
+                            if '://' not in item and os.path.isdir(get_project_path(item)))
+    available = [_get_placeholder(filepath, project_name, version) for dirpath in dist_directories
+                 for filepath, project_name, version in iter_distribution_files(dirpath)
+                 if _is_compatible(filepath, target)]
+    if target is not None:
+        return available, [], []
+    eggs_directory = get_project_path(_get_option(buildout, "eggs-directory", "eggs"))
+    installed = [Distribution.from_filename(filepath) for filepath in sorted(glob(os.path.join(eggs_directory, '*.egg')))]
+    for site_packages in get_isolated_python_site_packages():
+        for basename in sorted(os.listdir(site_packages)):
+            if not basename.endswith(('.dist-info', '.egg-info')):
+                continue
+            try:
+                installed.append(get_distribution(os.path.join(site_packages, basename)))
+            except MetadataError as error:
+                logger.debug("Ignoring {}: {}".format(os.path.join(site_packages, basename), error))
+    develop = []
+    develop_eggs_directory = get_project_path(_get_option(buildout, "develop-eggs-directory", "develop-eggs"))
+    for filepath in sorted(glob(os.path.join(develop_eggs_directory, '*.egg-link'))):
+        try:
+            develop.append(get_distribution(filepath))
+        except MetadataError as error:
+            logger.debug("Ignoring develop egg {}: {}".format(filepath, error))
+    return available, installed, develop
+
+
+def resolve_project(newest=False, target=None):
+    """returns the Resolution of the project's requirements, from the distributions on this host. with a Target,
+    the markers and wheel tags of the target are used instead of the running interpreter's"""
+    with open_buildout_configfile() as buildout:
+        root_requirements = read_root_requirements(buildout)
+    requirements = parse_root_requirements(*root_requirements)
+    available, installed, develop = get_local_distributions(buildout, target)
+    prefer_final = (_get_option(buildout, "prefer-final") or 'true').lower() in ('true', 'yes', '1', 'on')
+    project_key = (root_requirements[0] or '').lower()
+    develop = [dist for dist in develop if dist.key != project_key]
+    resolver = Resolver(available, installed, develop, prefer_final=prefer_final, newest=newest,
+                        environment=target.get_marker_environment() if target is not None else None)
+    return resolver.resolve(requirements)
+
+
+def _resolve_target(args):
+    # runs in a worker process, so it gets the project root instead of inheriting the execution context
+    from infi.projector.helper.utils import project_context
+    project_root, python_version, platform_tag, newest = args
+    target = Target(python_version, platform_tag)
+    with project_context(project_root):
+        try:
+            resolution = resolve_project(newest=newest, target=target)
+        except ResolutionError as error:
+            return target.get_key(), None, str(error)
+    return target.get_key(), resolution.format_picked_versions(with_header=False), None
+
+
+def resolve_targets(targets, newest=False, processes=None):
+    """resolves the project once per Target, concurrently. returns a dict {target key: picked versions, in the format
+    of format_picked_versions without the header}"""
+    from infi.projector.helper.utils import get_project_path
+    project_root = os.path.abspath(get_project_path(os.curdir))
+    args = [(project_root, target.python_version, target.platform_tag, newest) for target in targets]
+    if len(args) > 1:
+        from multiprocessing import Pool, cpu_count
+        pool = Pool(min(processes or cpu_count(), len(args)))
+        try:
+            results = pool.map(_resolve_target, args)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        results = [_resolve_target(item) for item in args]
+    errors = ["{}: {}".format(key, error) for key, _, error in results if error is not None]
+    if errors:
+        raise ResolutionError('\n'.join(errors))
+    return {key: content for key, content, _ in results}
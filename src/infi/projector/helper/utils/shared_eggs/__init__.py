@@ -0,0 +1,109 @@
+from infi.projector.helper.utils import open_buildout_configfile, configparser, normalize, get_project_path
+from infi.projector.helper.utils import get_cache_directory, link_tree_atomically
+from infi.projector.helper.utils import makedirs_if_necessary, TEMPORARY_PREFIX
+from logging import getLogger
+import os
+
+logger = getLogger(__name__)
+
+BYTECODE_DIRNAME = "__pycache__"
+BYTECODE_SUFFIXES = (".pyc", ".pyo")
+
+
+def get_shared_eggs_directory():
+    return get_cache_directory("eggs")
+
+
+def get_eggs_directory():
+    with open_buildout_configfile() as buildout:
+        try:
+            return get_project_path(buildout.get("buildout", "eggs-directory"))
+        except (configparser.NoSectionError, configparser.NoOptionError):
+            return get_project_path("eggs")
+
+
+def get_pinned_versions(section="versions"):
+    with open_buildout_configfile() as buildout:
+        if not buildout.has_section(section):
+            return dict()
+        return {normalize(key): value for key, value in buildout.items(section)}
+
+
+def parse_egg_name(basename):
+    """returns a 2-tuple (project_name, version) of an egg file/directory name, e.g. six-1.16.0-py3.8.egg"""
+    from pkg_resources import Distribution
+    if not basename.endswith(".egg") or basename.startswith(TEMPORARY_PREFIX):
+        return None
+    distribution = Distribution.from_filename(basename)
+    return distribution.project_name, distribution.version
+
+
+def iter_eggs(dirpath):
+    if not os.path.isdir(dirpath):
+        return
+    for basename in sorted(os.listdir(dirpath)):
+        parsed = parse_egg_name(basename)
+        if parsed is not None:
+            yield basename, parsed[0], parsed[1]
+
+
+def _get_relative_paths(dirpath):
+    # python writes bytecode into the eggs it imports, which does not make an egg diverge from the store
+    relpaths = set()
+    for path, dirnames, filenames in os.walk(dirpath):
+        dirnames[:] = [name for name in dirnames if name != BYTECODE_DIRNAME]
+        relpaths.update(os.path.relpath(os.path.join(path, name), dirpath) for name in filenames
+                        if not name.endswith(BYTECODE_SUFFIXES))
+    return relpaths
+
+
+def is_linked(path, other_path):
+    """returns True if every file of the tree at path is a link to the same file in the tree at other_path"""
+    if not os.path.isdir(path):
+        return os.path.samefile(path, other_path)
+    relpaths = _get_relative_paths(path)
+    if not relpaths or relpaths != _get_relative_paths(other_path):
+        return False
+    return all(os.path.samefile(os.path.join(path, relpath), os.path.join(other_path, relpath))
+               for relpath in relpaths)
+
+
+def link_eggs_from_store(eggs_directory=None, versions_section="versions"):
+    """links the eggs of the frozen versions from the store. eggs that are not frozen are left for buildout to pick,
+    otherwise it would prefer whatever versions other projects happened to install"""
+    eggs_directory = eggs_directory or get_eggs_directory()
+    store = get_shared_eggs_directory()
+    pinned_versions = get_pinned_versions(versions_section)
+    if not pinned_versions:
+        logger.debug("There are no frozen versions, not linking eggs from {}".format(store))
+        return
+    makedirs_if_necessary(eggs_directory)
+    existing = set(os.listdir(eggs_directory))
+    linked = 0
+    for basename, project_name, version in iter_eggs(store):
+        if basename in existing or pinned_versions.get(normalize(project_name)) != version:
+            continue
+        link_tree_atomically(os.path.join(store, basename), os.path.join(eggs_directory, basename))
+        linked += 1
+    logger.debug("Linked {} eggs from {} to {}".format(linked, store, eggs_directory))
+
+
+def add_eggs_to_store(eggs_directory=None):
+    eggs_directory = eggs_directory or get_eggs_directory()
+    if not os.path.isdir(eggs_directory):
+        return
+    store = get_shared_eggs_directory()
+    same_filesystem = os.stat(store).st_dev == os.stat(eggs_directory).st_dev
+    added = 0
+    for basename, project_name, version in iter_eggs(eggs_directory):
+        egg_path = os.path.join(eggs_directory, basename)
+        stored_egg_path = os.path.join(store, basename)
+        if not os.path.exists(stored_egg_path):
+            link_tree_atomically(egg_path, stored_egg_path)
+            added += 1
+        if not same_filesystem or is_linked(egg_path, stored_egg_path):
+            continue
+        # the same egg was installed separately, replace the local copy with links to the stored one
+        logger.debug("Replacing {} with links to {}".format(egg_path, stored_egg_path))
+        link_tree_atomically(stored_egg_path, egg_path, replace=True)
+    logger.debug("Added {} eggs from {} to {}".format(added, eggs_directory, store))
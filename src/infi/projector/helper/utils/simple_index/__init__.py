@@ -0,0 +1,301 @@
+"""a client of PEP 503/691 simple package indexes, on HTTP or in a local directory"""
+from infi.projector.helper.utils import get_cache_directory, normalize, makedirs_if_necessary, TEMPORARY_PREFIX
+from infi.projector.helper.utils.distributions import parse_filename
+from six.moves.urllib.parse import urlparse, urljoin, unquote
+from six.moves import http_client, html_parser
+from collections import namedtuple
+from logging import getLogger
+from threading import Thread, Lock, local, current_thread
+import hashlib
+import json
+import os
+
+logger = getLogger(__name__)
+
+JSON_CONTENT_TYPE = 'application/vnd.pypi.simple.v1+json'
+ACCEPT = '{}, application/vnd.pypi.simple.v1+html;q=0.2, text/html;q=0.1'.format(JSON_CONTENT_TYPE)
+MAX_REDIRECTS = 5
+CONCURRENT_REQUESTS = 8
+DOWNLOAD_RETRIES = 3
+CHUNK_SIZE = 1024 * 1024
+HASH_ALGORITHMS = ['sha256', 'sha384', 'sha512', 'md5']
+
+ProjectFile = namedtuple('ProjectFile', ['filename', 'url', 'hashes'])
+
+
+class SimpleIndexError(Exception):
+    pass
+
+
+class _LinksParser(html_parser.HTMLParser):
+    def __init__(self):
+        html_parser.HTMLParser.__init__(self)
+        self.links = []
+        self._attributes = None
+        self._text = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'a':
+            self._attributes, self._text = dict(attrs), []
+
+    def handle_data(self, data):
+        if self._attributes is not None:
+            self._text.append(data)
+
+    def handle_endtag(self, tag):
+        if tag == 'a' and self._attributes is not None:
+            self.links.append((''.join(self._text).strip(), self._attributes))
+            self._attributes = None
+
+
+def _parse_fragment(fragment):
+    algorithm, _, digest = fragment.partition('=')
+    return {algorithm: digest} if algorithm in HASH_ALGORITHMS and digest else {}
+
+
+def parse_project_files(content, content_type, base_url):
+    """returns the ProjectFiles that are not yanked in a project page of a simple index"""
+    if content_type.split(';')[0].strip() == JSON_CONTENT_TYPE:
+        return [ProjectFile(item['filename'], urljoin(base_url, item.get('url', item['filename'])), item.get('hashes', {}))
+                for item in json.loads(content)['files'] if not item.get('yanked')]
+    parser = _LinksParser()
+    parser.feed(content)
+    result = []
+    for text, attributes in parser.links:
+        if 'data-yanked' in attributes:
+            continue
+        url, _, fragment = urljoin(base_url, attributes.get('href', '')).partition('#')
+        result.append(ProjectFile(text or unquote(urlparse(url).path.split('/')[-1]), url, _parse_fragment(fragment)))
+    return result
+
+
+def parse_project_page(content, content_type):
+    """returns the names of the files that are not yanked in a project page of a simple index"""
+    return [item.filename for item in parse_project_files(content, content_type, '')]
+
+
+def map_concurrently(function, items, concurrency=CONCURRENT_REQUESTS):
+    """returns a dict {item: function(item) or the exception it raised}, calling function from several threads"""
+    from six.moves.queue import Queue, Empty
+    queue = Queue()
+    for item in items:
+        queue.put(item)
+    results = {}
+
+    def worker():
+        while True:
+            try:
+                item = queue.get_nowait()
+            except Empty:
+                return
+            try:
+                results[item] = function(item)
+            except Exception as error:
+                logger.debug("{!r} failed: {}".format(item, error))
+                results[item] = error
+    threads = [Thread(target=worker) for _ in range(max(1, min(concurrency, queue.qsize())))]
+    [thread.start() for thread in threads]
+    [thread.join() for thread in threads]
+    return results
+
+
+class SimpleIndexClient(object):
+    """fetches project pages from a simple index. each thread keeps a connection per host, and the responses are
+    cached on disk and revalidated with their ETag"""
+    def __init__(self, index_url, cache_directory=None, timeout=30):
+        super(SimpleIndexClient, self).__init__()
+        self.index_url = index_url.rstrip('/') + '/'
+        self.cache_directory = cache_directory or get_cache_directory('simple-index')
+        self.timeout = timeout
+        self._local = local()
+        self._connections = []
+        self._lock = Lock()
+
+    def is_local(self):
+        return urlparse(self.index_url).scheme in ('', 'file')
+
+    def get_project_url(self, name):
+        return urljoin(self.index_url, normalize(name) + '/')
+
+    def _get_local_project_files(self, name):
+        dirpath = unquote(urlparse(self.get_project_url(name)).path)
+        if not os.path.isdir(dirpath):
+            return []
+        index_html = os.path.join(dirpath, 'index.html')
+        if os.path.exists(index_html):
+            with open(index_html) as fd:
+                return parse_project_files(fd.read(), 'text/html', dirpath + os.sep)
+        return [ProjectFile(basename, os.path.join(dirpath, basename), {})
+                for basename in sorted(os.listdir(dirpath)) if parse_filename(basename)]
+
+    def _get_connection(self, parsed):
+        connections = self._local.__dict__.setdefault('connections', {})
+        key = (parsed.scheme, parsed.netloc)
+        if key not in connections:
+            connection_class = http_client.HTTPSConnection if parsed.scheme == 'https' else http_client.HTTPConnection
+            connections[key] = connection_class(parsed.netloc, timeout=self.timeout)
+            with self._lock:
+                self._connections.append(connections[key])
+        return connections[key]
+
+    def close(self):
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for connection in connections:
+            connection.close()
+
+    def _request(self, url, headers, open_stream=None):
+        """returns a 3-tuple (status, headers, body). with open_stream, a successful body is written to the file
+        open_stream(status) returns instead"""
+        parsed = urlparse(url)
+        path = parsed.path + ('?' + parsed.query if parsed.query else '')
+        for attempt in range(2):
+            connection = self._get_connection(parsed)
+            streaming = False
+            try:
+                connection.request('GET', path, headers=headers)
+                response = connection.getresponse()
+                if open_stream is None or response.status not in (200, 206):
+                    return response.status, response.getheaders(), response.read()
+                streaming = True
+                with open_stream(response.status) as stream:
+                    for chunk in iter(lambda: response.read(CHUNK_SIZE), b''):
+                        stream.write(chunk)
+                return response.status, response.getheaders(), b''
+            except (http_client.HTTPException, IOError):
+                # the server may have closed the kept-alive connection
+                connection.close()
+                if attempt or streaming:    # the caller knows how to resume what was written
+                    raise
+
+    def _get_cache_path(self, url):
+        return os.path.join(self.cache_directory, hashlib.sha256(url.encode('utf-8')).hexdigest() + '.json')
+
+    def _load_cached(self, url):
+        try:
+            with open(self._get_cache_path(url)) as fd:
+                return json.load(fd)
+        except (IOError, OSError, ValueError):
+            return None
+
+    def _save_cached(self, url, entry):
+        filepath = self._get_cache_path(url)
+        temporary_path = '{}.{}{}.{}'.format(filepath, TEMPORARY_PREFIX, os.getpid(), current_thread().ident)
+        with open(temporary_path, 'w') as fd:
+            json.dump(entry, fd)
+        if os.name == 'nt' and os.path.exists(filepath):
+            os.remove(filepath)
+        os.rename(temporary_path, filepath)
+
+    def fetch(self, url):
+        """returns a 2-tuple (content, content_type) of url, revalidating the cached response if there is one"""
+        import gzip
+        import io
+        cached = self._load_cached(url)
+        for _ in range(MAX_REDIRECTS):
+            headers = {'Accept': ACCEPT, 'Accept-Encoding': 'gzip'}
+            if cached and cached.get('etag'):
+                headers['If-None-Match'] = cached['etag']
+            status, response_headers, body = self._request(url, headers)
+            response_headers = {key.lower(): value for key, value in response_headers}
+            if status == 304 and cached:
+                logger.debug("{} did not change".format(url))
+                return cached['content'], cached['content_type']
+            if status in (301, 302, 303, 307, 308):
+                url = urljoin(url, response_headers['location'])
+                cached = self._load_cached(url)
+                continue
+            if status == 404:
+                return None, None
+            if status != 200:
+                raise SimpleIndexError("GET {} returned {}".format(url, status))
+            if response_headers.get('content-encoding') == 'gzip':
+                body = gzip.GzipFile(fileobj=io.BytesIO(body)).read()
+            content_type = response_headers.get('content-type', 'text/html')
+            content = body.decode('utf-8', 'replace')
+            if response_headers.get('etag'):
+                self._save_cached(url, dict(etag=response_headers['etag'], content_type=content_type, content=content))
+            return content, content_type
+        raise SimpleIndexError("Too many redirects from {}".format(url))
+
+    def get_project_links(self, name):
+        """returns the ProjectFiles of a project, with their URLs and the digests the index published"""
+        if self.is_local():
+            return self._get_local_project_files(name)
+        url = self.get_project_url(name)
+        content, content_type = self.fetch(url)
+        return [] if content is None else parse_project_files(content, content_type, url)
+
+    def get_project_files(self, name):
+        return [item.filename for item in self.get_project_links(name)]
+
+    def _download(self, url, partial_path):
+        from shutil import copyfile
+        if urlparse(url).scheme in ('', 'file'):
+            copyfile(unquote(urlparse(url).path), partial_path)
+            return
+        for _ in range(MAX_REDIRECTS):
+            offset = os.path.getsize(partial_path) if os.path.exists(partial_path) else 0
+            headers = {'Range': 'bytes={}-'.format(offset)} if offset else {}
+            if offset:
+                logger.debug("Resuming download of {} from byte {}".format(url, offset))
+            # a server that does not support ranges answers 200, and the partial file is overwritten
+            status, response_headers, _ = self._request(
+                url, headers, open_stream=lambda status: open(partial_path, 'ab' if status == 206 else 'wb'))
+            response_headers = {key.lower(): value for key, value in response_headers}
+            if status in (301, 302, 303, 307, 308):
+                url = urljoin(url, response_headers['location'])
+                continue
+            if status == 416 and offset:
+                # the partial file is complete, or it is not a prefix of this file: the digest tells
+                return
+            if status not in (200, 206):
+                raise SimpleIndexError("GET {} returned {}".format(url, status))
+            return
+        raise SimpleIndexError("Too many redirects from {}".format(url))
+
+    def download(self, project_file, dirpath, algorithm=None, expected=None, retries=DOWNLOAD_RETRIES):
+        """downloads a ProjectFile into dirpath on the connection this thread keeps to the host, resuming a partial
+        download. the file is verified against expected, or the digest the index published, before it is renamed
+        into place. returns its path"""
+        from infi.projector.helper.utils.downloads import get_file_hexdigest, PARTIAL_SUFFIX
+        from time import sleep
+        makedirs_if_necessary(dirpath)
+        filepath = os.path.join(dirpath, project_file.filename)
+        partial_path = filepath + PARTIAL_SUFFIX
+        if expected is None:
+            algorithm = next((item for item in HASH_ALGORITHMS if item in project_file.hashes), None)
+            expected = project_file.hashes.get(algorithm)
+        for attempt in range(1, retries + 1):
+            try:
+                self._download(project_file.url, partial_path)
+            except (http_client.HTTPException, IOError, SimpleIndexError) as error:
+                if attempt == retries:
+                    raise SimpleIndexError("Failed to download {}: {}".format(project_file.url, error))
+                logger.debug("Attempt {} to download {} failed: {}".format(attempt, project_file.url, error))
+                sleep(attempt)
+                continue
+            if expected and get_file_hexdigest(partial_path, algorithm) != expected.lower():
+                # a partial file that was not a prefix of this one, or a corrupted transfer: start over
+                os.remove(partial_path)
+                if attempt == retries:
+                    raise SimpleIndexError("The {} digest of {} is not {}".format(algorithm, project_file.url,
+                                                                                  expected))
+                logger.debug("The digest of {} does not match, downloading it again".format(project_file.url))
+                continue
+            if os.name == 'nt' and os.path.exists(filepath):
+                os.remove(filepath)
+            os.rename(partial_path, filepath)
+            return filepath
+
+    def get_versions(self, name):
+        versions = set()
+        for basename in self.get_project_files(name):
+            parsed = parse_filename(basename)
+            if parsed is not None and normalize(parsed[0]) == normalize(name):
+                versions.add(parsed[1])
+        return versions
+
+    def get_versions_of(self, names, concurrency=CONCURRENT_REQUESTS):
+        """returns a dict {name: set of versions or the exception that was raised} fetched concurrently"""
+        return map_concurrently(self.get_versions, names, concurrency)
@@ -0,0 +1,274 @@
+"""renders the infi.recipe.template.version sections (setup.py, __version__.py) without running buildout"""
+from infi.projector.helper.utils import get_buildout_parameters, get_project_path, get_cache_directory
+from infi.projector.helper.utils import TEMPORARY_PREFIX
+from logging import getLogger
+import os
+import re
+
+logger = getLogger(__name__)
+
+RECIPE = "infi.recipe.template.version"
+HOMEPAGE_PROTOCOLS_FILENAME = "homepage-protocols.json"
+HOMEPAGE_PROBE_TIMEOUT = 2
+SECTION_NAME = "infi.recipe.template.version"
+DEFAULT_TEMPLATE = """__version__ = "${infi.recipe.template.version:version}"
+__git_commiter_name__ = "${infi.recipe.template.version:author}"
+__git_commiter_email__ = "${infi.recipe.template.version:author_email}"
+__git_branch__ = ${infi.recipe.template.version:git_local_branch}
+__git_remote_tracking_branch__ = ${infi.recipe.template.version:git_remote_tracking_branch}
+__git_remote_url__ = ${infi.recipe.template.version:git_remote_url}
+__git_head_hash__ = ${infi.recipe.template.version:head_hash}
+__git_head_subject__ = ${infi.recipe.template.version:head_subject}
+__git_head_message__ = ${infi.recipe.template.version:head_message}
+__git_dirty_diff__ = ${infi.recipe.template.version:dirty_diff}
+__git_commit_date__ = ${infi.recipe.template.version:git_commit_date}
+"""
+
+# the same substitution syntax as zc.buildout.buildout.Options
+_template_split = re.compile('([$]{[^}]*})').split
+_valid = re.compile(r'\${[-a-zA-Z0-9 ._]*:[-a-zA-Z0-9 ._]+}$').match
+
+
+class TemplateError(Exception):
+    """the templates cannot be rendered without buildout, e.g. buildout.cfg extends other files"""
+    pass
+
+
+class Sections(object):
+    """raw buildout sections with lazy, recursive ${section:option} substitution"""
+    def __init__(self, raw):
+        super(Sections, self).__init__()
+        self.raw = raw
+        self.cooked = {}
+
+    def get(self, section, option, seen=None):
+        key = (section, option)
+        if key in self.cooked:
+            return self.cooked[key]
+        try:
+            value = self.raw[section][option]
+        except KeyError:
+            raise TemplateError("Referenced option does not exist: {}:{}".format(section, option))
+        seen = seen or []
+        if key in seen:
+            raise TemplateError("Circular reference in substitutions of {}:{}".format(section, option))
+        if '${' in value:
+            seen.append(key)
+            value = '$$'.join([self.substitute(part, section, seen) for part in value.split('$$')])
+            seen.pop()
+        self.cooked[key] = value
+        return value
+
+    def substitute(self, template, current_section, seen=None):
+        parts = _template_split(template)
+        substitutions = []
+        for reference in parts[1::2]:
+            if not _valid(reference):
+                raise TemplateError("Invalid substitution {}".format(reference))
+            section, option = reference[2:-1].split(':')
+            substitutions.append(self.get(section or current_section, option, seen))
+        substitutions.append('')
+        return ''.join([''.join(pair) for pair in zip(parts[::2], substitutions)])
+
+
+def _strip_mako_characters(text):
+    for key, value in [('${', '$\\{'), ('%', '%%'), ('<%', '<\\%'), ('##', '#\\#')]:
+        text = text.replace(key, value)
+    return text
+
+
+def _get_homepage_protocol(fqdn):
+    """returns https if the git host serves https, like the recipe does. the answer is kept per host in the host cache
+    directory, so rendering does not wait for the network again"""
+    from six.moves.urllib.request import urlopen
+    import json
+    filepath = os.path.join(get_cache_directory(), HOMEPAGE_PROTOCOLS_FILENAME)
+    try:
+        with open(filepath) as fd:
+            protocols = json.load(fd)
+    except (IOError, OSError, ValueError):
+        protocols = {}
+    if fqdn in protocols:
+        return protocols[fqdn]
+    try:
+        urlopen("https://{0}".format(fqdn), timeout=HOMEPAGE_PROBE_TIMEOUT).close()
+        protocols[fqdn] = 'https'
+    except Exception as error:
+        protocols[fqdn] = 'https' if 'SSL' in type(getattr(error, 'reason', error)).__name__ else 'http'
+    temporary_path = '{}.{}{}'.format(filepath, TEMPORARY_PREFIX, os.getpid())
+    try:
+        with open(temporary_path, 'w') as fd:
+            json.dump(protocols, fd)
+        if os.name == 'nt' and os.path.exists(filepath):
+            os.remove(filepath)
+        os.rename(temporary_path, filepath)
+    except (IOError, OSError) as error:
+        logger.debug("Failed to save {}: {}".format(filepath, error))
+    return protocols[fqdn]
+
+
+def _translate_clone_url_to_homepage(url):
+    pattern = r"(?P<protocol>(?:git@|git:\/\/))(?P<origin_fqdn>[a-zA-Z0-9_\-.]+)[:\/]{1,2}" + \
+              r"(?P<repository_uri>[a-zA-Z0-9_\-\.\/]+)(?:.git)+$"
+    match = re.match(pattern, url or '')
+    if match is None:
+        return None
+    groupdict = match.groupdict()
+    return "{0}://{1}/{2}".format(_get_homepage_protocol(groupdict['origin_fqdn']), groupdict['origin_fqdn'],
+                                  groupdict['repository_uri'])
+
+
+def get_version_section(homepage=None):
+    """returns the options the recipe adds in its [infi.recipe.template.version] section"""
+    from infi.gitpy import LocalRepository
+    from infi.gitpy.exceptions import NonexistentRefException
+    from infi.os_info import get_version_from_git
+    from subprocess import check_output
+    from datetime import datetime
+    if os.path.realpath(get_project_path(os.curdir)) != os.path.realpath(os.curdir):
+        raise TemplateError("infi.os_info reads the version from the git repository in the current directory")
+    repository = LocalRepository(get_project_path(os.curdir))
+    branch = repository.getCurrentBranch()
+    try:
+        remote = branch.getRemoteBranch() if branch is not None else None
+    except NonexistentRefException:
+        remote = None
+    head = repository.getHead()
+    if homepage is None:
+        try:
+            homepage = _translate_clone_url_to_homepage(repository.getRemoteByName("origin").url)
+        except NonexistentRefException:
+            homepage = None
+    diff = check_output(["git", "diff", "--patch", "--no-color"], cwd=get_project_path(os.curdir)).decode("utf-8")
+    return dict(
+        version=get_version_from_git().lstrip('v'),
+        author=head.getAuthorName(),
+        author_email=head.getAuthorEmail(),
+        git_local_branch=repr(branch.name if branch is not None else '(Not currently on any branch)'),
+        git_remote_tracking_branch=repr(remote.getNormalizedName() if remote is not None else '(No remote tracking)'),
+        git_remote_url=repr(remote.remote.url if remote is not None else '(Not remote tracking)'),
+        head_subject=repr(_strip_mako_characters(head.getSubject())),
+        head_message=repr(_strip_mako_characters(head.getMessageBody())),
+        head_hash=repr(head.hash),
+        git_commit_date=repr(datetime.fromtimestamp(head.getDate()).isoformat(' ')),
+        dirty_diff=repr(_strip_mako_characters(diff)),
+        homepage=repr(homepage),
+    )
+
+
+_section_header = re.compile(r'^\[\s*(?P<name>[^\s[\]:{}]+)\s*(:.*)?\]\s*([#;].*)?$').match
+_option_start = re.compile(r'^(?P<name>[^\s{}[\]=:]+\s*[-+]?)\s*[:=]\s*(?P<value>.*)$').match
+_leading_blank_lines = re.compile(r"^(\s*\n)+")
+
+
+def _parse(fd):
+    """the same parsing as zc.buildout.configparser.parse, for when buildout is not installed: continuation lines
+    of values that start on the line after the option name keep their relative indentation and blank lines"""
+    from textwrap import dedent
+    sections, section, name, blockmode = {}, None, None, False
+    for line in fd:
+        if line[0] in '#;':
+            continue
+        if line[0].isspace() and section is not None and name:
+            if blockmode:
+                line = line.rstrip()
+            else:
+                line = line.strip()
+                if not line:
+                    continue
+            section[name] = "{}\n{}".format(section[name], line)
+            continue
+        match = _section_header(line)
+        if match:
+            section, name = sections.setdefault(match.group('name'), {}), None
+            continue
+        match = _option_start(line.rstrip()) if section is not None else None
+        if match:
+            name, value = match.group('name').rstrip(), match.group('value').strip()
+            section[name], blockmode = value, not value
+        elif line.strip():
+            raise TemplateError("Cannot parse line {!r}".format(line))
+    for options in sections.values():
+        for name, value in options.items():
+            if value[:1].isspace():
+                options[name] = _leading_blank_lines.sub('', dedent(value.rstrip()))
+    return sections
+
+
+def read_buildout_sections(filepath="buildout.cfg"):
+    with open(get_project_path(filepath)) as fd:
+        try:
+            from zc.buildout.configparser import parse
+        except ImportError:
+            raw = _parse(fd)
+        else:
+            raw = parse(fd, filepath)
+    if 'extends' in raw.get('buildout', {}):
+        raise TemplateError("{} extends other configuration files".format(filepath))
+    for section, options in raw.items():
+        if any(option.endswith(('+', '-')) for option in options):
+            raise TemplateError("Section {} adds or removes values with += or -=".format(section))
+    for parameter in get_buildout_parameters():
+        # command-line assignments, e.g. buildout:develop=
+        match = re.match(r'^([^:=\s]+):([^=\s]+)=(.*)$', parameter)
+        if match:
+            raw.setdefault(match.group(1), {})[match.group(2)] = match.group(3)
+    raw.setdefault('buildout', {}).setdefault('directory', os.path.abspath(get_project_path(os.curdir)))
+    return raw
+
+
+def render_template(sections, name):
+    """returns a 2-tuple (content, mode) of the output of a template section"""
+    options = sections.raw[name]
+    if 'inline' in options:
+        source, mode = options['inline'].lstrip(), None
+    elif 'input' in options:
+        path = get_project_path(sections.get(name, 'input'))
+        if os.path.exists(path):
+            with open(path) as fd:
+                source = fd.read()
+            mode = os.stat(path).st_mode & 0o7777
+        elif sections.get(name, 'input').startswith('inline:'):
+            source, mode = sections.get(name, 'input')[len('inline:'):].lstrip(), None
+        else:
+            raise TemplateError("Input file '{}' does not exist".format(path))
+    else:
+        source, mode = DEFAULT_TEMPLATE, None
+    if 'mode' in options:
+        mode = int(options['mode'], 8)
+    # like collective.recipe.template, ${option} is short for ${section:option}
+    source = re.sub(r"\$\{([^:]+?)\}", r"${%s:\1}" % name, source)
+    return sections.substitute(source, name), mode
+
+
+def write_if_changed(path, content, mode=None):
+    """writes content to path, unless it already has exactly this content. returns True if it wrote"""
+    data = content.encode('utf-8')
+    if os.path.exists(path):
+        with open(path, 'rb') as fd:
+            if fd.read() == data:
+                logger.debug("{} is up to date".format(path))
+                return False
+    elif os.path.dirname(path) and not os.path.isdir(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    with open(path, 'wb') as fd:
+        fd.write(data)
+    if mode is not None:
+        os.chmod(path, mode)
+    logger.info("Wrote {}".format(path))
+    return True
+
+
+def render_version_templates(filepath="buildout.cfg"):
+    """renders every infi.recipe.template.version section, and returns the outputs that were (re)written"""
+    raw = read_buildout_sections(filepath)
+    names = [name for name, options in sorted(raw.items()) if options.get('recipe', '').startswith(RECIPE)]
+    if not names:
+        return []
+    if SECTION_NAME in raw:
+        raise TemplateError("buildout.cfg defines its own {} section".format(SECTION_NAME))
+    sections = Sections(raw)
+    homepage = sections.get('project', 'homepage') if raw.get('project', {}).get('homepage') else None
+    raw[SECTION_NAME] = get_version_section(homepage)
+    rendered = [(get_project_path(sections.get(name, 'output')),) + render_template(sections, name) for name in names]
+    return [path for path, content, mode in rendered if write_if_changed(path, content, mode)]
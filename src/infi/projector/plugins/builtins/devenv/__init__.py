@@ -1,10 +1,10 @@
 from contextlib import contextmanager
 from infi.projector.plugins import CommandPlugin
 from infi.projector.helper import assertions, utils
-from infi.projector.helper.utils import configparser
+from infi.projector.helper.utils import configparser, shared_eggs
 from infi.os_info import get_platform_string
 from logging import getLogger
-from six.moves.urllib.request import urlopen, urlretrieve
+from six.moves.urllib.request import urlopen
 import os
 import json
 import tarfile
@@ -16,23 +16,46 @@ TOOLKIT_SUFFIX = 'tar.gz'
 REPO_URL = os.path.join('ftp://repo.lab.il.infinidat.com', 'packages', 'main-stable', 'python', TOOLKIT_PREFIX)
 INFINIDAT_PATH = os.path.join(os.path.sep, 'opt', 'infinidat')
 TOOLKIT_PATH = os.path.join(INFINIDAT_PATH, TOOLKIT_PREFIX)
-BIN_PATH = os.path.join(TOOLKIT_PATH, 'bin')
+TOOLKIT_INDEX_FILENAME = 'toolkit-index.json'
+TOOLKITS_PATH = os.path.join(INFINIDAT_PATH, 'toolkits')
+TOOLKIT_MANIFEST_FILENAME = 'manifest.json'
+TOOLKIT_REFERENCES_DIRNAME = 'refs'
+TOOLKIT_LOCK_FILENAME = '.lock'
+TOOLKIT_INDEX_TTL = 24 * 60 * 60
+# the first setuptools that reads DIST_EXTRA_CONFIG, older ones ignore it
+# reference: https://setuptools.pypa.io/en/latest/history.html#v62-6-0
+DIST_EXTRA_CONFIG_SETUPTOOLS_VERSION = '62.6'
+ISOLATED_PYTHON_KEY_FILENAME = '.projector-isolated-python'
 
 USAGE = """
 Usage:
-    projector devenv build [--clean] [--force-bootstrap] [--no-submodules] [--no-setup-py] [--no-js-requirements] [--no-scripts] [--use-isolated-python] [[--newest] | [--offline] | [--prefer-final]]
+    projector devenv build [--clean] [--force-bootstrap] [--no-submodules] [--no-setup-py] [--no-js-requirements] [--no-scripts] [--use-isolated-python] [--shared-eggs] [--from-lock] [--mirror] [--ccache] [--jobs=N] [--refresh-toolkit-index] [[--newest] | [--offline] | [--prefer-final]]
     projector devenv relocate ([--absolute] | [--relative]) [--commit-changes]
     projector devenv pack
+    projector devenv wheelhouse
+    projector devenv prefetch [--use-isolated-python]
 
 Options:
     devenv build            use this command to generate setup.py and the console scripts
     devenv relocate         use this command to switch from relative and absolute paths in the console scripts
     devenv pack             create a package, e.g. deb/rpm/msi
+    devenv wheelhouse       build wheels of the frozen dependencies once per isolated python version and platform
+    devenv prefetch         download the frozen dependencies (or install_requires, if not frozen) to the download cache
     --clean                 clean build-related files and directories before building
     --force-bootstrap       run buildout bootstrap even if the buildout script already exists
     --no-submodules         do not clone git sub-modules defined in buildout.cfg
     --no-scripts            do not install the dependent packages, nor create the console scripts. just create setup.py
     --use-isolated-python   do not use global system python in console scripts, use Infinidat's isolated python builds
+    --refresh-toolkit-index  fetch the list of toolkits even if the cached one is fresh, and install the latest toolkit
+    --shared-eggs           install each egg once in a store shared by all projects, and link the frozen versions from it
+                            to the eggs directory
+    --from-lock             install the frozen versions from the download cache in parallel, without resolving them,
+                            and let buildout only generate the scripts
+    --mirror                update the simple index of the download cache (see `projector mirror build`) and install
+                            from it instead of the package index
+    --ccache                compile native extensions with ccache, using a cache shared by all projects on this host
+    --jobs=N                compile native extensions with N parallel jobs (make, cmake and setuptools build_ext).
+                            build_ext runs in parallel only with setuptools>=62.6, older versions build serially
     --newest                always check for new package version on PyPI
     --offline               install packages only from download cache (no internet connection)
     --absolute              change the paths in the development environment to absolute paths
@@ -53,18 +76,22 @@ class DevEnvPlugin(CommandPlugin):
         return 'devenv'
 
     def get_methods(self):
-        return [self.build, self.relocate, self.pack]
+        return [self.build, self.relocate, self.pack, self.wheelhouse, self.prefetch]
 
     @assertions.requires_repository
     def pre_command_assertions(self):
         self.env = self.install_toolkit_if_necessary()
+        if self.arguments.get("--ccache", False):
+            self.env = dict(self.env or {}, **self.get_ccache_env())
+        if self.arguments.get("--jobs"):
+            self.env = dict(self.env or {}, **self.get_parallel_build_env(self.arguments["--jobs"]))
+            self._warn_if_build_ext_is_not_parallel()
 
     def create_cache_directories(self):
+        from infi.projector.helper.utils.mirror import get_download_cache
         from os import makedirs
-        from os.path import join, exists
-        with utils.open_buildout_configfile() as buildout:
-            cachedir = buildout.get("buildout", "download-cache")
-        cache_dist = join(cachedir, "dist")
+        from os.path import exists
+        cache_dist = os.path.join(get_download_cache(), "dist")
         if not exists(cache_dist):
             makedirs(cache_dist)
 
@@ -78,23 +105,19 @@ class DevEnvPlugin(CommandPlugin):
             return "https://pypi.python.org/simple"
 
     def bootstrap_if_necessary(self):
-        from os.path import join, split
+        from os.path import join, split, isfile
         from os import name
         from sys import argv
         from pkg_resources import resource_filename
         from infi.projector.plugins.builtins.repository import skeleton
-        buildout_executable_exists = assertions.is_executable_exists(join("bin", "buildout"))
+        buildout_executable_exists = assertions.is_executable_exists(utils.get_project_path("bin", "buildout"))
         if not buildout_executable_exists or self.arguments.get("--force-bootstrap", False) or self.arguments.get("--newest", False):
-            try:
-                return utils.execute_assert_success([utils.get_executable('buildout'), 'bootstrap'])
-            except OSError:  # workaround for OSX
-                pass
-            try:
-                utils.execute_assert_success(['buildout', 'bootstrap'])
-            except OSError:
-                dirname, basename = split(argv[0])
-                buildout = join(dirname, 'buildout.exe' if name == 'nt' else 'buildout')
-                utils.execute_assert_success([buildout, 'bootstrap'])
+            dirname, basename = split(argv[0])
+            candidates = [utils.get_executable('buildout'),     # not there on OSX
+                          utils.find_executable('buildout.exe' if name == 'nt' else 'buildout'),
+                          join(dirname, 'buildout.exe' if name == 'nt' else 'buildout')]
+            buildout = next((candidate for candidate in candidates if candidate and isfile(candidate)), candidates[-1])
+            utils.execute_assert_success([buildout, 'bootstrap'])
 
     def install_sections_by_recipe(self, recipe, stripped=True):
         with utils.open_buildout_configfile() as buildout:
@@ -117,6 +140,12 @@ class DevEnvPlugin(CommandPlugin):
             self.install_sections_by_recipe('infi.recipe.js_requirements')
 
     def create_setup_py(self):
+        from infi.projector.helper.utils.version_templates import render_version_templates, TemplateError
+        try:
+            render_version_templates()
+            return
+        except TemplateError as error:
+            logger.debug("Rendering templates with buildout: %s", error)
         with utils.buildout_parameters_context(['buildout:develop=']):
             self.install_sections_by_recipe("infi.recipe.template.version")
 
@@ -128,8 +157,187 @@ class DevEnvPlugin(CommandPlugin):
                         and not buildout.get(section, "recipe").endswith(":pack")]
         return sections[0]
 
+    def get_isolated_python_version(self):
+        with utils.open_buildout_configfile() as buildout:
+            return buildout.get(self.get_isolated_python_section_name(), 'version')
+
+    def get_isolated_python_key(self):
+        return '{}-{}'.format(self.get_isolated_python_version(), get_platform_string())
+
+    def get_wheelhouse_directory(self):
+        return utils.get_cache_directory('wheelhouse', self.get_isolated_python_key())
+
+    @contextmanager
+    def wheelhouse_context(self):
+        # wheels in the wheelhouse are built for the isolated python, so they are useless for the global python
+        if not self.arguments.get("--use-isolated-python", False):
+            yield
+            return
+        wheelhouse = self.get_wheelhouse_directory()
+        if not os.listdir(wheelhouse):
+            yield
+            return
+        with utils.open_buildout_configfile() as buildout:
+            find_links = buildout.get("buildout", "find-links") if buildout.has_option("buildout", "find-links") else ''
+        with utils.buildout_parameters_context(["buildout:find-links={}".format(' '.join([wheelhouse] + find_links.split()))]):
+            yield
+
+    @contextmanager
+    def mirror_context(self):
+        if not self.arguments.get("--mirror", False):
+            yield
+            return
+        from infi.projector.helper.utils.mirror import build_mirror, get_mirror_url
+        build_mirror()
+        index_url = get_mirror_url()
+        logger.info("Installing from the simple index of the download cache, {}".format(index_url))
+        # buildout reads its index from the parameters, pip (bootstrap and the isolated python) from the environment
+        env = dict(utils.get_execution_context().env, PIP_INDEX_URL=index_url)
+        with utils.buildout_parameters_context(["buildout:index={}".format(index_url)]), \
+                utils.execution_context(env=env):
+            yield
+
+    def get_host_target(self):
+        """the resolver Target of the interpreter the console scripts use"""
+        from infi.projector.helper.utils.resolver import get_host_target
+        use_isolated_python = self.arguments.get('--use-isolated-python', False) or assertions.is_isolated_python_exists()
+        return get_host_target(self.get_isolated_python_version() if use_isolated_python else None)
+
+    def get_versions_section(self):
+        """the section with the frozen versions for this host: its [versions-<target>] from `requirements freeze
+        --matrix` if there is one, otherwise [versions]"""
+        section = utils.get_matrix_versions_section(self.get_host_target().get_key())
+        with utils.open_buildout_configfile() as buildout:
+            return section if buildout.has_section(section) else "versions"
+
+    @contextmanager
+    def versions_matrix_context(self):
+        section = self.get_versions_section()
+        if section == "versions" or any(parameter.startswith("buildout:versions=")
+                                        for parameter in utils.get_buildout_parameters()):
+            yield
+            return
+        logger.info("Using the versions frozen in [{}]".format(section))
+        with utils.buildout_parameters_context(["buildout:versions={}".format(section)]):
+            yield
+
+    def get_ccache_env(self):
+        from tempfile import gettempdir
+        ccache = utils.find_executable('ccache', (self.env or {}).get('PATH'))
+        if ccache is None:
+            logger.warning("ccache was not found in PATH, native extensions will be compiled without it")
+            return {}
+        return dict(
+            CC='{} {}'.format(ccache, os.environ.get('CC', 'gcc')),
+            CXX='{} {}'.format(ccache, os.environ.get('CXX', 'g++')),
+            CCACHE_DIR=utils.get_cache_directory('ccache'),
+            # easy_install builds every egg in a new temporary directory, paths under it are hashed as relative paths
+            # reference: https://ccache.dev/manual/latest.html#config_base_dir
+            CCACHE_BASEDIR=gettempdir(),
+            CCACHE_NOHASHDIR='1',
+        )
+
+    def get_parallel_build_env(self, jobs):
+        if not str(jobs).isdigit() or int(jobs) < 1:
+            logger.error("--jobs expects a positive number, got {!r}".format(jobs))
+            raise SystemExit(1)
+        jobs = int(jobs)
+        env = dict(
+            # make-based builds, including the autoconf builds that run configure with the toolkit shell
+            MAKEFLAGS=' '.join(['-j{}'.format(jobs)] + os.environ.get('MAKEFLAGS', '').split()),
+            # reference: https://cmake.org/cmake/help/latest/envvar/CMAKE_BUILD_PARALLEL_LEVEL.html
+            CMAKE_BUILD_PARALLEL_LEVEL=str(jobs),
+            # reference: https://numpy.org/doc/1.21/user/building.html#parallel-builds
+            NPY_NUM_BUILD_JOBS=str(jobs),
+        )
+        if 'DIST_EXTRA_CONFIG' in os.environ:
+            logger.debug("DIST_EXTRA_CONFIG is already set, not setting build_ext parallelism")
+            return env
+        # setuptools reads options from this file in addition to setup.cfg, equivalent to build_ext --parallel N
+        # reference: https://setuptools.pypa.io/en/latest/deprecated/distutils/configfile.html
+        config_path = os.path.join(utils.get_cache_directory('build-ext'), 'parallel-{}.cfg'.format(jobs))
+        if not os.path.exists(config_path):
+            with open(config_path, 'w') as fd:
+                fd.write('[build_ext]\nparallel = {}\n'.format(jobs))
+        env['DIST_EXTRA_CONFIG'] = config_path
+        return env
+
+    def _warn_if_build_ext_is_not_parallel(self):
+        from pkg_resources import parse_version
+        version = dict(self._get_isolated_python_requirements()).get('setuptools')
+        if version and parse_version(version) < parse_version(DIST_EXTRA_CONFIG_SETUPTOOLS_VERSION):
+            logger.warning("setuptools {} ignores DIST_EXTRA_CONFIG, --jobs does not apply to build_ext "
+                           "(setuptools>={} is required)".format(version, DIST_EXTRA_CONFIG_SETUPTOOLS_VERSION))
+
+    def get_ccache_statistics(self):
+        from infi.execute import execute
+        if not self.arguments.get("--ccache", False):
+            return None
+        ccache = utils.find_executable('ccache', (self.env or {}).get('PATH'))
+        if ccache is None:
+            return None
+        result = execute([ccache, '--print-stats'], env=utils.get_environ(self.env))
+        if result.get_returncode() != 0:
+            logger.debug("Failed to get ccache statistics: %s", result.get_stderr())
+            return None
+        statistics = {}
+        for line in result.get_stdout().decode().splitlines():
+            fields = line.split()
+            if len(fields) == 2 and fields[1].isdigit():
+                statistics[fields[0]] = int(fields[1])
+        return statistics
+
+    @contextmanager
+    def ccache_statistics_context(self):
+        before = self.get_ccache_statistics()
+        yield
+        after = self.get_ccache_statistics()
+        if before is None or after is None:
+            return
+        difference = {key: value - before.get(key, 0) for key, value in after.items()}
+        hits = difference.get('direct_cache_hit', 0) + difference.get('preprocessed_cache_hit', 0)
+        misses = difference.get('cache_miss', 0)
+        logger.info("ccache: {} hits, {} misses".format(hits, misses))
+
+    def get_local_distribution_directories(self):
+        """the directories buildout finds distributions in without downloading"""
+        with utils.open_buildout_configfile() as buildout:
+            directories = [utils.get_project_path(buildout.get("buildout", "download-cache"), "dist")]
+            if buildout.has_option("buildout", "find-links"):
+                directories.extend(utils.get_project_path(item) for item in buildout.get("buildout", "find-links").split()
+                                   if '://' not in item)
+        if self.arguments.get("--use-isolated-python", False):
+            directories.append(self.get_wheelhouse_directory())
+        return directories
+
+    def install_frozen_versions(self):
+        from infi.projector.helper.utils.installers import get_installer, InstallError
+        from infi.projector.helper.utils.lockfile import read_lock
+        section = self.get_versions_section()
+        with utils.open_buildout_configfile() as buildout:
+            frozen = buildout.has_section(section)
+            project_name = buildout.get("project", "name")
+            pins = [(name, version) for name, version in buildout.items(section)
+                    if utils.normalize(name) != utils.normalize(project_name)] if frozen else []
+        if not frozen:
+            logger.error("Dependencies are not frozen, run `projector requirements freeze` first")
+            raise SystemExit(1)
+        python = utils.get_isolated_executable('python') if self.arguments.get("--use-isolated-python", False) \
+            else utils.get_python_interpreter()
+        try:
+            installer = get_installer('eggs', python, self.get_local_distribution_directories(),
+                                      shared_eggs.get_eggs_directory(), lock=read_lock())
+            installed = installer.install_pinned(pins)
+        except InstallError as error:
+            logger.error("{}\nRun `projector devenv build` without --from-lock".format(error))
+            raise SystemExit(1)
+        logger.info("Installed {} frozen distributions".format(len(installed)))
+
     def create_scripts(self):
         additional_options = ["buildout:prefer-final=true"] if self.arguments.get("--prefer-final") else []
+        if self.arguments.get("--from-lock", False) and not self.arguments.get("--newest", False):
+            # everything is in the eggs directory, there is nothing to look for in the index
+            additional_options.append("buildout:newest=false")
         with utils.buildout_parameters_context(additional_options):
             self.install_sections_by_recipe("infi.recipe.console_scripts")
 
@@ -142,11 +350,12 @@ class DevEnvPlugin(CommandPlugin):
         from os.path import exists
         from os import remove
         from shutil import rmtree
-        directories_to_clean = ['bin', 'eggs', 'develop-eggs', 'parts', '.cache']
-        files_to_clean = ['setup.py']
+        directories_to_clean = [utils.get_project_path(dirname)
+                                for dirname in ['bin', 'eggs', 'develop-eggs', 'parts', '.cache']]
+        files_to_clean = [utils.get_project_path('setup.py')]
         [remove(filename) for filename in files_to_clean if exists(filename)]
         [rmtree(dirname) for dirname in directories_to_clean if exists(dirname)]
-        self._remove_files_of_type_recursively("src", "pyc")
+        self._remove_files_of_type_recursively(utils.get_project_path("src"), "pyc")
 
     @contextmanager
     def buildout_newest_or_offline_context(self):
@@ -167,7 +376,7 @@ class DevEnvPlugin(CommandPlugin):
                 develop_eggs_dir = buildout.get("buildout", "develop-eggs-directory")
             except (configparser.NoSectionError, configparser.NoOptionError):
                 develop_eggs_dir = "develop-eggs"
-            setuptools_egg_link = os.path.join(develop_eggs_dir, "setuptools.egg-link")
+            setuptools_egg_link = utils.get_project_path(develop_eggs_dir, "setuptools.egg-link")
             if os.path.exists(setuptools_egg_link):
                 os.remove(setuptools_egg_link)
 
@@ -182,68 +391,183 @@ class DevEnvPlugin(CommandPlugin):
             name = "get-pip3.py"
         else:
             name = "get-pip2.py"
-        get_pip_py = resource_filename(skeleton.__name__, name)
-        with open("get-pip.py", "w") as dst:
-            with open(get_pip_py) as src:
-                dst.write(src.read())
-
-    def _install_setuptools_and_zc_buildout(self):
-        from os.path import join, exists
-        from os import environ, remove
+        return resource_filename(skeleton.__name__, name)
+
+    def _get_isolated_python_site_packages(self):
+        from glob import glob
+        return glob(utils.get_project_path('parts', 'python', 'lib*', 'python*', 'site-packages')) + \
+            glob(utils.get_project_path('parts', 'python', 'Lib', 'site-packages'))
+
+    def _get_isolated_python_installed_versions(self):
+        from infi.projector.helper.utils.distributions import parse_filename
+        installed_versions = dict()
+        for site_packages in self._get_isolated_python_site_packages():
+            for basename in os.listdir(site_packages):
+                if basename.endswith('.dist-info') or basename.endswith('.egg-info'):
+                    parsed = basename.rsplit('.', 1)[0].split('-')[:2]
+                else:
+                    parsed = parse_filename(basename)
+                if parsed and len(parsed) == 2:
+                    installed_versions[utils.normalize(parsed[0])] = parsed[1]
+        return installed_versions
 
+    def _get_isolated_python_requirements(self):
+        # in case dependencies are frozen, we need to use the frozen version of setuptools and zc.buildout
+        requirements = []
+        section = self.get_versions_section()
+        with utils.open_buildout_configfile() as buildout:
+            for package in ['setuptools', 'zc.buildout', 'pip']:
+                version = buildout.get(section, package) if buildout.has_option(section, package) else None
+                requirements.append((package, version))
+        return requirements
+
+    def _get_unsatisfied_isolated_python_requirements(self):
+        installed_versions = self._get_isolated_python_installed_versions()
+        requirements = self._get_isolated_python_requirements()
+        newest = self.arguments.get("--newest", False)
+        return ['{}=={}'.format(package, version) if version else package for package, version in requirements
+                if newest or installed_versions.get(utils.normalize(package)) is None or
+                version not in (None, installed_versions.get(utils.normalize(package)))]
+
+    def _install_setuptools_and_zc_buildout(self, packages):
         with utils.open_buildout_configfile() as buildout:
             cachedir = buildout.get("buildout", "download-cache")
-        cache_dist = join(cachedir, "dist")
+        cache_dist = utils.get_project_path(cachedir, "dist")
 
-        cmd = []
-        packages = []
+        env = utils.get_environ(dict(PYTHONPATH=''))
+        python = utils.get_isolated_executable('python')
+        if 'pip' in self._get_isolated_python_installed_versions():
+            installer = [python, '-m', 'pip', 'install']
+        else:
+            installer = [python, self._get_pip()]
+        # get-pip.py always upgrades, pip install does not upgrade unpinned packages that are already installed
+        upgrade = ['--upgrade'] if self.arguments.get("--newest", False) else []
+        utils.execute_assert_success(installer + upgrade + ['--upgrade-strategy=only-if-needed',
+                                                            '--prefix=%s' % utils.get_project_path('parts', 'python')] + packages,
+                                     env=env)
+        utils.execute_assert_success([python, '-m', 'pip', 'download', '--dest', cache_dist] + packages, env=env)
+
+    def _get_isolated_python_store_path(self):
+        return os.path.join(utils.get_cache_directory('isolated-python'), self.get_isolated_python_key())
+
+    def _get_installed_isolated_python_key(self):
+        filepath = utils.get_project_path('parts', 'python', ISOLATED_PYTHON_KEY_FILENAME)
+        if not os.path.exists(filepath):
+            return None
+        with open(filepath) as fd:
+            return fd.read().strip()
 
-        # in case dependencies are frozen, we need to use the frozen version of setuptools and zc.buildout
-        with utils.open_buildout_configfile() as buildout:
-            for package in ['setuptools', 'zc.buildout', 'pip']:
-                if buildout.has_option("versions", package):
-                    packages += ['{}=={}'.format(package, buildout.get("versions", package))]
-                else:
-                    packages += [package]
+    def _set_installed_isolated_python_key(self, key):
+        with open(utils.get_project_path('parts', 'python', ISOLATED_PYTHON_KEY_FILENAME), 'w') as fd:
+            fd.write(key)
 
-        env = environ.copy()
-        env['PYTHONPATH'] = ''
-        for package in packages:
-            utils.execute_assert_success([utils.get_isolated_executable('python'), 'get-pip.py', '--upgrade-strategy=only-if-needed', '--prefix=%s' % join('parts', 'python'), package], env=env)
-        remove('get-pip.py')
-        utils.execute_assert_success([utils.get_isolated_executable('python'), '-m', 'pip', 'download', '--dest', cache_dist] + packages, env=env)
+    def _forget_installed_isolated_python_part(self):
+        # infi.recipe.python does nothing on update, so buildout has to think that the part was never installed
+        section = self.get_isolated_python_section_name()
+        installed = configparser.RawConfigParser()
+        installed.optionxform = str
+        installed.read(utils.get_project_path('.installed.cfg'))
+        if not installed.has_section(section):
+            return
+        installed.remove_section(section)
+        if installed.has_option('buildout', 'parts'):
+            parts = [part for part in installed.get('buildout', 'parts').split() if part != section]
+            installed.set('buildout', 'parts', ' '.join(parts))
+        with open(utils.get_project_path('.installed.cfg'), 'w') as fd:
+            installed.write(fd)
+
+    def _is_modified_in_place(self, relpath):
+        # pip installs into site-packages and the scripts directory and may rewrite files there in place, which
+        # must not change the pristine copy in the store through a hard link
+        names = relpath.split(os.sep)
+        return 'site-packages' in names or (names[0] in ('bin', 'Scripts') and not names[-1].startswith('python'))
+
+    def link_isolated_python_from_store(self):
+        store_path = self._get_isolated_python_store_path()
+        if not os.path.isdir(store_path):
+            return False
+        logger.info("Switching isolated python to {}".format(self.get_isolated_python_key()))
+        utils.makedirs_if_necessary(utils.get_project_path('parts'))
+        utils.link_tree_atomically(store_path, utils.get_project_path('parts', 'python'), replace=True,
+                                   should_copy=self._is_modified_in_place)
+        self._set_installed_isolated_python_key(self.get_isolated_python_key())
+        return True
+
+    def _install_isolated_python_with_buildout(self):
+        python_dir = utils.get_project_path('parts', 'python')
+        key = self.get_isolated_python_key()
+        if os.path.lexists(python_dir) and self._get_installed_isolated_python_key() != key:
+            utils.remove_tree_or_file(python_dir)
+            self._forget_installed_isolated_python_part()
+        installed_before = assertions.is_isolated_python_exists()
+        with utils.buildout_parameters_context(['buildout:develop=', 'buildout:versions=no', 'no:key=value']):
+            # the isolated python may be the interpreter we are running on, so it is not replaced in-process
+            utils.execute_with_buildout("install {}".format(self.get_isolated_python_section_name()), in_process=False)
+        if not installed_before:
+            # keep a pristine copy, before pip and friends are installed into site-packages
+            utils.link_tree_atomically(python_dir, self._get_isolated_python_store_path(),
+                                       should_copy=self._is_modified_in_place)
+        self._set_installed_isolated_python_key(key)
 
     def install_isolated_python_if_necessary(self):
-        from os import environ
         if not self.arguments.get("--use-isolated-python", False):
             return
         self._remove_setuptools_egg_link()
-        if not assertions.is_isolated_python_exists() or self.arguments.get("--newest", False):
-            with utils.buildout_parameters_context(['buildout:develop=', 'buildout:versions=no', 'no:key=value']):
-                utils.execute_with_buildout("install {}".format(self.get_isolated_python_section_name()))
-        self._get_pip()
-        self._install_setuptools_and_zc_buildout()
-        env = environ.copy()
-        env['PYTHONPATH'] = ''
+        key = self.get_isolated_python_key()
+        installed_key = self._get_installed_isolated_python_key()
+        if installed_key is None and assertions.is_isolated_python_exists():
+            # installed before projector kept track of the isolated python version
+            installed_key = key
+            self._set_installed_isolated_python_key(key)
+        if self.arguments.get("--newest", False):
+            self._install_isolated_python_with_buildout()
+        elif installed_key != key and not self.link_isolated_python_from_store():
+            self._install_isolated_python_with_buildout()
+        packages = self._get_unsatisfied_isolated_python_requirements()
+        if packages:
+            self._install_setuptools_and_zc_buildout(packages)
+        elif assertions.is_executable_exists(utils.get_project_path("bin", "buildout")) and \
+                assertions.is_buildout_executable_using_isolated_python() and \
+                not self.arguments.get("--force-bootstrap", False):
+            logger.debug("Isolated python already has setuptools, zc.buildout and pip, skipping bootstrap")
+            return
+        env = utils.get_environ(dict(PYTHONPATH=''))
         utils.execute_assert_success([utils.get_isolated_executable('buildout'), 'bootstrap'], env=env)
 
     def build(self):
         if self.arguments.get("--clean", False):
             self.clean_build()
         elif self.arguments.get("--newest", False):
-            self._remove_files_of_type_recursively("src", "pyc")
+            self._remove_files_of_type_recursively(utils.get_project_path("src"), "pyc")
         self.create_cache_directories()
-        self.bootstrap_if_necessary()
-        with self.buildout_newest_or_offline_context():
-            self.install_isolated_python_if_necessary()
+        with self.mirror_context():
+            self._build()
+
+    def _build(self):
+        with utils.stage_context("bootstrap"):
+            self.bootstrap_if_necessary()
+        with self.buildout_newest_or_offline_context(), self.wheelhouse_context(), self.ccache_statistics_context(), \
+                self.versions_matrix_context():
+            with utils.stage_context("isolated-python"):
+                self.install_isolated_python_if_necessary()
             if not self.arguments.get("--no-submodules", False):
-                self.submodule_update()
+                with utils.stage_context("submodules"):
+                    self.submodule_update()
             if not self.arguments.get("--no-setup-py", False):
-                self.create_setup_py()
+                with utils.stage_context("setup-py"):
+                    self.create_setup_py()
             if not self.arguments.get("--no-scripts", False):
-                self.create_scripts()
+                with utils.stage_context("scripts"):
+                    if self.arguments.get("--shared-eggs", False):
+                        shared_eggs.link_eggs_from_store(versions_section=self.get_versions_section())
+                    if self.arguments.get("--from-lock", False):
+                        self.install_frozen_versions()
+                    self.create_scripts()
+                    if self.arguments.get("--shared-eggs", False):
+                        shared_eggs.add_eggs_to_store()
             if not self.arguments.get("--no-js-requirements", False):
-                self.download_js_requirements()
+                with utils.stage_context("js-requirements"):
+                    self.download_js_requirements()
 
     def relocate(self):
         relative_paths = self.arguments.get("--relative", False)
@@ -259,39 +583,136 @@ class DevEnvPlugin(CommandPlugin):
 
         self.install_sections_by_recipe("infi.recipe.application_packager", stripped=False)
 
-    def get_toolkit_name(self, platform):
+    def wheelhouse(self):
+        from infi.projector.helper.utils.distributions import get_available_versions
+        from infi.projector.helper.utils.mirror import get_download_cache
+        assertions.assert_isolated_python_exists()
+        section = self.get_versions_section()
+        with utils.open_buildout_configfile() as buildout:
+            frozen = buildout.has_section(section)
+            project_name = buildout.get("project", "name")
+            versions = buildout.items(section) if frozen else []
+        if not frozen:
+            logger.error("Dependencies are not frozen, run `projector requirements freeze` first")
+            raise SystemExit(1)
+        cache_dist = os.path.join(get_download_cache(), "dist")
+        wheelhouse = self.get_wheelhouse_directory()
+        available_versions = get_available_versions(wheelhouse)
+        requirements = ['{}=={}'.format(name, version) for name, version in versions
+                        if utils.normalize(name) != utils.normalize(project_name) and
+                        (utils.normalize(name), version) not in available_versions]
+        if not requirements:
+            logger.info("All frozen dependencies are already in {}".format(wheelhouse))
+            return
+        env = utils.get_environ(dict(self.env or {}, PYTHONPATH=''))
+        utils.execute_assert_success([utils.get_isolated_executable('python'), '-m', 'pip', 'wheel', '--no-deps',
+                                      '--wheel-dir', wheelhouse, '--find-links', wheelhouse, '--find-links', cache_dist,
+                                      '--index-url', self._get_pypi_index_url()] + requirements, env=env)
+
+    def prefetch(self):
+        from infi.projector.helper.utils.prefetch import Prefetcher, PrefetchError
+        from infi.projector.helper.utils.simple_index import SimpleIndexClient
+        from infi.projector.helper.utils.resolver import read_root_requirements, parse_root_requirements
+        from infi.projector.helper.utils.resolver import ResolutionError
+        from infi.projector.helper.utils.lockfile import read_lock
+        from infi.projector.helper.utils.mirror import get_download_cache
+        self.create_cache_directories()
+        section = self.get_versions_section()
+        dist_directory = os.path.join(get_download_cache(), "dist")
+        with utils.open_buildout_configfile() as buildout:
+            root_requirements = read_root_requirements(buildout)
+            pins = buildout.items(section) if buildout.has_section(section) else []
+        # open_buildout_configfile swallows the exceptions raised in its block, so the values are parsed after it
+        project_name = utils.normalize(root_requirements[0] or '')
+        pins = [(name, version) for name, version in pins if utils.normalize(name) != project_name]
+        try:
+            requirements = [requirement for requirement, _ in parse_root_requirements(*root_requirements)]
+        except ResolutionError as error:
+            logger.error(error)
+            raise SystemExit(1)
+        # unfreeze leaves the == requirements in [versions]
+        frozen = set(utils.normalize(name) for name, _ in pins) - \
+            set(utils.normalize(name) for name in utils.get_dependencies_with_specific_versions(buildout))
+        client = SimpleIndexClient(self._get_pypi_index_url())
+        prefetcher = Prefetcher(client, dist_directory, self.get_host_target(), lock=read_lock())
+        try:
+            if frozen:
+                downloaded = prefetcher.prefetch_pinned(pins)
+            else:
+                logger.info("Dependencies are not frozen, downloading the newest versions that install_requires allows")
+                downloaded = prefetcher.prefetch_requirements(requirements)
+        except PrefetchError as error:
+            logger.error(error)
+            raise SystemExit(1)
+        finally:
+            client.close()
+        logger.info("Downloaded {} distributions to {}".format(len(downloaded), dist_directory))
+
+    def _get_toolkit_version(self, name, platform):
+        prefix = '%s-' % TOOLKIT_PREFIX
+        suffix = '-%s.%s' % (platform, TOOLKIT_SUFFIX)
+        if not name.startswith(prefix) or not name.endswith(suffix):
+            return None
+        octets = name[len(prefix):-len(suffix)].split('.')
+        try:
+            return [int(octet) for octet in octets]
+        except (ValueError, TypeError):
+            return None
+
+    def _get_latest_toolkit_name(self, names, platform):
+        versions = [(self._get_toolkit_version(name, platform), name) for name in names]
+        versions = [(version, name) for version, name in versions if version is not None]
+        if not versions:
+            return None
+        return max(versions)[1]
+
+    def _fetch_toolkit_index(self):
         request = urlopen(REPO_URL)
         response = request.read()
         data = response.decode()
-        lines = data.splitlines()
-        prefix = '%s-' % TOOLKIT_PREFIX
-        suffix = '-%s.%s' % (platform, TOOLKIT_SUFFIX)
-        versions = []
-        for line in lines:
+        names = []
+        for line in data.splitlines():
             rows = line.split()
-            if not rows:
-                continue
-            name = rows[-1]
-            if not name.startswith(prefix):
-                continue
-            name = name.replace(prefix, '')
-            if not name.endswith(suffix):
-                continue
-            name = name.replace(suffix, '')
-            octets = name.split('.')
+            if rows and rows[-1].startswith('%s-' % TOOLKIT_PREFIX):
+                names.append(rows[-1])
+        return names
+
+    def get_toolkit_index(self):
+        from time import time
+        index_path = os.path.join(utils.get_cache_directory(), TOOLKIT_INDEX_FILENAME)
+        refresh = self.arguments.get('--refresh-toolkit-index', False)
+        ttl = os.environ.get('PROJECTOR_TOOLKIT_INDEX_TTL', str(TOOLKIT_INDEX_TTL))
+        if not ttl.isdigit():
+            logger.warning('PROJECTOR_TOOLKIT_INDEX_TTL expects a number of seconds, got %r, using %s',
+                           ttl, TOOLKIT_INDEX_TTL)
+            ttl = TOOLKIT_INDEX_TTL
+        ttl = int(ttl)
+        if os.path.exists(index_path) and not refresh:
             try:
-                version = [int(octet) for octet in octets]
-            except (ValueError, TypeError):
-                continue
-            versions.append(version)
-        if not versions:
+                with open(index_path) as fd:
+                    index = json.load(fd)
+            except ValueError as error:
+                logger.debug('Ignoring corrupted toolkit index %s: %s', index_path, error)
+            else:
+                if index.get('url') == REPO_URL and time() - index.get('timestamp', 0) < ttl:
+                    return index['names']
+        logger.debug('Fetching toolkit index from %s', REPO_URL)
+        names = self._fetch_toolkit_index()
+        with open(index_path + '.tmp', 'w') as fd:
+            json.dump(dict(url=REPO_URL, timestamp=time(), names=names), fd)
+        os.rename(index_path + '.tmp', index_path)
+        return names
+
+    def get_toolkit_name(self, platform):
+        return self._get_latest_toolkit_name(self.get_toolkit_index(), platform)
+
+    def get_installed_toolkit_name(self, platform):
+        if not os.path.isdir(TOOLKITS_PATH):
             return None
-        versions.sort()
-        octets = versions[-1]
-        octets = [str(octet) for octet in octets]
-        version = '.'.join(octets)
-        toolkit_name = '%s%s%s' % (prefix, version, suffix)
-        return toolkit_name
+        names = ['{}.{}'.format(os.path.basename(directory), TOOLKIT_SUFFIX)
+                 for directory in self._iter_toolkit_directories()
+                 if os.path.exists(os.path.join(directory, TOOLKIT_MANIFEST_FILENAME))]
+        return self._get_latest_toolkit_name(names, platform)
 
     def install_toolkit_if_necessary(self):
         if not (self.arguments.get('--use-isolated-python', False) or assertions.is_isolated_python_exists()):
@@ -299,12 +720,7 @@ class DevEnvPlugin(CommandPlugin):
         platform = get_platform_string()
         if platform.startswith('windows'):
             return None
-        section = self.get_isolated_python_section_name()
-        if not section:
-            logger.debug('No isolated python section found')
-            return None
-        with utils.open_buildout_configfile() as buildout:
-            version = buildout.get(section, 'version')
+        version = self.get_isolated_python_version()
         if not version:
             logger.debug('No isolated python version found')
             return None
@@ -322,21 +738,41 @@ class DevEnvPlugin(CommandPlugin):
         if (major, minor) < (3, 9):
             logger.debug('Toolkit is not required for isolated python version %s', version)
             return None
-        toolkit_name = self.get_toolkit_name(platform)
+        toolkit_name = None
+        if not self.arguments.get('--refresh-toolkit-index', False):
+            toolkit_name = self.get_installed_toolkit_name(platform)
+        if not toolkit_name:
+            if not self.arguments.get('build', False):
+                logger.debug('No toolkit installed for %s platform, it will be installed by devenv build', platform)
+                return None
+            toolkit_name = self.get_toolkit_name(platform)
         if not toolkit_name:
             logger.debug('Toolkit not found for %s platform', platform)
             return None
         logger.debug('Found toolkit for %s: %s', platform, toolkit_name)
+        if os.path.exists(INFINIDAT_PATH):
+            if not os.path.isdir(INFINIDAT_PATH):
+                logger.debug('Toolkit destination is not a directory: %s', INFINIDAT_PATH)
+                return None
+        else:
+            logger.debug('Creating toolkit destination directory: %s', INFINIDAT_PATH)
+            os.makedirs(INFINIDAT_PATH)
+        self.install_toolkit(toolkit_name)
+        return self.get_toolkit_env(toolkit_name)
+
+    def get_toolkit_env(self, toolkit_name):
+        toolkit_path = os.path.join(self._get_toolkit_directory(toolkit_name), TOOLKIT_PREFIX)
+        bin_path = os.path.join(toolkit_path, 'bin')
         path = os.environ.get('PATH')
         if path:
-            paths = [BIN_PATH] + path.split(os.pathsep)
+            paths = [bin_path] + path.split(os.pathsep)
             path = os.pathsep.join(paths)
         else:
-            path = BIN_PATH
-        shell = os.path.join(BIN_PATH, 'bash')
-        prefix = os.path.abspath(os.path.join('parts', 'python'))
+            path = bin_path
+        shell = os.path.join(bin_path, 'bash')
+        prefix = os.path.abspath(utils.get_project_path('parts', 'python'))
         pkg_config_path = os.path.join(prefix, 'lib', 'pkgconfig')
-        ssl_cert_file = os.path.join(TOOLKIT_PATH, 'etc', 'ssl', 'certs', 'ca-bundle.crt')
+        ssl_cert_file = os.path.join(toolkit_path, 'etc', 'ssl', 'certs', 'ca-bundle.crt')
         env = dict(
             # set path to use proper compiler and libraries from toolkit
             PATH=path,
@@ -369,22 +805,184 @@ class DevEnvPlugin(CommandPlugin):
             # reference: https://pypi.org/project/PyNaCl
             SODIUM_INSTALL='system'
         )
-        toolkit_path = os.path.join(INFINIDAT_PATH, toolkit_name)
-        if os.path.isfile(toolkit_path):
+        return env
+
+    def _get_toolkit_directory(self, toolkit_name):
+        return os.path.join(TOOLKITS_PATH, toolkit_name[:-len('.' + TOOLKIT_SUFFIX)])
+
+    def _get_toolkit_manifest(self, toolkit_name):
+        manifest_path = os.path.join(self._get_toolkit_directory(toolkit_name), TOOLKIT_MANIFEST_FILENAME)
+        if not os.path.exists(manifest_path):
+            return None
+        try:
+            with open(manifest_path) as fd:
+                return json.load(fd)
+        except ValueError as error:
+            logger.debug('Ignoring corrupted toolkit manifest %s: %s', manifest_path, error)
+            return None
+
+    def _write_toolkit_manifest(self, toolkit_name, manifest):
+        manifest_path = os.path.join(self._get_toolkit_directory(toolkit_name), TOOLKIT_MANIFEST_FILENAME)
+        with open(manifest_path + '.tmp', 'w') as fd:
+            json.dump(manifest, fd)
+        os.rename(manifest_path + '.tmp', manifest_path)
+
+    def _is_toolkit_extracted(self, toolkit_name, manifest):
+        directory = self._get_toolkit_directory(toolkit_name)
+        for name, size in manifest['files'].items():
+            try:
+                stat = os.lstat(os.path.join(directory, name))
+            except OSError:
+                return False
+            if size is not None and stat.st_size != size:
+                return False
+        return True
+
+    def _extract_toolkit(self, reader, toolkit_name, expected_digest):
+        # extract next to the destination and rename into place, so an interrupted extraction leaves nothing behind
+        from tempfile import mkdtemp
+        directory = self._get_toolkit_directory(toolkit_name)
+        tempdir = mkdtemp(prefix=utils.TEMPORARY_PREFIX, dir=directory)
+        try:
+            logger.debug('Extracting %s to %s', toolkit_name, tempdir)
+            try:
+                tar = tarfile.open(fileobj=reader, mode='r|gz')
+                tar.extractall(tempdir)
+                files = {os.path.normpath(member.name): member.size if member.isfile() else None
+                         for member in tar.getmembers()}
+                tar.close()
+            except (tarfile.TarError, EOFError) as error:
+                logger.error('Failed to extract %s: %s', toolkit_name, error)
+                return False
+            reader.read_to_end()
+            digest = reader.hexdigest()
+            if expected_digest and digest != expected_digest:
+                logger.error('Checksum mismatch for %s: expected %s, got %s', toolkit_name, expected_digest, digest)
+                return False
+            for basename in os.listdir(tempdir):
+                path = os.path.join(directory, basename)
+                if os.path.lexists(path):
+                    os.rename(path, os.path.join(tempdir, utils.TEMPORARY_PREFIX + basename))
+                os.rename(os.path.join(tempdir, basename), path)
+        finally:
+            utils.remove_tree_or_file(tempdir)
+        self._write_toolkit_manifest(toolkit_name, dict(url=os.path.join(REPO_URL, toolkit_name), sha256=digest,
+                                                        size=reader.size, files=files))
+        return True
+
+    def _install_toolkit(self, toolkit_name):
+        from infi.projector.helper.utils.downloads import ResumableDownload, HashingReader, DownloadError
+        from infi.projector.helper.utils.downloads import fetch_expected_hexdigest, PARTIAL_SUFFIX
+        directory = self._get_toolkit_directory(toolkit_name)
+        toolkit_path = os.path.join(directory, toolkit_name)
+        manifest = self._get_toolkit_manifest(toolkit_name)
+        if manifest is not None and self._is_toolkit_extracted(toolkit_name, manifest):
             logger.debug('Toolkit %s already exists', toolkit_path)
-            return env
-        if os.path.exists(INFINIDAT_PATH):
-            if not os.path.isdir(INFINIDAT_PATH):
-                logger.debug('Toolkit destination is not a directory: %s', INFINIDAT_PATH)
-                return None
-        else:
-            logger.debug('Creating toolkit destination directory: %s', INFINIDAT_PATH)
-            os.makedirs(INFINIDAT_PATH)
+            return False
+        utils.makedirs_if_necessary(directory)
+        if os.path.isfile(toolkit_path):
+            # extract the tarball we already have, if it is the one the manifest describes
+            logger.debug('Re-extracting toolkit from %s', toolkit_path)
+            expected_digest = manifest['sha256'] if manifest is not None else None
+            with HashingReader(open(toolkit_path, 'rb')) as reader:
+                if self._extract_toolkit(reader, toolkit_name, expected_digest):
+                    return True
+            os.remove(toolkit_path)
         toolkit_url = os.path.join(REPO_URL, toolkit_name)
+        partial_path = toolkit_path + PARTIAL_SUFFIX
         logger.debug('Downloading toolkit from %s to %s', toolkit_url, toolkit_path)
-        urlretrieve(toolkit_url, toolkit_path)
-        logger.debug('Extracting %s to %s', toolkit_name, INFINIDAT_PATH)
-        tar = tarfile.open(toolkit_path, 'r:gz')
-        tar.extractall(INFINIDAT_PATH)
-        tar.close()
-        return env
+        expected_digest = fetch_expected_hexdigest(toolkit_url)
+        while True:
+            with ResumableDownload(toolkit_url, partial_path) as reader:
+                extracted = self._extract_toolkit(reader, toolkit_name, expected_digest)
+            if extracted:
+                break
+            os.remove(partial_path)
+            if not reader.offset:
+                raise DownloadError('Downloaded toolkit {} is corrupted'.format(toolkit_url))
+            # the partial file was not a prefix of this toolkit
+            logger.debug('Resumed download of %s is corrupted, downloading it again', toolkit_url)
+        os.rename(partial_path, toolkit_path)
+        return True
+
+    def _get_project_directory(self):
+        return os.path.abspath(utils.get_project_path(os.curdir))
+
+    def _get_toolkit_reference_name(self):
+        from hashlib import sha1
+        return sha1(self._get_project_directory().encode('utf-8')).hexdigest()
+
+    def _iter_toolkit_directories(self):
+        for basename in sorted(os.listdir(TOOLKITS_PATH)):
+            if not basename.startswith('.'):
+                yield os.path.join(TOOLKITS_PATH, basename)
+
+    def _add_toolkit_reference(self, toolkit_name):
+        reference_name = self._get_toolkit_reference_name()
+        directory = self._get_toolkit_directory(toolkit_name)
+        for other_directory in self._iter_toolkit_directories():
+            if other_directory != directory:
+                utils.remove_tree_or_file(os.path.join(other_directory, TOOLKIT_REFERENCES_DIRNAME, reference_name))
+        utils.makedirs_if_necessary(os.path.join(directory, TOOLKIT_REFERENCES_DIRNAME))
+        with open(os.path.join(directory, TOOLKIT_REFERENCES_DIRNAME, reference_name), 'w') as fd:
+            fd.write(self._get_project_directory())
+
+    def _has_live_toolkit_references(self, directory):
+        references_directory = os.path.join(directory, TOOLKIT_REFERENCES_DIRNAME)
+        live = False
+        for basename in (os.listdir(references_directory) if os.path.isdir(references_directory) else []):
+            with open(os.path.join(references_directory, basename)) as fd:
+                project_directory = fd.read().strip()
+            if os.path.exists(os.path.join(project_directory, 'buildout.cfg')):
+                live = True
+            else:
+                os.remove(os.path.join(references_directory, basename))
+        return live
+
+    def _update_toolkit_symlink(self, toolkit_name):
+        # tools that were built with /opt/infinidat/toolkit as their prefix find the latest toolkit there
+        if os.path.exists(TOOLKIT_PATH) and not os.path.islink(TOOLKIT_PATH):
+            logger.warning('Not replacing %s, it was installed by an older version of projector. Tools built for '
+                           'that prefix will not use %s until it is removed', TOOLKIT_PATH, toolkit_name)
+            return
+        target = os.path.join(self._get_toolkit_directory(toolkit_name), TOOLKIT_PREFIX)
+        if os.path.islink(TOOLKIT_PATH) and os.readlink(TOOLKIT_PATH) == target:
+            return
+        temporary_link = os.path.join(INFINIDAT_PATH, utils.TEMPORARY_PREFIX + TOOLKIT_PREFIX)
+        utils.remove_tree_or_file(temporary_link)
+        os.symlink(target, temporary_link)
+        os.rename(temporary_link, TOOLKIT_PATH)
+
+    def collect_toolkit_garbage(self):
+        active = os.path.dirname(os.path.realpath(TOOLKIT_PATH)) if os.path.islink(TOOLKIT_PATH) else None
+        for directory in self._iter_toolkit_directories():
+            if directory == active or self._has_live_toolkit_references(directory):
+                continue
+            logger.debug('Removing unused toolkit %s', directory)
+            trash = os.path.join(TOOLKITS_PATH, utils.TEMPORARY_PREFIX + os.path.basename(directory))
+            os.rename(directory, trash)
+            utils.remove_tree_or_file(trash)
+
+    def _is_toolkit_referenced(self, toolkit_name):
+        reference_path = os.path.join(self._get_toolkit_directory(toolkit_name), TOOLKIT_REFERENCES_DIRNAME,
+                                      self._get_toolkit_reference_name())
+        try:
+            with open(reference_path) as fd:
+                return fd.read() == self._get_project_directory()
+        except (IOError, OSError):
+            return False
+
+    def install_toolkit(self, toolkit_name):
+        # the common case, nothing to install or record, does not wait for the lock of the store
+        manifest = self._get_toolkit_manifest(toolkit_name)
+        if manifest is not None and self._is_toolkit_extracted(toolkit_name, manifest) and \
+                self._is_toolkit_referenced(toolkit_name):
+            return
+        # one job downloads and extracts, the others wait for the lock and then find the toolkit installed
+        utils.makedirs_if_necessary(TOOLKITS_PATH)
+        with utils.file_lock(os.path.join(TOOLKITS_PATH, TOOLKIT_LOCK_FILENAME)):
+            installed = self._install_toolkit(toolkit_name)
+            self._add_toolkit_reference(toolkit_name)
+            if installed:
+                self._update_toolkit_symlink(toolkit_name)
+                self.collect_toolkit_garbage()
@@ -0,0 +1,54 @@
+from infi.projector.plugins import CommandPlugin
+from infi.projector.helper import assertions
+from logging import getLogger
+
+logger = getLogger(__name__)
+
+USAGE = """
+Usage:
+    projector mirror build
+    projector mirror serve [--bind=ADDRESS] [--port=PORT]
+
+Options:
+    mirror build            generate a PEP 503 simple index of the download cache, updating only the projects that changed
+    mirror serve            update the simple index, and serve it over HTTP until interrupted
+    --bind=ADDRESS          the address to serve on, e.g. 0.0.0.0 to serve other hosts [default: 127.0.0.1]
+    --port=PORT             the port to serve on [default: 3141]
+"""
+
+
+class MirrorPlugin(CommandPlugin):
+    def get_docopt_string(self):
+        return USAGE
+
+    def get_command_name(self):
+        return 'mirror'
+
+    def get_methods(self):
+        return [self.build, self.serve]
+
+    @assertions.requires_repository
+    def pre_command_assertions(self):
+        pass
+
+    def build(self):
+        from infi.projector.helper.utils.mirror import build_mirror, get_mirror_directory
+        changes = build_mirror()
+        logger.info("Updated {} project(s) in {}".format(changes, get_mirror_directory()))
+
+    def serve(self):
+        from infi.projector.helper.utils.mirror import create_mirror_server, DEFAULT_PORT
+        port = self.arguments.get('--port') or DEFAULT_PORT
+        if not str(port).isdigit():
+            logger.error("--port expects a number, got {!r}".format(port))
+            raise SystemExit(1)
+        self.build()
+        server = create_mirror_server(host=self.arguments.get('--bind') or '127.0.0.1', port=int(port))
+        host, port = server.server_address[:2]
+        logger.info("Serving the simple index at http://{}:{}/simple/, press Ctrl+C to stop".format(host, port))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
@@ -6,13 +6,18 @@ from logging import getLogger
 
 logger = getLogger(__name__)
 
+FREEZE_CACHE_SIZE = 16
+
 USAGE = """
 Usage:
     projector requirements list [--development]
     projector requirements add <requirement> [--development] [--commit-changes]
     projector requirements remove <requirement> [--development] [--commit-changes]
-    projector requirements freeze [--with-install-requires] [--newest] [--allow-post-releases | --strip-suffix-from-post-releases | --allow-post-for=packages] [--push-changes] [--commit-changes]
+    projector requirements freeze [--with-install-requires] [--newest] [--resolve-only] [--matrix] [--hashes] [--allow-post-releases | --strip-suffix-from-post-releases | --allow-post-for=packages] [--push-changes] [--commit-changes]
     projector requirements unfreeze [--with-install-requires] [--commit-changes] [--push-changes]
+    projector requirements tree [--json | --dot]
+    projector requirements why <requirement>
+    projector requirements outdated
 
 
 Options:
@@ -21,10 +26,18 @@ Options:
     requirements remove             remove a package from project requirement list
     requirements freeze             Creates a versions.cfg file, telling buildout to use specific versions
     requirements unfreeze           Deletes the versions.cfg file, if it exists
+    requirements tree               Show the dependency tree of the installed requirements
+    requirements why                Show why a package is installed: what requires it, up to the project
+    requirements outdated           Show the frozen versions that have newer releases in the package index
     <requirement>                   requirement to add/remove
     --development                   Requirement for the development environment only
     --with-install-requires         Set >= requirements in the install_requires section
     --push-changes                  Push freeze commits
+    --json                          Print the dependency graph as JSON
+    --dot                           Print the dependency graph in Graphviz DOT format
+    --resolve-only                  Pick the versions from the download cache and the installed eggs, without building
+    --matrix                        Freeze once per target in [freeze-matrix] targets, into a [versions-<target>] section each
+    --hashes                        Also write buildout.lock.json, with the sha256 digests of the frozen distributions
 """
 
 class RequirementsPlugin(CommandPlugin):
@@ -35,7 +48,8 @@ class RequirementsPlugin(CommandPlugin):
         return 'requirements'
 
     def get_methods(self):
-        return [self.list, self.add, self.remove, self.freeze, self.unfreeze]
+        return [self.list, self.add, self.remove, self.freeze, self.unfreeze, self.tree, self.why,
+                self.outdated]
 
     @assertions.requires_repository
     def pre_command_assertions(self):
@@ -72,61 +86,273 @@ class RequirementsPlugin(CommandPlugin):
             commit_message = message.format(requirement, "(dev)" if self.arguments.get("--development") else '')
             commit_changes_to_buildout(commit_message)
 
-    def freeze(self):
-        from infi.projector.helper.utils import freeze_versions, buildout_parameters_context, open_tempfile
+    def write_picked_versions_with_buildout(self, filepath):
+        from infi.projector.helper.utils import buildout_parameters_context
         from infi.projector.plugins.builtins.devenv import DevEnvPlugin
-        from infi.gitpy import LocalRepository
-        from os import curdir
-        from re import sub, findall, MULTILINE
         plugin = DevEnvPlugin()
         plugin.arguments = {'--newest': self.arguments.get("--newest", False),
                             '--use-isolated-python': True}
-        with open_tempfile() as tempfile:
-            with buildout_parameters_context(["buildout:update-versions-file={0}".format(tempfile),
-                                              "buildout:versions="]):
-                plugin.build()
-            with open(tempfile) as fd:
-                content = fd.read()
-            post_releases = findall(r'^[^#].* = .*\.post.*', content, MULTILINE)
-            allow_post_for = self.arguments.get('--allow-post-for')
-            if allow_post_for:
-                allow_post_for = [item.lower() for item in allow_post_for.split(',')]
+        with buildout_parameters_context(["buildout:update-versions-file={0}".format(filepath),
+                                          "buildout:versions="]):
+            plugin.build()
+
+    def write_picked_versions_with_resolver(self, filepath):
+        from infi.projector.helper.utils.resolver import resolve_project, ResolutionError
+        try:
+            resolution = resolve_project(newest=self.arguments.get("--newest", False))
+        except ResolutionError as error:
+            logger.error("{}\nRun `projector requirements freeze` without --resolve-only".format(error))
+            raise SystemExit(1)
+        with open(filepath, 'w') as fd:
+            fd.write(resolution.format_picked_versions(with_header=False))
+
+    def _get_freeze_inputs(self):
+        """everything the picked versions depend on: requirements, pins, flags and the distributions on this host"""
+        from infi.projector.helper.utils.resolver import read_root_requirements, get_isolated_python_site_packages
+        from infi.projector.helper.utils import open_buildout_configfile, get_project_path
+        from infi.projector.plugins.builtins.devenv import DevEnvPlugin
+        from glob import glob
+        from sys import version_info
+        import os
+        with open_buildout_configfile() as buildout:
+            buildout_options = dict(buildout.items("buildout", raw=True)) if buildout.has_section("buildout") else {}
+            # unparsed, an invalid requirement is reported by the resolver
+            project_name, install_requires, names = read_root_requirements(buildout)
+            versions = sorted(buildout.items("versions", raw=True)) if buildout.has_section("versions") else []
+            isolated_python = [buildout.get(section, "version", raw=True) for section in buildout.sections()
+                               if buildout.has_option(section, "recipe") and
+                               buildout.get(section, "recipe", raw=True) == "infi.recipe.python" and
+                               buildout.has_option(section, "version")]
+        directories = [os.path.join(buildout_options.get("download-cache", ".cache"), "dist"),
+                       buildout_options.get("eggs-directory", "eggs"),
+                       buildout_options.get("develop-eggs-directory", "develop-eggs")]
+        directories.extend(item for item in buildout_options.get("find-links", "").split() if '://' not in item)
+        distributions = sorted(os.path.relpath(path, get_project_path(os.curdir)) for directory in directories
+                               for path in glob(os.path.join(get_project_path(directory), '*')))
+        distributions.extend(sorted(basename for site_packages in get_isolated_python_site_packages()
+                                    for basename in os.listdir(site_packages)))
+        return dict(requirements=[project_name, install_requires, sorted(set(names))], versions=versions, isolated_python=isolated_python,
+                    buildout={key: buildout_options.get(key) for key in
+                              ("prefer-final", "find-links", "index", "extensions", "allow-picked-versions")},
+                    index_url=DevEnvPlugin()._get_pypi_index_url(), distributions=distributions,
+                    python=list(version_info[:2]), resolve_only=bool(self.arguments.get("--resolve-only")),
+                    post_releases=[self.arguments.get(key) for key in
+                                   ("--allow-post-releases", "--strip-suffix-from-post-releases",
+                                    "--allow-post-for")])
+
+    def get_freeze_fingerprint(self):
+        from hashlib import sha256
+        import json
+        return sha256(json.dumps(self._get_freeze_inputs(), sort_keys=True).encode("utf-8")).hexdigest()
+
+    def _get_freeze_cache_path(self, fingerprint):
+        from infi.projector.helper.utils import get_project_path
+        return get_project_path("parts", "projector", "freeze", "{}.cfg".format(fingerprint))
+
+    def get_cached_freeze(self, fingerprint):
+        from os import path
+        filepath = self._get_freeze_cache_path(fingerprint)
+        if not path.exists(filepath):
+            return None
+        with open(filepath) as fd:
+            return fd.read()
+
+    def cache_freeze(self, fingerprints, content):
+        from infi.projector.helper.utils import makedirs_if_necessary, TEMPORARY_PREFIX
+        from glob import glob
+        import os
+        for fingerprint in set(fingerprints):
+            filepath = self._get_freeze_cache_path(fingerprint)
+            makedirs_if_necessary(os.path.dirname(filepath))
+            temporary_path = '{}.{}{}'.format(filepath, TEMPORARY_PREFIX, os.getpid())
+            with open(temporary_path, 'w') as fd:
+                fd.write(content)
+            if os.name == 'nt' and os.path.exists(filepath):
+                os.remove(filepath)
+            os.rename(temporary_path, filepath)
+        entries = sorted(glob(self._get_freeze_cache_path('*')), key=os.path.getmtime)
+        for filepath in entries[:-FREEZE_CACHE_SIZE]:
+            os.remove(filepath)
+
+    def check_post_releases(self, content):
+        """returns the content of the versions file after applying the post-release flags"""
+        from re import sub, findall, MULTILINE
+        post_releases = findall(r'^[^#].* = .*\.post.*', content, MULTILINE)
+        allow_post_for = self.arguments.get('--allow-post-for')
+        if allow_post_for:
+            allow_post_for = [item.lower() for item in allow_post_for.split(',')]
+        else:
+            allow_post_for = []
+        if post_releases:
+            if self.arguments.get('--allow-post-releases'):
+                pass
+            elif self.arguments.get('--strip-suffix-from-post-releases'):
+                content = sub(r'\.post\d+', '', content)
             else:
-                allow_post_for = []
-            if post_releases:
-                if self.arguments.get('--allow-post-releases'):
-                    pass
-                elif self.arguments.get('--strip-suffix-from-post-releases'):
-                    content = sub(r'\.post\d+', '', content)
-                else:
-                    for package in post_releases:
-                        package = package.split('=')[0].strip().lower()
-                        if package not in allow_post_for:
-                            msg = "freeze found the follwing post-releases, see the dependency tree above:\n{}"
-                            formatted_post_releases = "\n".join(item for item in post_releases)
-                            logger.info(content)
-                            logger.error(msg.format(formatted_post_releases))
-                            raise SystemExit(1)
-            with open(tempfile, 'w') as fd:
-                fd.write("[versions]\n" + "\n".join(set(content.splitlines())))
-            freeze_versions(tempfile, self.arguments.get("--with-install-requires", False))
+                for package in post_releases:
+                    package = package.split('=')[0].strip().lower()
+                    if package not in allow_post_for:
+                        msg = "freeze found the follwing post-releases, see the dependency tree above " + \
+                              "or run `projector requirements why <package>`:\n{}"
+                        formatted_post_releases = "\n".join(item for item in post_releases)
+                        logger.info(content)
+                        logger.error(msg.format(formatted_post_releases))
+                        raise SystemExit(1)
+        return "[versions]\n" + "\n".join(set(content.splitlines()))
+
+    def get_freeze_targets(self):
+        from infi.projector.helper.utils import open_buildout_configfile
+        from infi.projector.helper.utils.resolver import parse_targets
+        with open_buildout_configfile() as buildout:
+            value = buildout.get("freeze-matrix", "targets") if buildout.has_option("freeze-matrix", "targets") else ''
+        targets = parse_targets(value)
+        if not targets:
+            logger.error("There are no targets to freeze for, add lines of \"<python version> <platform tag>\" " +
+                         "to [freeze-matrix] targets in buildout.cfg")
+            raise SystemExit(1)
+        return targets
+
+    def freeze_matrix(self):
+        from infi.projector.helper.utils import freeze_versions_matrix
+        from infi.projector.helper.utils.resolver import resolve_targets, ResolutionError
+        from tempfile import mkdtemp
+        from shutil import rmtree
+        from os import path
+        targets = self.get_freeze_targets()
+        logger.info("Freezing for {}".format(', '.join(target.get_key() for target in targets)))
+        try:
+            results = resolve_targets(targets, newest=self.arguments.get("--newest", False))
+        except ResolutionError as error:
+            logger.error("{}\nThe targets are resolved from the download cache only, ".format(error) +
+                         "add the missing distributions to it")
+            raise SystemExit(1)
+        tempdir = mkdtemp()
+        try:
+            versions_files = {}
+            for key, content in results.items():
+                versions_files[key] = path.join(tempdir, "{}.cfg".format(key))
+                with open(versions_files[key], 'w') as fd:
+                    fd.write(self.check_post_releases(content))
+            freeze_versions_matrix(versions_files, self.arguments.get("--with-install-requires", False))
+        finally:
+            rmtree(tempdir, ignore_errors=True)
+
+    def freeze(self):
+        from infi.projector.helper.utils.lockfile import build_lock, write_lock, LOCKFILE_NAME
+        from infi.projector.helper.utils import get_project_path
+        from infi.gitpy import LocalRepository
+        from os import curdir
+        if self.arguments.get("--matrix", False):
+            # buildout can only pick versions for the interpreter it runs on, so the targets are always resolved
+            self.freeze_matrix()
+        else:
+            self.freeze_for_this_host()
+        if self.arguments.get("--hashes", False):
+            write_lock(build_lock())
         if self.arguments.get("--commit-changes", False):
-            repository = LocalRepository(curdir)
+            repository = LocalRepository(get_project_path(curdir))
             repository.add("buildout.cfg")
+            if self.arguments.get("--hashes", False):
+                repository.add(LOCKFILE_NAME)
             repository.commit("Freezing dependencies", allowEmpty=True)
         push_changes = self.arguments.get("--push-changes", False)
         if push_changes:
             repository._executeGitCommandAssertSuccess("git push")
 
+    def freeze_for_this_host(self):
+        from infi.projector.helper.utils import freeze_versions, open_tempfile
+        # --newest asks for whatever is new on the index, so a previous result is never good enough
+        fingerprint = None if self.arguments.get("--newest", False) else self.get_freeze_fingerprint()
+        content = self.get_cached_freeze(fingerprint) if fingerprint else None
+        with open_tempfile() as tempfile:
+            if content is not None:
+                logger.info("The dependencies did not change since they were last frozen, using the same versions")
+            else:
+                if self.arguments.get("--resolve-only", False):
+                    self.write_picked_versions_with_resolver(tempfile)
+                else:
+                    self.write_picked_versions_with_buildout(tempfile)
+                with open(tempfile) as fd:
+                    content = self.check_post_releases(fd.read())
+            with open(tempfile, 'w') as fd:
+                fd.write(content)
+            freeze_versions(tempfile, self.arguments.get("--with-install-requires", False))
+        # freezing changes the pins (and building the cache), so the next freeze has a different fingerprint
+        self.cache_freeze([item for item in [fingerprint] if item] + [self.get_freeze_fingerprint()], content)
+
     def unfreeze(self):
-        from infi.projector.helper.utils import unfreeze_versions
+        from infi.projector.helper.utils import unfreeze_versions, get_project_path
         from infi.gitpy import LocalRepository
         from os import curdir
         unfreeze_versions(self.arguments.get("--with-install-requires", False))
         if self.arguments.get("--commit-changes", False):
-            repository = LocalRepository(curdir)
+            repository = LocalRepository(get_project_path(curdir))
             repository.add("buildout.cfg")
             repository.commit("Unfreezing dependencies", allowEmpty=True)
         push_changes = self.arguments.get("--push-changes", False)
         if push_changes:
             repository._executeGitCommandAssertSuccess("git push")
+
+    def get_dependency_graph(self):
+        from infi.projector.helper.utils.installed_index import open_installed_index
+        from infi.projector.helper.utils.dependency_graph import build_dependency_graph
+        from infi.projector.helper.utils.resolver import ResolutionError
+        with open_installed_index() as index:
+            try:
+                return build_dependency_graph(index)
+            except ResolutionError as error:
+                logger.error(str(error))
+                raise SystemExit(1)
+
+    def tree(self):
+        graph = self.get_dependency_graph()
+        if self.arguments.get("--json", False):
+            print(graph.to_json())
+        elif self.arguments.get("--dot", False):
+            print(graph.to_dot())
+        else:
+            print(graph.format_tree())
+
+    def why(self):
+        requirement = self.arguments.get('<requirement>')
+        reverse_tree = self.get_dependency_graph().format_reverse_tree(requirement)
+        if reverse_tree is None:
+            logger.error("{} is not required by the project, nor by its dependencies".format(requirement))
+            raise SystemExit(1)
+        print(reverse_tree)
+
+    def outdated(self):
+        from infi.projector.helper.utils import open_buildout_configfile
+        from infi.projector.helper.utils.simple_index import SimpleIndexClient
+        from infi.projector.plugins.builtins.devenv import DevEnvPlugin
+        from pkg_resources import parse_version
+        with open_buildout_configfile() as buildout:
+            frozen = buildout.has_section("versions")
+            pins = sorted(buildout.items("versions"), key=lambda item: item[0].lower()) if frozen else []
+        if not frozen:
+            logger.error("Dependencies are not frozen, run `projector requirements freeze` first")
+            raise SystemExit(1)
+        client = SimpleIndexClient(DevEnvPlugin()._get_pypi_index_url())
+        try:
+            results = client.get_versions_of([name for name, _ in pins])
+        finally:
+            client.close()
+        rows = []
+        for name, pinned in pins:
+            if isinstance(results[name], Exception):
+                logger.warning("Failed to get the versions of {}: {}".format(name, results[name]))
+                continue
+            versions = sorted(results[name], key=parse_version)
+            final = [version for version in versions if not parse_version(version).is_prerelease]
+            latest_final = final[-1] if final else ''
+            latest = versions[-1] if versions and parse_version(versions[-1]).is_prerelease and \
+                (not final or parse_version(versions[-1]) > parse_version(latest_final)) else ''
+            if any(version and parse_version(version) > parse_version(pinned) for version in (latest_final, latest)):
+                rows.append((name, pinned, latest_final, latest))
+        if not rows:
+            logger.info("All the frozen versions are up to date")
+            return
+        rows.insert(0, ("Package", "Frozen", "Latest", "Latest pre-release"))
+        widths = [max(len(row[column]) for row in rows) for column in range(4)]
+        for row in rows:
+            print('  '.join(item.ljust(width) for item, width in zip(row, widths)).rstrip())
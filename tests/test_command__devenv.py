@@ -132,3 +132,285 @@ class DevEnvTestCase(TestCase):
             self.assert_scripts_were_generated_by_buildout()
             self.assert_specific_setuptools_version_is_being_used("43.0.0")
             self.assert_specific_zc_buildout_version_is_being_used("2.11.2")
+
+    def test_wheelhouse(self):
+        from os import listdir
+        with self.temporary_directory_context():
+            self.projector("repository init a.b.c none short long")
+            self.projector("devenv build --use-isolated-python --prefer-final")
+            self.projector("requirements freeze --strip-suffix-from-post-releases")
+            self.projector("devenv wheelhouse")
+            from infi.projector.plugins.builtins.devenv import DevEnvPlugin
+            plugin = DevEnvPlugin()
+            plugin.arguments = {'--use-isolated-python': True}
+            self.assertTrue(any(filename.endswith('.whl') for filename in listdir(plugin.get_wheelhouse_directory())))
+            self.projector("devenv build --use-isolated-python")
+            self.assert_scripts_were_generated_by_buildout()
+
+    def test_unsatisfied_isolated_python_requirements(self):
+        from infi.projector.plugins.builtins.devenv import DevEnvPlugin
+        from os import makedirs
+        with self.temporary_directory_context():
+            with open("buildout.cfg", "w") as fd:
+                fd.write("[buildout]\n[versions]\nsetuptools = 43.0.0\n")
+            site_packages = path.join("parts", "python", "lib", "python3.8", "site-packages")
+            for basename in ["setuptools-44.0.0.dist-info", "zc.buildout-2.13.3-py3.8.egg-info", "pip-20.0.2.dist-info"]:
+                makedirs(path.join(site_packages, basename))
+            plugin = DevEnvPlugin()
+            plugin.arguments = {}
+            self.assertEqual(plugin._get_unsatisfied_isolated_python_requirements(), ['setuptools==43.0.0'])
+            plugin.arguments = {'--newest': True}
+            self.assertEqual(len(plugin._get_unsatisfied_isolated_python_requirements()), 3)
+
+    def test_install_setuptools_and_zc_buildout_upgrades_with_newest(self):
+        from infi.projector.plugins.builtins import devenv
+        with self.temporary_directory_context():
+            with open("buildout.cfg", "w") as fd:
+                fd.write("[buildout]\ndownload-cache = .cache\n")
+            plugin = devenv.DevEnvPlugin()
+            with patch.object(devenv.utils, "execute_assert_success") as execute_assert_success, \
+                    patch.object(devenv.utils, "get_isolated_executable", return_value="python"), \
+                    patch.object(plugin, "_get_isolated_python_installed_versions", return_value={"pip": "20.0"}):
+                plugin.arguments = {}
+                plugin._install_setuptools_and_zc_buildout(["setuptools"])
+                self.assertNotIn("--upgrade", execute_assert_success.call_args_list[0][0][0])
+                execute_assert_success.reset_mock()
+                plugin.arguments = {"--newest": True}
+                plugin._install_setuptools_and_zc_buildout(["setuptools"])
+                self.assertIn("--upgrade", execute_assert_success.call_args_list[0][0][0])
+
+    def test_switch_isolated_python_from_store(self):
+        from infi.projector.plugins.builtins.devenv import DevEnvPlugin
+        from os import makedirs, environ, symlink, readlink
+        with self.temporary_directory_context() as tempdir:
+            with open("buildout.cfg", "w") as fd:
+                fd.write("[buildout]\n[isolated-python]\nrecipe = infi.recipe.python\nversion = v3.8.0.3\n")
+            with open(".installed.cfg", "w") as fd:
+                fd.write("[buildout]\nparts = isolated-python setup.py\n\n[isolated-python]\n__buildout_installed__ = \n")
+            plugin = DevEnvPlugin()
+            plugin.arguments = {'--use-isolated-python': True}
+            with patch.dict(environ, {"PROJECTOR_CACHE_DIR": path.join(tempdir, "cache")}):
+                self.assertFalse(plugin.link_isolated_python_from_store())
+                makedirs(path.join(plugin._get_isolated_python_store_path(), "bin"))
+                with open(path.join(plugin._get_isolated_python_store_path(), "bin", "python"), "w") as fd:
+                    fd.write("v3.8.0.3")
+                site_packages = path.join(plugin._get_isolated_python_store_path(), "lib", "python3.8", "site-packages")
+                makedirs(site_packages)
+                with open(path.join(site_packages, "easy-install.pth"), "w") as fd:
+                    fd.write("")
+                if name != 'nt':
+                    symlink("lib", path.join(plugin._get_isolated_python_store_path(), "lib64"))
+                self.assertTrue(plugin.link_isolated_python_from_store())
+                self.assertTrue(path.exists(path.join("parts", "python", "bin", "python")))
+                # files pip rewrites in place are copies, so the store stays pristine
+                self.assertFalse(path.samefile(path.join("parts", "python", "lib", "python3.8", "site-packages",
+                                                         "easy-install.pth"),
+                                               path.join(site_packages, "easy-install.pth")))
+                self.assertTrue(path.samefile(path.join("parts", "python", "bin", "python"),
+                                              path.join(plugin._get_isolated_python_store_path(), "bin", "python")))
+                if name != 'nt':
+                    self.assertEqual(readlink(path.join("parts", "python", "lib64")), "lib")
+                self.assertEqual(plugin._get_installed_isolated_python_key(), plugin.get_isolated_python_key())
+            plugin._forget_installed_isolated_python_part()
+            with open(".installed.cfg") as fd:
+                self.assertNotIn("isolated-python", fd.read())
+
+    def test_toolkit_index_is_cached(self):
+        from infi.projector.plugins.builtins import devenv
+        from infi.projector.plugins.builtins.devenv import DevEnvPlugin
+        from os import environ
+        names = ['toolkit-1.2.0-linux-x64.tar.gz', 'toolkit-1.10.0-linux-x64.tar.gz', 'toolkit-2.0.0-aix-ppc64.tar.gz']
+        with self.temporary_directory_context() as tempdir:
+            plugin = DevEnvPlugin()
+            plugin.arguments = {'build': True}
+            with patch.dict(environ, {"PROJECTOR_CACHE_DIR": tempdir}), \
+                    patch.object(DevEnvPlugin, "_fetch_toolkit_index", return_value=names) as fetch_toolkit_index:
+                self.assertEqual(plugin.get_toolkit_name('linux-x64'), 'toolkit-1.10.0-linux-x64.tar.gz')
+                self.assertEqual(plugin.get_toolkit_name('aix-ppc64'), 'toolkit-2.0.0-aix-ppc64.tar.gz')
+                self.assertEqual(plugin.get_toolkit_name('solaris-sparc'), None)
+                self.assertEqual(fetch_toolkit_index.call_count, 1)
+                plugin.arguments['--refresh-toolkit-index'] = True
+                plugin.get_toolkit_name('linux-x64')
+                self.assertEqual(fetch_toolkit_index.call_count, 2)
+                plugin.arguments['--refresh-toolkit-index'] = False
+                with patch.dict(environ, {"PROJECTOR_TOOLKIT_INDEX_TTL": "1d"}), \
+                        patch.object(devenv.logger, "warning") as warning:
+                    plugin.get_toolkit_name('linux-x64')
+                self.assertEqual(fetch_toolkit_index.call_count, 2)
+                self.assertEqual(warning.call_count, 1)
+
+    def test_install_toolkit_resumes_and_verifies(self):
+        from infi.projector.plugins.builtins import devenv
+        from infi.projector.helper.utils.downloads import get_file_hexdigest
+        from os import makedirs, remove
+        import tarfile
+        toolkit_name = 'toolkit-1.0.0-linux-x64.tar.gz'
+        with self.temporary_directory_context() as tempdir:
+            makedirs(path.join("repo", "toolkit", "bin"))
+            makedirs("infinidat")
+            with open(path.join("repo", "toolkit", "bin", "bash"), "w") as fd:
+                fd.write("#!/bin/sh\n" * 1000)
+            with tarfile.open(path.join("repo", toolkit_name), "w:gz") as tar:
+                tar.add(path.join("repo", "toolkit"), "toolkit")
+            makedirs(path.join("infinidat", "toolkits", "toolkit-1.0.0-linux-x64"))
+            infinidat_path = path.join(tempdir, "infinidat")
+            toolkits_path = path.join(infinidat_path, "toolkits")
+            toolkit_directory = path.join(toolkits_path, "toolkit-1.0.0-linux-x64")
+            with open(path.join("repo", toolkit_name), "rb") as src:
+                with open(path.join(toolkit_directory, toolkit_name + ".part"), "wb") as dst:
+                    dst.write(src.read(100))
+            with patch.object(devenv, "REPO_URL", "file://" + path.join(tempdir, "repo")), \
+                    patch.object(devenv, "INFINIDAT_PATH", infinidat_path), \
+                    patch.object(devenv, "TOOLKITS_PATH", toolkits_path), \
+                    patch.object(devenv, "TOOLKIT_PATH", path.join(infinidat_path, "toolkit")):
+                plugin = devenv.DevEnvPlugin()
+                plugin.install_toolkit(toolkit_name)
+                bash = path.join(toolkit_directory, "toolkit", "bin", "bash")
+                self.assertTrue(path.exists(bash))
+                self.assertTrue(path.exists(path.join(infinidat_path, "toolkit", "bin", "bash")))
+                self.assertTrue(path.exists(path.join(toolkit_directory, toolkit_name)))
+                self.assertFalse(path.exists(path.join(toolkit_directory, toolkit_name + ".part")))
+                self.assertEqual(plugin._get_toolkit_manifest(toolkit_name)['sha256'],
+                                 get_file_hexdigest(path.join(toolkit_directory, toolkit_name)))
+                with patch.object(devenv.utils, "file_lock") as file_lock:
+                    plugin.install_toolkit(toolkit_name)
+                    self.assertFalse(file_lock.called)
+                remove(bash)
+                plugin.install_toolkit(toolkit_name)
+                self.assertTrue(path.exists(bash))
+                # a partial file of the same size that is not this toolkit is downloaded again
+                remove(path.join(toolkit_directory, toolkit_name))
+                remove(bash)
+                with open(path.join(toolkit_directory, toolkit_name + ".part"), "wb") as fd:
+                    fd.write(b"x" * path.getsize(path.join("repo", toolkit_name)))
+                plugin.install_toolkit(toolkit_name)
+                self.assertTrue(path.exists(bash))
+                remove(path.join(infinidat_path, "toolkit"))
+                makedirs(path.join(infinidat_path, "toolkit"))
+                with patch.object(devenv.logger, "warning") as warning:
+                    plugin._update_toolkit_symlink(toolkit_name)
+                    self.assertTrue(warning.called)
+
+    def test_toolkit_store_collects_unreferenced_versions(self):
+        from infi.projector.plugins.builtins import devenv
+        from os import makedirs, readlink
+        import tarfile
+        with self.temporary_directory_context() as tempdir:
+            infinidat_path = path.join(tempdir, "infinidat")
+            toolkits_path = path.join(infinidat_path, "toolkits")
+            makedirs(path.join("repo", "toolkit", "bin"))
+            with open(path.join("buildout.cfg"), "w") as fd:
+                fd.write("[buildout]\n")
+            for version in ("1.0.0", "1.1.0"):
+                with open(path.join("repo", "toolkit", "bin", "bash"), "w") as fd:
+                    fd.write(version)
+                with tarfile.open(path.join("repo", "toolkit-{}-linux-x64.tar.gz".format(version)), "w:gz") as tar:
+                    tar.add(path.join("repo", "toolkit"), "toolkit")
+            with patch.object(devenv, "REPO_URL", "file://" + path.join(tempdir, "repo")), \
+                    patch.object(devenv, "INFINIDAT_PATH", infinidat_path), \
+                    patch.object(devenv, "TOOLKITS_PATH", toolkits_path), \
+                    patch.object(devenv, "TOOLKIT_PATH", path.join(infinidat_path, "toolkit")):
+                plugin = devenv.DevEnvPlugin()
+                makedirs(infinidat_path)
+                plugin.install_toolkit("toolkit-1.0.0-linux-x64.tar.gz")
+                self.assertEqual(plugin.get_installed_toolkit_name("linux-x64"), "toolkit-1.0.0-linux-x64.tar.gz")
+                plugin.install_toolkit("toolkit-1.1.0-linux-x64.tar.gz")
+                self.assertEqual(plugin.get_installed_toolkit_name("linux-x64"), "toolkit-1.1.0-linux-x64.tar.gz")
+                self.assertFalse(path.exists(path.join(toolkits_path, "toolkit-1.0.0-linux-x64")))
+                self.assertEqual(readlink(path.join(infinidat_path, "toolkit")),
+                                 path.join(toolkits_path, "toolkit-1.1.0-linux-x64", "toolkit"))
+                with open(path.join(infinidat_path, "toolkit", "bin", "bash")) as fd:
+                    self.assertEqual(fd.read(), "1.1.0")
+
+    def test_ccache_env_and_statistics(self):
+        from infi.projector.plugins.builtins import devenv
+        from os import makedirs, chmod, environ
+        if name == 'nt':
+            raise SkipTest("ccache integration is not supported on Windows")
+        with self.temporary_directory_context() as tempdir:
+            makedirs("bin")
+            ccache = path.join(tempdir, "bin", "ccache")
+            with open(ccache, "w") as fd:
+                fd.write("#!/bin/sh\nread hits < {0}\nprintf 'direct_cache_hit\\t%s\\ncache_miss\\t1\\n' $hits\n".format(
+                    path.join(tempdir, "hits")))
+            chmod(ccache, 0o755)
+            with open("hits", "w") as fd:
+                fd.write("2")
+            plugin = devenv.DevEnvPlugin()
+            plugin.env = dict(PATH=path.join(tempdir, "bin"))
+            plugin.arguments = {}
+            with patch.dict(environ, CCACHE_DIR=path.join(tempdir, "cache")):
+                environ.pop("CC", None)
+                # statistics are only collected for builds with --ccache
+                self.assertIsNone(plugin.get_ccache_statistics())
+            plugin.arguments = {"--ccache": True}
+            with patch.dict(environ, PROJECTOR_CACHE_DIR=path.join(tempdir, "cache")):
+                plugin.env.update(plugin.get_ccache_env())
+                self.assertTrue(plugin.env['CC'].startswith(ccache + " "))
+                self.assertEqual(plugin.env['CCACHE_DIR'], path.join(tempdir, "cache", "ccache"))
+                with patch.object(devenv.logger, "info") as info:
+                    with plugin.ccache_statistics_context():
+                        with open("hits", "w") as fd:
+                            fd.write("5")
+                info.assert_called_once_with("ccache: 3 hits, 0 misses")
+
+    def test_install_frozen_versions_requires_frozen_versions(self):
+        from infi.projector.plugins.builtins.devenv import DevEnvPlugin
+        with self.temporary_directory_context():
+            with open("buildout.cfg", "w") as fd:
+                fd.write("[buildout]\n[project]\nname = infi.example\n")
+            plugin = DevEnvPlugin()
+            plugin.arguments = {'build': True, '--from-lock': True}
+            with self.assertRaises(SystemExit):
+                plugin.install_frozen_versions()
+
+    def test_wheelhouse_requires_frozen_versions(self):
+        from infi.projector.plugins.builtins.devenv import DevEnvPlugin
+        from os import makedirs
+        with self.temporary_directory_context():
+            with open("buildout.cfg", "w") as fd:
+                fd.write("[buildout]\n[project]\nname = infi.example\n")
+            makedirs(path.join("parts", "python", "bin"))
+            with open(path.join("parts", "python", "bin", "python.exe" if name == "nt" else "python"), "w"):
+                pass
+            plugin = DevEnvPlugin()
+            plugin.arguments = {'wheelhouse': True}
+            with self.assertRaises(SystemExit):
+                plugin.wheelhouse()
+
+    def test_prefetch_reports_invalid_requirements(self):
+        from infi.projector.plugins.builtins.devenv import DevEnvPlugin
+        with self.temporary_directory_context():
+            with open("buildout.cfg", "w") as fd:
+                fd.write("[buildout]\n[project]\nname = infi.example\ninstall_requires = ['alpha[']\n")
+            plugin = DevEnvPlugin()
+            plugin.arguments = {'prefetch': True}
+            with self.assertRaises(SystemExit):
+                plugin.prefetch()
+            self.assertTrue(path.isdir(path.join(".cache", "dist")))
+
+    def test_parallel_build_env(self):
+        from infi.projector.plugins.builtins import devenv
+        from os import environ
+        with self.temporary_directory_context() as tempdir:
+            with patch.dict(environ, PROJECTOR_CACHE_DIR=tempdir, MAKEFLAGS="-k"):
+                environ.pop("DIST_EXTRA_CONFIG", None)
+                env = devenv.DevEnvPlugin().get_parallel_build_env("32")
+                self.assertEqual(env['MAKEFLAGS'], "-j32 -k")
+                self.assertEqual(env['CMAKE_BUILD_PARALLEL_LEVEL'], "32")
+                with open(env['DIST_EXTRA_CONFIG']) as fd:
+                    self.assertIn("parallel = 32", fd.read())
+                with self.assertRaises(SystemExit):
+                    devenv.DevEnvPlugin().get_parallel_build_env("all")
+            plugin = devenv.DevEnvPlugin()
+            plugin.arguments = {'build': True}
+            with open("buildout.cfg", "w") as fd:
+                fd.write("[buildout]\n[versions]\nsetuptools = 43.0.0\n")
+            with patch.object(devenv.logger, "warning") as warning:
+                plugin._warn_if_build_ext_is_not_parallel()
+                self.assertEqual(warning.call_count, 1)
+            with open("buildout.cfg", "w") as fd:
+                fd.write("[buildout]\n[versions]\nsetuptools = 65.5.0\n")
+            with patch.object(devenv.logger, "warning") as warning:
+                plugin._warn_if_build_ext_is_not_parallel()
+                self.assertEqual(warning.call_count, 0)
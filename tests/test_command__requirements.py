@@ -122,3 +122,42 @@ class RequirementsTestCase(TestCase):
             self.assertIn("[versions]", open("buildout.cfg").read())
             self.assertIn("Flask==1.0.3", open("buildout.cfg").read())
             self.assertIn("setuptools", open("buildout.cfg").read())
+
+    def test_freeze_reuses_result_for_same_inputs(self):
+        from infi.projector.plugins.builtins.requirements import RequirementsPlugin
+        from mock import patch
+        plugin = RequirementsPlugin()
+
+        def write_picked_versions(filepath):
+            with open(filepath, "w") as fd:
+                fd.write("six = 1.16.0\n")
+        with self.temporary_directory_context():
+            with open("buildout.cfg", "w") as fd:
+                fd.write("[buildout]\ndownload-cache = .cache\n"
+                         "[project]\nname = a.b.c\ninstall_requires = ['six']\n"
+                         "[development-scripts]\nrecipe = infi.recipe.console_scripts\neggs = ${project:name}\n")
+            with patch.object(RequirementsPlugin, "write_picked_versions_with_resolver",
+                              side_effect=write_picked_versions) as write:
+                plugin.arguments = {'--resolve-only': True}
+                plugin.freeze()
+                plugin.freeze()
+                self.assertEqual(write.call_count, 1)
+                self.assertIn("six = 1.16.0", open("buildout.cfg").read())
+                plugin.arguments = {'--resolve-only': True, '--newest': True}
+                plugin.freeze()
+                self.assertEqual(write.call_count, 2)
+                plugin.arguments = {'--resolve-only': True}
+                with open("buildout.cfg", "a") as fd:
+                    fd.write("\tmock\n")
+                plugin.freeze()
+                self.assertEqual(write.call_count, 3)
+
+    def test_outdated_requires_frozen_versions(self):
+        from infi.projector.plugins.builtins.requirements import RequirementsPlugin
+        plugin = RequirementsPlugin()
+        with self.temporary_directory_context():
+            with open("buildout.cfg", "w") as fd:
+                fd.write("[buildout]\n[project]\nname = a.b.c\n")
+            plugin.arguments = {'outdated': True}
+            with self.assertRaises(SystemExit):
+                plugin.outdated()
@@ -31,3 +31,746 @@ class UtilsTestCase(TestCase):
             repository = LocalRepository('.')
             self.assertEqual(2, len(repository.getBranches()))
             self.assertEqual(1, len(repository.getTags()), repository.getTags())
+
+    def test_shared_eggs_store(self):
+        from infi.projector.helper.utils import shared_eggs
+        from mock import patch
+        from os import path, makedirs, environ
+        with self.temporary_directory_context() as tempdir:
+            with open("buildout.cfg", "w") as fd:
+                fd.write("[buildout]\n[versions]\nsix = 1.16.0\n")
+            for basename in ["six-1.16.0-py3.8.egg", "mock-3.0.5-py3.8.egg"]:
+                makedirs(path.join("eggs", basename, "EGG-INFO"))
+                with open(path.join("eggs", basename, "EGG-INFO", "PKG-INFO"), "w") as fd:
+                    fd.write(basename)
+            with patch.dict(environ, {"PROJECTOR_CACHE_DIR": path.join(tempdir, "store")}):
+                shared_eggs.add_eggs_to_store()
+                store = shared_eggs.get_shared_eggs_directory()
+                self.assertTrue(shared_eggs.is_linked(path.join("eggs", "six-1.16.0-py3.8.egg"),
+                                                      path.join(store, "six-1.16.0-py3.8.egg")))
+                # importing the egg writes bytecode into the project's copy only
+                makedirs(path.join("eggs", "six-1.16.0-py3.8.egg", "__pycache__"))
+                for filename in [path.join("__pycache__", "six.cpython-38.pyc"), "six.pyc"]:
+                    with open(path.join("eggs", "six-1.16.0-py3.8.egg", filename), "w") as fd:
+                        fd.write("bytecode")
+                self.assertTrue(shared_eggs.is_linked(path.join("eggs", "six-1.16.0-py3.8.egg"),
+                                                      path.join(store, "six-1.16.0-py3.8.egg")))
+                with open(path.join(store, "six-1.16.0-py3.8.egg", "EGG-INFO", "top_level.txt"), "w") as fd:
+                    fd.write("six")
+                self.assertFalse(shared_eggs.is_linked(path.join("eggs", "six-1.16.0-py3.8.egg"),
+                                                       path.join(store, "six-1.16.0-py3.8.egg")))
+                makedirs(path.join(store, "six-1.15.0-py3.8.egg", "EGG-INFO"))
+                shared_eggs.link_eggs_from_store("other-eggs")
+                self.assertTrue(path.exists(path.join("other-eggs", "six-1.16.0-py3.8.egg", "EGG-INFO", "PKG-INFO")))
+                # mock is not frozen, buildout picks its version
+                self.assertFalse(path.exists(path.join("other-eggs", "mock-3.0.5-py3.8.egg")))
+                self.assertFalse(path.exists(path.join("other-eggs", "six-1.15.0-py3.8.egg")))
+                with open("buildout.cfg", "w") as fd:
+                    fd.write("[buildout]\n")
+                shared_eggs.link_eggs_from_store("unfrozen-eggs")
+                self.assertFalse(path.exists("unfrozen-eggs"))
+
+    def test_parse_distribution_filename(self):
+        from infi.projector.helper.utils.distributions import parse_filename
+        self.assertEqual(parse_filename("infi.execute-0.1.8-py3-none-any.whl"), ("infi.execute", "0.1.8"))
+        self.assertEqual(parse_filename("zope.interface-5.4.0-py3.8-linux-x86_64.egg"), ("zope.interface", "5.4.0"))
+        self.assertEqual(parse_filename("backports.ssl-match-hostname-3.7.0.1.tar.gz"),
+                         ("backports.ssl-match-hostname", "3.7.0.1"))
+        self.assertEqual(parse_filename("README.md"), None)
+
+    def test_render_version_templates(self):
+        from infi.projector.helper.utils import version_templates
+        from mock import patch
+        from os import path
+        from re import findall
+        version_section = dict.fromkeys(findall(r":(\w+)\}", version_templates.DEFAULT_TEMPLATE), "''")
+        version_section.update(version="1.2.3")
+        with self.temporary_directory_context():
+            with open("buildout.cfg", "w") as fd:
+                fd.write("[project]\nname = infi.example\nversion_file = src/infi/example/__version__.py\n"
+                         "install_requires = [\n\t'six'\n\t]\n"
+                         "[setup.py]\nrecipe = infi.recipe.template.version\ninput = setup.in\noutput = setup.py\n"
+                         "[__version__.py]\nrecipe = infi.recipe.template.version\noutput = ${project:version_file}\n")
+            with open("setup.in", "w") as fd:
+                fd.write("name = '${project:name}'\nversion = '${infi.recipe.template.version:version}'\n"
+                         "install_requires = ${project:install_requires}\noutput = '${output}'\n")
+            with patch.object(version_templates, "get_version_section", return_value=version_section):
+                written = version_templates.render_version_templates()
+                self.assertEqual(sorted(written), ["setup.py", "src/infi/example/__version__.py"])
+                with open("setup.py") as fd:
+                    self.assertEqual(fd.read(), "name = 'infi.example'\nversion = '1.2.3'\n"
+                                                "install_requires = [\n'six'\n]\noutput = 'setup.py'\n")
+                self.assertEqual(version_templates.render_version_templates(), [])
+            with open("buildout.cfg", "a") as fd:
+                fd.write("[indented]\nrecipe = infi.recipe.template.version\noutput = indented.py\ninline =\n"
+                         "    def main():\n        return '${project:name}'\n\n    # the end\n"
+                         "# a comment\n")
+            with patch.object(version_templates, "get_version_section", return_value=version_section):
+                self.assertEqual(version_templates.render_version_templates(), ["indented.py"])
+            with open("indented.py") as fd:
+                # like buildout, the relative indentation of the block and its blank lines are kept
+                self.assertEqual(fd.read(), "def main():\n    return 'infi.example'\n\n# the end")
+            with open("buildout.cfg", "a") as fd:
+                fd.write("[buildout]\nextends = base.cfg\n")
+            with self.assertRaises(version_templates.TemplateError):
+                version_templates.render_version_templates()
+
+    def test_homepage_protocol_is_cached(self):
+        from infi.projector.helper.utils import version_templates
+        from mock import patch
+        from os import environ
+        url = "git@git.example.com:group/project.git"
+        with self.temporary_directory_context() as tempdir:
+            with patch.dict(environ, PROJECTOR_CACHE_DIR=tempdir), \
+                    patch("six.moves.urllib.request.urlopen", side_effect=IOError("unreachable")) as urlopen:
+                self.assertEqual(version_templates._translate_clone_url_to_homepage(url),
+                                 "http://git.example.com/group/project")
+                self.assertEqual(version_templates._translate_clone_url_to_homepage(url),
+                                 "http://git.example.com/group/project")
+            urlopen.assert_called_once_with("https://git.example.com", timeout=version_templates.HOMEPAGE_PROBE_TIMEOUT)
+
+    def test_execute_buildout_in_process(self):
+        from infi.projector.helper import utils
+        from mock import patch
+        from types import ModuleType
+        from os import environ
+        import sys
+        import logging
+        module = ModuleType("zc.buildout.buildout")
+        easy_install = ModuleType("zc.buildout.easy_install")
+
+        class Installer(object):
+            _picked_versions = {}
+            _required_by = {}
+        easy_install.Installer, easy_install._indexes = Installer, {}
+
+        def main(args):
+            sys.stdout.write("installing {} after {}\n".format(environ.get("PROJECTOR_TEST_ENV"),
+                                                               sorted(Installer._picked_versions)))
+            sys.path.append("some-recipe.egg")
+            sys.modules["some_recipe"] = ModuleType("some_recipe")
+            Installer._picked_versions[args[-1]] = "1.0"
+            logging.shutdown()
+            if args[-1] == "broken":
+                sys.stderr.write("While:\n  Installing broken.\n")
+                sys.exit(1)
+        module.main = main
+        modules = {"zc": ModuleType("zc"), "zc.buildout": ModuleType("zc.buildout"), "zc.buildout.buildout": module,
+                   "zc.buildout.easy_install": easy_install}
+        modules["zc"].buildout, modules["zc.buildout"].buildout = modules["zc.buildout"], module
+        with patch.dict(sys.modules, modules), patch.object(logging, "shutdown") as shutdown:
+            result = utils.execute_buildout_in_process(["install", "part"], env=dict(PROJECTOR_TEST_ENV="value"))
+            self.assertEqual(result.get_stdout(), b"installing value after []\n")
+            self.assertNotIn("PROJECTOR_TEST_ENV", environ)
+            self.assertNotIn("some-recipe.egg", sys.path)
+            self.assertNotIn("some_recipe", sys.modules)
+            self.assertEqual(Installer._picked_versions, {})
+            self.assertFalse(shutdown.called)
+            # the versions picked by the previous run are not reported again
+            result = utils.execute_buildout_in_process(["install", "other"])
+            self.assertEqual(result.get_stdout(), b"installing None after []\n")
+            with self.assertRaises(utils.PrettyExecutionError) as context:
+                utils.execute_buildout_in_process(["install", "broken"])
+            self.assertIn(b"Installing broken", context.exception.result.get_stderr())
+
+    def test_run_parallel(self):
+        import sys
+        from time import time
+        if sys.version_info[0] < 3:
+            raise SkipTest("asyncio is not available")
+        from infi.projector.helper.utils import PrettyExecutionError
+        from infi.projector.helper.utils import async_execution
+        from infi.projector.helper.utils.async_execution import run_parallel, Scheduler
+        from threading import Thread
+        from os import environ, path
+        from mock import patch
+        with patch.dict(environ, PROJECTOR_JOBS="all"), patch.object(async_execution.logger, "warning") as warning:
+            self.assertGreaterEqual(Scheduler().limit, 1)
+            self.assertEqual(warning.call_count, 1)
+        patch.object(async_execution, "_SCHEDULER", Scheduler(limit=1)).start()
+        self.addCleanup(patch.stopall)
+        with self.assertRaises(OSError):     # frees its slot for the commands below
+            run_parallel([[path.join(path.dirname(sys.executable), "does-not-exist")]])
+        # the limit is shared by the event loops of all the threads
+        threads = [Thread(target=run_parallel, args=([[sys.executable, "-c", "import time; time.sleep(1)"]],))
+                   for _ in range(2)]
+        started = time()
+        [thread.start() for thread in threads]
+        [thread.join() for thread in threads]
+        self.assertGreaterEqual(time() - started, 2)
+        patch.object(async_execution, "_SCHEDULER", Scheduler(limit=4)).start()
+        results = run_parallel([[sys.executable, "-c", "print({})".format(index)] for index in range(4)])
+        self.assertEqual([result.get_stdout().strip() for result in results], [b"0", b"1", b"2", b"3"])
+        started = time()
+        with self.assertRaises(PrettyExecutionError):
+            run_parallel([[sys.executable, "-c", "import time; time.sleep(30)"], [sys.executable, "-c", "exit(3)"]])
+        self.assertLess(time() - started, 20)
+        with self.assertRaises(PrettyExecutionError) as context:
+            run_parallel([[sys.executable, "-c", "import time; time.sleep(30)"]], timeout=0.5)
+        self.assertIn(b"Timed out", context.exception.result.get_stderr())
+
+    def test_execute_assert_success_streams_output(self):
+        import sys
+        from os import path, listdir
+        from infi.projector.helper import utils
+        from mock import patch
+        with self.temporary_directory_context():
+            with open("buildout.cfg", "w") as fd:
+                fd.write("[buildout]\n")
+            script = "import sys; sys.stdout.write('x' * 100000); sys.stderr.write('failed'); sys.exit(2)"
+            with patch.object(utils, "OUTPUT_TAIL_SIZE", 1000), patch.object(utils, "_write_to_console") as console:
+                with utils.stage_context("scripts"), self.assertRaises(utils.PrettyExecutionError) as context:
+                    utils.execute_assert_success([sys.executable, "-c", script])
+            self.assertTrue(console.called)
+            result = context.exception.result
+            self.assertEqual(result.get_returncode(), 2)
+            self.assertEqual(result.get_stderr(), b"failed")
+            self.assertEqual(result.get_stdout(), b"x" * 1000)
+            with open(path.join("parts", "projector", "logs", "scripts.log"), "rb") as fd:
+                self.assertIn(b"x" * 100000, fd.read())
+            with patch.object(utils, "_write_to_console"):
+                utils.execute_assert_success([sys.executable, "-c", "pass"])
+            self.assertEqual(listdir(path.join("parts", "projector", "logs")), ["scripts.log"])
+            with patch.object(utils, "_write_to_console"), utils.stage_context("scripts"):
+                utils.execute_assert_success([sys.executable, "-c", "print('again')"])
+            with open(path.join("parts", "projector", "logs", "scripts.log"), "rb") as fd:
+                content = fd.read()
+            self.assertIn(b"again", content)
+            self.assertNotIn(b"x" * 100000, content)
+
+    def test_interpreter_facts_are_cached_by_mtime(self):
+        from infi.projector.helper import utils
+        from mock import patch, Mock
+        from os import path, environ, utime, makedirs
+        with self.temporary_directory_context() as tempdir:
+            interpreter = path.join(tempdir, "python")
+            with open(interpreter, "w") as fd:
+                fd.write("")
+            compute = Mock(return_value=True)
+            with patch.dict(environ, PROJECTOR_CACHE_DIR=path.join(tempdir, "cache")), \
+                    patch.object(utils, "INTERPRETERS", {}) as interpreters:
+                self.assertTrue(utils.get_interpreter_fact(interpreter, "no_site", compute))
+                interpreters.clear()    # a new process reads the facts from the cache directory
+                self.assertTrue(utils.get_interpreter_fact(interpreter, "no_site", compute))
+                self.assertEqual(compute.call_count, 1)
+                utime(interpreter, (0, 0))
+                self.assertTrue(utils.get_interpreter_fact(interpreter, "no_site", compute))
+                self.assertEqual(compute.call_count, 2)
+                makedirs("site-packages")
+                self.assertTrue(utils.get_interpreter_fact(interpreter, "no_site", compute, ["site-packages"]))
+                self.assertTrue(utils.get_interpreter_fact(interpreter, "no_site", compute, ["site-packages"]))
+                self.assertEqual(compute.call_count, 3)
+                utime("site-packages", (0, 0))  # a package was installed or removed
+                self.assertTrue(utils.get_interpreter_fact(interpreter, "no_site", compute, ["site-packages"]))
+                self.assertEqual(compute.call_count, 4)
+                with patch.object(utils, "get_python_interpreter", return_value=interpreter), \
+                        patch.object(utils, "is_running_inside_virtualenv", return_value=False), \
+                        patch.object(utils, "is_no_site_supported", return_value=True), \
+                        patch.object(utils, "execute_assert_success",
+                                     side_effect=utils.PrettyExecutionError(utils.ExecutionResult([], 1, b'', b''))) as execute:
+                    with self.assertRaises(utils.PrettyExecutionError):
+                        utils.execute_with_python("setup.py develop")
+                    execute.assert_called_once_with([interpreter, "-S", "setup.py", "develop"])
+                with patch.object(utils, "get_python_interpreter", return_value=interpreter), \
+                        patch.object(utils, "is_no_site_supported", return_value=False), \
+                        patch.object(utils, "execute_assert_success",
+                                     side_effect=utils.PrettyExecutionError(utils.ExecutionResult([], 1, b'', b''))) as execute:
+                    with self.assertRaises(utils.PrettyExecutionError):
+                        utils.execute_with_python("setup.py develop")
+                    execute.assert_called_once_with([interpreter, "setup.py", "develop"])
+
+    def test_execution_context_is_isolated(self):
+        from infi.projector.helper import utils, assertions
+        from infi.projector.helper.utils import shared_eggs
+        from infi.projector.plugins.builtins.devenv import DevEnvPlugin
+        from mock import patch
+        from threading import Thread
+        from os import path, makedirs
+        with self.temporary_directory_context() as tempdir:
+            for name in ("a", "b"):
+                makedirs(name)
+                with open(path.join(name, "buildout.cfg"), "w") as fd:
+                    fd.write("[project]\nname = {}\n".format(name))
+            names = dict()
+
+            def read_project_name(name):
+                with utils.project_context(path.join(tempdir, name)), utils.buildout_parameters_context([name]):
+                    with utils.open_buildout_configfile() as buildout:
+                        names[name] = (buildout.get("project", "name"), utils.get_buildout_parameters())
+            with utils.buildout_parameters_context(["buildout:develop="]):
+                threads = [Thread(target=read_project_name, args=(name, )) for name in ("a", "b")]
+                [thread.start() for thread in threads]
+                [thread.join() for thread in threads]
+                self.assertEqual(utils.get_buildout_parameters(), ["buildout:develop="])
+            self.assertEqual(utils.get_buildout_parameters(), [])
+            self.assertEqual(names["a"][0], "a")
+            self.assertEqual(names["b"][0], "b")
+            self.assertNotIn("a", names["b"][1])
+            with patch.object(utils, "BUILDOUT_PARAMETERS", ["buildout:newest=false"]):
+                with utils.buildout_parameters_context(["buildout:develop="]):
+                    self.assertEqual(utils.get_buildout_parameters(), ["buildout:newest=false", "buildout:develop="])
+            makedirs(path.join("parts", "python", "bin"))
+            makedirs(path.join("a", "parts", "python", "bin"))
+            with open(path.join("parts", "python", "bin", "python.exe" if assertions.is_windows() else "python"), "w"):
+                pass
+            with utils.project_context(path.join(tempdir, "a")):
+                self.assertEqual(shared_eggs.get_eggs_directory(), path.join(tempdir, "a", "eggs"))
+                self.assertFalse(assertions.is_isolated_python_exists())
+                plugin = DevEnvPlugin()
+                self.assertEqual(plugin._get_project_directory(), path.join(tempdir, "a"))
+                self.assertEqual(plugin.get_toolkit_env("toolkit-1.0.0-linux-x64.tar.gz")["OPENSSL_DIR"],
+                                 path.join(tempdir, "a", "parts", "python"))
+                plugin.clean_build()
+            self.assertFalse(path.exists(path.join("a", "parts")))
+            self.assertTrue(path.exists("parts"))
+
+    def _write_distribution(self, dirpath, project_name, version, requires=()):
+        from zipfile import ZipFile
+        from os import path, makedirs
+        if not path.isdir(dirpath):
+            makedirs(dirpath)
+        filepath = path.join(dirpath, "{}-{}-py2.py3-none-any.whl".format(project_name, version))
+        metadata = "Metadata-Version: 2.1\nName: {}\nVersion: {}\n".format(project_name, version)
+        metadata += "".join("Requires-Dist: {}\n".format(item) for item in requires)
+        with ZipFile(filepath, "w") as archive:
+            archive.writestr("{}-{}.dist-info/METADATA".format(project_name, version), metadata)
+        return filepath
+
+    def test_resolve_project(self):
+        from infi.projector.helper.utils import resolver
+        from os import path, makedirs
+        with self.temporary_directory_context():
+            with open("buildout.cfg", "w") as fd:
+                fd.write("[buildout]\ndownload-cache = .cache\nprefer-final = true\n"
+                         "[project]\nname = infi.example\ninstall_requires = ['alpha', 'gamma==1.0']\n"
+                         "[development-scripts]\nrecipe = infi.recipe.console_scripts\n"
+                         "eggs = ${project:name}\n\tbeta\n")
+            cache = path.join(".cache", "dist")
+            self._write_distribution(cache, "alpha", "1.0", ["beta>=2.0", "delta; python_version < '2.0'"])
+            self._write_distribution(cache, "alpha", "1.1rc1")
+            self._write_distribution(cache, "beta", "2.1")
+            self._write_distribution(cache, "beta", "3.0", ["gamma>1.0"])
+            self._write_distribution(cache, "gamma", "1.0")
+            self._write_distribution(cache, "infi.recipe.console_scripts", "0.5", ["beta<3"])
+            makedirs(path.join("eggs", "beta-2.0-py3.8.egg", "EGG-INFO"))
+            makedirs(path.join("parts", "python", "lib", "python3.8", "site-packages", "broken.dist-info"))
+            resolution = resolver.resolve_project()
+            self.assertEqual(resolution.get_picked_versions(),
+                             [("alpha", "1.0"), ("beta", "2.0"), ("infi.recipe.console-scripts", "0.5")])
+            self.assertIn("# Required by:\n# alpha==1.0\n# infi.recipe.console-scripts==0.5\nbeta = 2.0",
+                          resolution.format_picked_versions())
+            self.assertEqual(resolver.resolve_project(newest=True).get_picked_versions()[1], ("beta", "2.1"))
+            with open("buildout.cfg", "a") as fd:
+                fd.write("\tepsilon\n")
+            with self.assertRaises(resolver.ResolutionError):
+                resolver.resolve_project()
+            with open("buildout.cfg", "a") as fd:
+                fd.write("\tbeta[\n")
+            with self.assertRaises(resolver.ResolutionError) as context:
+                resolver.resolve_project()
+            self.assertIn("Invalid requirement", str(context.exception))
+
+    def test_resolve_targets(self):
+        from infi.projector.helper.utils import resolver, freeze_versions_matrix, unfreeze_versions, open_tempfile
+        from infi.projector.helper.utils import freeze_versions
+        from infi.projector.helper.utils import open_buildout_configfile
+        from os import path, rename
+        with self.temporary_directory_context():
+            with open("buildout.cfg", "w") as fd:
+                fd.write("[buildout]\ndownload-cache = .cache\n"
+                         "[project]\nname = infi.example\ninstall_requires = ['alpha']\n"
+                         "[development-scripts]\neggs = ${project:name}\n"
+                         "[freeze-matrix]\ntargets = 3.8 linux_x86_64\n\t3.6 win_amd64\n")
+            cache = path.join(".cache", "dist")
+            self._write_distribution(cache, "alpha", "1.0", ["native", "pywin32; sys_platform == 'win32'",
+                                                             "importlib-metadata; python_version < '3.8'"])
+            self._write_distribution(cache, "native", "1.0")
+            filepath = self._write_distribution(cache, "native", "2.0")
+            rename(filepath, path.join(cache, "native-2.0-cp38-cp38-manylinux_2_17_x86_64.whl"))
+            self._write_distribution(cache, "pywin32", "300")
+            self._write_distribution(cache, "importlib_metadata", "4.0")
+            with open_buildout_configfile() as buildout:
+                targets = resolver.parse_targets(buildout.get("freeze-matrix", "targets"))
+            self.assertEqual([target.get_key() for target in targets], ["py38-linux_x86_64", "py36-win_amd64"])
+            results = resolver.resolve_targets(targets)
+            self.assertEqual(sorted(results), ["py36-win_amd64", "py38-linux_x86_64"])
+            self.assertIn("native = 2.0", results["py38-linux_x86_64"])
+            self.assertNotIn("pywin32", results["py38-linux_x86_64"])
+            self.assertIn("native = 1.0", results["py36-win_amd64"])
+            self.assertIn("pywin32 = 300", results["py36-win_amd64"])
+            self.assertIn("importlib-metadata = 4.0", results["py36-win_amd64"])
+            with open_tempfile() as linux, open_tempfile() as windows:
+                for filepath, key in [(linux, "py38-linux_x86_64"), (windows, "py36-win_amd64")]:
+                    with open(filepath, "w") as fd:
+                        fd.write("[versions]\n" + results[key])
+                freeze_versions_matrix({"py38-linux_x86_64": linux, "py36-win_amd64": windows}, True)
+            with open_buildout_configfile() as buildout:
+                self.assertEqual(buildout.get("versions-py38-linux_x86_64", "native"), "2.0")
+                self.assertEqual(buildout.get("versions-py36-win_amd64", "native"), "1.0")
+                self.assertFalse(buildout.has_section("versions"))
+                self.assertIn("alpha>=1.0", buildout.get("project", "install_requires"))
+            with open_tempfile() as versions_file:
+                with open(versions_file, "w") as fd:
+                    fd.write("[versions]\n" + results["py38-linux_x86_64"])
+                freeze_versions(versions_file, False)
+            with open_buildout_configfile() as buildout:
+                # a plain freeze replaces the matrix, which would otherwise take precedence over [versions]
+                self.assertEqual([section for section in buildout.sections() if section.startswith("versions")],
+                                 ["versions"])
+                self.assertEqual(buildout.get("versions", "native"), "2.0")
+            unfreeze_versions(False)
+            with open_buildout_configfile() as buildout:
+                self.assertFalse(any(section.startswith("versions") for section in buildout.sections()))
+
+    def test_eggs_installer(self):
+        from infi.projector.helper.utils.installers import get_installer, InstallError
+        from infi.projector.helper.utils import lockfile
+        from zipfile import ZipFile
+        from os import path, listdir
+        import sys
+        with self.temporary_directory_context():
+            with open("buildout.cfg", "w") as fd:
+                fd.write("[buildout]\ndownload-cache = .cache\n[versions]\nalpha = 1.0\nbeta = 2.0\n")
+            cache = path.join(".cache", "dist")
+            for name, version in [("alpha", "1.0"), ("beta", "2.0"), ("beta", "3.0")]:
+                filepath = self._write_distribution(cache, name, version)
+                with ZipFile(filepath, "a") as archive:
+                    archive.writestr("{}-{}.dist-info/WHEEL".format(name, version),
+                                     "Wheel-Version: 1.0\nRoot-Is-Purelib: true\nTag: py2-none-any\nTag: py3-none-any\n")
+                    archive.writestr("{}.py".format(name), "VERSION = {!r}\n".format(version))
+            lock = lockfile.build_lock()
+            installer = get_installer("eggs", sys.executable, [cache], "eggs", lock=lock)
+            pins = [("alpha", "1.0"), ("beta", "2.0"), ("setuptools", "44.0")]
+            self.assertEqual(len(installer.install_pinned(pins)), 2)
+            self.assertEqual(sorted(basename.split("-")[:2] for basename in listdir("eggs")),
+                             [["alpha", "1.0"], ["beta", "2.0"]])
+            self.assertEqual(installer.install_pinned(pins), [])
+            with self.assertRaises(InstallError):
+                installer.install_pinned([("gamma", "1.0")])
+            with open(path.join(cache, "beta-3.0-py2.py3-none-any.whl"), "ab") as fd:
+                fd.write(b"tampered")
+            lock["packages"].append(dict(name="beta", version="3.0", files=[
+                dict(filename="beta-3.0-py2.py3-none-any.whl", size=0, sha256="0" * 64)]))
+            with self.assertRaises(InstallError):
+                installer.install_pinned([("beta", "3.0")])
+            broken = path.join(cache, "gamma-1.0-py{}.{}.egg".format(*sys.version_info[:2]))
+            with open(broken, "w") as fd:
+                fd.write("not a zip file")
+            with self.assertRaises(InstallError) as context:
+                installer.install_pinned([("gamma", "1.0")])
+            self.assertIn(path.abspath(broken), str(context.exception))
+
+    def test_installed_index(self):
+        from infi.projector.helper.utils.installed_index import open_installed_index
+        from os import path, makedirs, remove
+        from shutil import rmtree
+        with self.temporary_directory_context():
+            with open("buildout.cfg", "w") as fd:
+                fd.write("[buildout]\n")
+            for basename, requires in [("six-1.16.0-py3.8.egg", ""),
+                                       ("mock-3.0.5-py3.8.egg", "six\n\n[test]\npytest\n\n[:python_version < '3']\nfuncsigs\n")]:
+                makedirs(path.join("eggs", basename, "EGG-INFO"))
+                with open(path.join("eggs", basename, "EGG-INFO", "requires.txt"), "w") as fd:
+                    fd.write(requires)
+            with open(path.join("eggs", "mock-3.0.5-py3.8.egg", "EGG-INFO", "entry_points.txt"), "w") as fd:
+                fd.write("[console_scripts]\nmock = mock.main:run\n")
+            site_packages = path.join("parts", "python", "lib", "python3.8", "site-packages", "pip-21.0.dist-info")
+            makedirs(site_packages)
+            with open(path.join(site_packages, "METADATA"), "w") as fd:
+                fd.write("Metadata-Version: 2.1\nName: pip\nVersion: 21.0\n")
+            with open_installed_index() as index:
+                self.assertEqual([dist.name for dist in index.get_distributions()], ["mock", "pip", "six"])
+                mock, = index.get_distributions("Mock")
+                self.assertEqual(sorted((item.key, item.extra, item.marker) for item in index.get_requires(mock)),
+                                 [("funcsigs", "", "python_version < \"3\""), ("pytest", "test", ""), ("six", "", "")])
+                self.assertEqual([dist.name for dist, _ in index.get_required_by("six")], ["mock"])
+                self.assertEqual([item.value for item in index.get_entry_points("console_scripts")], ["mock.main:run"])
+                self.assertEqual(index.update(), 0)
+            rmtree(path.join("eggs", "six-1.16.0-py3.8.egg"))
+            with open_installed_index() as index:
+                self.assertEqual(index.get_versions("six"), [])
+                self.assertEqual(len(index.get_distributions()), 2)
+
+    def test_dependency_graph(self):
+        from infi.projector.helper.utils.installed_index import open_installed_index
+        from infi.projector.helper.utils.dependency_graph import build_dependency_graph
+        from infi.projector.helper.utils.resolver import ResolutionError
+        from os import path, makedirs
+        import json
+        with self.temporary_directory_context():
+            with open("buildout.cfg", "w") as fd:
+                fd.write("[project]\nname = infi.example\ninstall_requires = ['alpha']\n"
+                         "[development-scripts]\nrecipe = infi.recipe.console_scripts\n"
+                         "eggs = ${project:name}\n\tbeta\n")
+            for basename, requires in [("alpha-1.0-py3.8.egg", "beta>=1\ngamma[extra]\n\n[:python_version < '2']\nomega\n"),
+                                       ("beta-1.0-py3.8.egg", "gamma\n"),
+                                       ("gamma-2.0-py3.8.egg", "\n[extra]\ndelta\n")]:
+                makedirs(path.join("eggs", basename, "EGG-INFO"))
+                with open(path.join("eggs", basename, "EGG-INFO", "requires.txt"), "w") as fd:
+                    fd.write(requires)
+            with open_installed_index() as index:
+                graph = build_dependency_graph(index)
+            self.assertEqual(graph.format_tree().splitlines(),
+                             ["infi.example",
+                              "    alpha==1.0 [requires: alpha]",
+                              "        beta==1.0 [requires: beta>=1]",
+                              "            gamma==2.0 [requires: gamma]",
+                              "                delta (not installed) [requires: delta]",
+                              "        gamma==2.0 [requires: gamma[extra]] (*)",
+                              "    beta==1.0 [requires: beta] (*)"])
+            self.assertEqual(graph.format_reverse_tree("Delta").splitlines(),
+                             ["delta (not installed)",
+                              "    gamma==2.0 [requires: delta]",
+                              "        alpha==1.0 [requires: gamma[extra]]",
+                              "            infi.example [requires: alpha]",
+                              "        beta==1.0 [requires: gamma]",
+                              "            infi.example [requires: beta]",
+                              "            alpha==1.0 [requires: beta>=1] (*)"])
+            self.assertIsNone(graph.format_reverse_tree("omega"))
+            self.assertEqual(len(json.loads(graph.to_json())["edges"]), 6)
+            self.assertIn('"alpha" -> "gamma" [label="gamma[extra]"];', graph.to_dot())
+            with open("buildout.cfg", "a") as fd:
+                fd.write("\tbeta[\n")
+            with open_installed_index() as index:
+                with self.assertRaises(ResolutionError):
+                    build_dependency_graph(index)
+
+    def test_simple_index_client(self):
+        from infi.projector.helper.utils.simple_index import SimpleIndexClient
+        from six.moves.BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+        from six.moves.socketserver import ThreadingMixIn
+        from threading import Thread
+        from os import path, makedirs
+        requests = []
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                requests.append((self.path, self.headers.get("If-None-Match")))
+                if self.path == "/simple/Six/":
+                    self.send_response(301)
+                    self.send_header("Location", "/simple/six/")
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                if self.headers.get("If-None-Match") == '"v1"':
+                    self.send_response(304)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                body = b'{"files": [{"filename": "six-1.16.0-py2.py3-none-any.whl"}, ' \
+                       b'{"filename": "six-1.17.0b1.tar.gz"}, {"filename": "six-1.15.0.tar.gz", "yanked": true}]}'
+                self.send_response(200)
+                self.send_header("Content-Type", "application/vnd.pypi.simple.v1+json")
+                self.send_header("ETag", '"v1"')
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args, **kwargs):
+                pass
+        class Server(ThreadingMixIn, HTTPServer):
+            daemon_threads = True
+        server = Server(("127.0.0.1", 0), Handler)
+        thread = Thread(target=server.serve_forever)
+        thread.start()
+        try:
+            with self.temporary_directory_context() as tempdir:
+                client = SimpleIndexClient("http://127.0.0.1:{}/simple".format(server.server_port),
+                                           cache_directory=tempdir)
+                self.assertEqual(client.get_versions("six"), set(["1.16.0", "1.17.0b1"]))
+                self.assertEqual(client.get_versions_of(["six"]), {"six": set(["1.16.0", "1.17.0b1"])})
+                self.assertEqual(client.fetch(client.index_url + "Six/")[1], "application/vnd.pypi.simple.v1+json")
+                client.close()
+                self.assertEqual(requests, [("/simple/six/", None), ("/simple/six/", '"v1"'),
+                                            ("/simple/Six/", None), ("/simple/six/", '"v1"')])
+                makedirs(path.join("local", "six"))
+                with open(path.join("local", "six", "index.html"), "w") as fd:
+                    fd.write('<a href="six-1.16.0.tar.gz#sha256=00">six-1.16.0.tar.gz</a>\n'
+                             '<a href="six-1.0.0.tar.gz" data-yanked="">six-1.0.0.tar.gz</a>\n')
+                self.assertEqual(SimpleIndexClient(path.join(tempdir, "local")).get_versions("six"), set(["1.16.0"]))
+        finally:
+            server.shutdown()
+            server.server_close()
+            thread.join()
+
+    def test_resumable_download_of_complete_partial_file(self):
+        from infi.projector.helper.utils.downloads import ResumableDownload
+        from six.moves.BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+        from threading import Thread
+        from hashlib import sha256
+        content = b"toolkit" * 1000
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                offset = int((self.headers.get("Range") or "bytes=0-")[len("bytes="):-1])
+                if offset >= len(content):
+                    self.send_response(416)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                self.send_response(206 if offset else 200)
+                self.send_header("Content-Length", str(len(content) - offset))
+                self.end_headers()
+                self.wfile.write(content[offset:])
+
+            def log_message(self, *args, **kwargs):
+                pass
+        server = HTTPServer(("127.0.0.1", 0), Handler)
+        thread = Thread(target=server.serve_forever)
+        thread.start()
+        try:
+            with self.temporary_directory_context():
+                with open("toolkit.tar.gz.part", "wb") as fd:
+                    fd.write(content)
+                url = "http://127.0.0.1:{}/toolkit.tar.gz".format(server.server_port)
+                with ResumableDownload(url, "toolkit.tar.gz.part") as reader:
+                    reader.read_to_end()
+                self.assertEqual(reader.hexdigest(), sha256(content).hexdigest())
+                self.assertEqual(reader.offset, len(content))
+        finally:
+            server.shutdown()
+            server.server_close()
+            thread.join()
+
+    def test_prefetch(self):
+        from infi.projector.helper.utils.prefetch import Prefetcher, PrefetchError
+        from infi.projector.helper.utils.simple_index import SimpleIndexClient
+        from infi.projector.helper.utils.resolver import Target
+        from six.moves.BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+        from six.moves.socketserver import ThreadingMixIn
+        from pkg_resources import Requirement
+        from threading import Thread
+        from hashlib import sha256
+        from os import path, listdir, makedirs
+        files = {}
+        pages = {}
+        requests = []
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                requests.append((self.path, self.headers.get("Range")))
+                body = pages.get(self.path) or files.get(self.path.split("/")[-1])
+                status = 200 if body is not None else 404
+                body = body or b""
+                if status == 200 and self.headers.get("Range"):
+                    body, status = body[int(self.headers["Range"][len("bytes="):-1]):], 206
+                self.send_response(status)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args, **kwargs):
+                pass
+        class Server(ThreadingMixIn, HTTPServer):
+            daemon_threads = True
+        server = Server(("127.0.0.1", 0), Handler)
+        thread = Thread(target=server.serve_forever)
+        thread.start()
+        try:
+            with self.temporary_directory_context() as tempdir:
+                for name, version, requires in [("alpha", "1.0", ["beta>=2", "pywin32; sys_platform == 'win32'"]),
+                                                ("alpha", "2.0b1", []), ("beta", "2.0", []), ("beta", "3.0", [])]:
+                    with open(self._write_distribution("index", name, version, requires), "rb") as fd:
+                        files["{}-{}-py2.py3-none-any.whl".format(name, version)] = fd.read()
+                for name in ["alpha", "beta"]:
+                    pages["/simple/{}/".format(name)] = "".join(
+                        '<a href="/files/{0}#sha256={1}">{0}</a>'.format(filename, sha256(content).hexdigest())
+                        for filename, content in sorted(files.items()) if filename.startswith(name)).encode()
+                client = SimpleIndexClient("http://127.0.0.1:{}/simple".format(server.server_port),
+                                           cache_directory=tempdir)
+                prefetcher = Prefetcher(client, "dist", Target("3.8", "linux_x86_64"))
+                makedirs("dist")
+                with open(path.join("dist", "beta-2.0-py2.py3-none-any.whl.part"), "wb") as fd:
+                    fd.write(files["beta-2.0-py2.py3-none-any.whl"][:10])
+                self.assertEqual(len(prefetcher.prefetch_pinned([("alpha", "1.0"), ("beta", "2.0")])), 2)
+                self.assertIn(("/files/beta-2.0-py2.py3-none-any.whl", "bytes=10-"), requests)
+                self.assertEqual(sorted(listdir("dist")), ["alpha-1.0-py2.py3-none-any.whl",
+                                                           "beta-2.0-py2.py3-none-any.whl"])
+                self.assertEqual(prefetcher.prefetch_pinned([("alpha", "1.0"), ("beta", "2.0")]), [])
+                downloaded = prefetcher.prefetch_requirements([Requirement.parse("alpha")])
+                self.assertEqual(downloaded, [])
+                downloaded = prefetcher.prefetch_requirements([Requirement.parse("alpha>1.0"),
+                                                               Requirement.parse("beta>2")])
+                self.assertEqual([path.basename(item) for item in downloaded],
+                                 ["alpha-2.0b1-py2.py3-none-any.whl", "beta-3.0-py2.py3-none-any.whl"])
+                files["beta-3.0-py2.py3-none-any.whl"] += b"tampered"
+                with self.assertRaises(PrefetchError):
+                    Prefetcher(client, "other", Target("3.8", "linux_x86_64")).prefetch_pinned([("beta", "3.0")])
+                client.close()
+        finally:
+            server.shutdown()
+            server.server_close()
+            thread.join()
+
+    def test_mirror(self):
+        from infi.projector.helper.utils.mirror import build_mirror, create_mirror_server, get_mirror_url
+        from infi.projector.helper.utils.simple_index import SimpleIndexClient
+        from threading import Thread
+        from os import path, remove, listdir
+        with self.temporary_directory_context() as tempdir:
+            with open("buildout.cfg", "w") as fd:
+                fd.write("[buildout]\ndownload-cache = .cache\n")
+            for name, version in [("Alpha.Beta", "1.0"), ("Alpha.Beta", "2.0"), ("gamma", "1.0")]:
+                self._write_distribution(path.join(".cache", "dist"), name, version)
+            self.assertEqual(build_mirror(), 2)
+            self.assertEqual(sorted(listdir(path.join(".cache", "simple"))), ["alpha-beta", "gamma", "index.html"])
+            self.assertEqual(build_mirror(), 0)
+            client = SimpleIndexClient(get_mirror_url(), cache_directory=tempdir)
+            project_files = client.get_project_links("alpha.beta")
+            self.assertEqual(sorted(item.filename for item in project_files),
+                             ["Alpha.Beta-1.0-py2.py3-none-any.whl", "Alpha.Beta-2.0-py2.py3-none-any.whl"])
+            self.assertTrue(all(path.exists(item.url) and "sha256" in item.hashes for item in project_files))
+            server = create_mirror_server(port=0)
+            thread = Thread(target=server.serve_forever)
+            thread.start()
+            try:
+                client = SimpleIndexClient("http://127.0.0.1:{}/simple".format(server.server_port),
+                                           cache_directory=tempdir)
+                self.assertEqual(client.get_versions("alpha-beta"), set(["1.0", "2.0"]))
+                project_file, = client.get_project_links("gamma")
+                downloaded = client.download(project_file, "downloads", "sha256", project_file.hashes["sha256"])
+                self.assertEqual(path.basename(downloaded), "gamma-1.0-py2.py3-none-any.whl")
+                client.close()
+            finally:
+                server.shutdown()
+                server.server_close()
+                thread.join()
+            remove(path.join(".cache", "dist", "gamma-1.0-py2.py3-none-any.whl"))
+            self.assertEqual(build_mirror(), 1)
+            self.assertFalse(path.exists(path.join(".cache", "simple", "gamma")))
+
+    def test_lockfile(self):
+        from infi.projector.helper.utils import lockfile, downloads
+        from mock import patch
+        from os import path, makedirs, environ
+        import json
+        with self.temporary_directory_context() as tempdir:
+            with open("buildout.cfg", "w") as fd:
+                fd.write("[buildout]\ndownload-cache = .cache\n[versions]\nsix = 1.16.0\nmock = 3.0.5\nnose = 1.3.7\n")
+            makedirs(path.join(".cache", "dist"))
+            for basename in ["six-1.16.0.tar.gz", "six-1.16.0-py2.py3-none-any.whl", "six-1.15.0.tar.gz",
+                             "mock-3.0.5.tar.gz"]:
+                with open(path.join(".cache", "dist", basename), "w") as fd:
+                    fd.write(basename)
+            with patch.dict(environ, {"PROJECTOR_CACHE_DIR": path.join(tempdir, "cache")}):
+                lockfile.write_lock(lockfile.build_lock())
+                with patch.object(downloads, "get_file_hexdigest") as get_file_hexdigest:
+                    self.assertEqual(lockfile.build_lock(), lockfile.read_lock())
+                    self.assertFalse(get_file_hexdigest.called)
+            with open("buildout.lock.json") as fd:
+                packages = {package["name"]: package for package in json.load(fd)["packages"]}
+            self.assertEqual(sorted(item["filename"] for item in packages["six"]["files"]),
+                             ["six-1.16.0-py2.py3-none-any.whl", "six-1.16.0.tar.gz"])
+            self.assertEqual(packages["mock"]["files"][0]["sha256"], downloads.get_file_hexdigest(
+                path.join(".cache", "dist", "mock-3.0.5.tar.gz")))
+            self.assertEqual(packages["nose"]["files"], [])
+            lock = lockfile.read_lock()
+            self.assertTrue(lockfile.verify_file(lock, path.join(".cache", "dist", "mock-3.0.5.tar.gz")))
+            with open(path.join(".cache", "dist", "mock-3.0.5.tar.gz"), "w") as fd:
+                fd.write("tampered")
+            self.assertFalse(lockfile.verify_file(lock, path.join(".cache", "dist", "mock-3.0.5.tar.gz")))
+            self.assertIsNone(lockfile.verify_file(lock, path.join(".cache", "dist", "six-1.15.0.tar.gz")))